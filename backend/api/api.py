@@ -1,12 +1,15 @@
 from ninja import NinjaAPI
-from typing import List
+from typing import List, Optional
 
 from django.contrib.auth.models import User
+from django.http import HttpResponse
+from ninja.errors import HttpError
 
 from ninja_extra import NinjaExtraAPI
 from ninja_jwt.controller import NinjaJWTDefaultController
 
 from .models import Video, Profile
+from .pagination import paginate_newest_first, InvalidCursor
 from .schemas import VideoIn, VideoOut, UserCreate, UserOut, ProfilePictureUpdate
 
 api = NinjaExtraAPI()
@@ -28,10 +31,16 @@ def create_video(request, data: VideoIn):
     
     return video
 
-# 2. List all Videos (GET)
+# 2. List Videos (GET), newest first, one page at a time
 @api.get("/videos", response=List[VideoOut])
-def list_videos(request):
-    return Video.objects.all()
+def list_videos(request, response: HttpResponse, cursor: Optional[str] = None, limit: Optional[int] = None):
+    try:
+        page, next_cursor = paginate_newest_first(Video.objects.all(), cursor=cursor, limit=limit)
+    except InvalidCursor as e:
+        raise HttpError(400, str(e))
+    if next_cursor:
+        response["X-Next-Cursor"] = next_cursor
+    return page
 
 # 3. Check Status of one Video (GET)
 @api.get("/videos/{video_id}", response=VideoOut)
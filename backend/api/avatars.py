@@ -0,0 +1,146 @@
+import base64
+import datetime
+import io
+
+from django.utils import timezone
+from PIL import Image
+
+from .engine import BUCKET_NAME
+from .images import InvalidImage, MAX_AVATAR_UPLOAD_BYTES
+from .models import Profile
+from .signing import signed_url_cache
+from .storage import get_storage
+
+# --- CONFIGURATION ---
+UPLOAD_URL_EXPIRATION = datetime.timedelta(minutes=10)
+
+# What the app may PUT straight into the bucket, with the magic bytes we check afterwards
+ALLOWED_CONTENT_TYPES = {
+    "image/jpeg": [b"\xff\xd8\xff"],
+    "image/png": [b"\x89PNG\r\n\x1a\n"],
+    "image/webp": [b"RIFF"],
+}
+
+# Enough of the file for PIL to read the header (and so the dimensions) of any of the above
+HEADER_BYTES = 64 * 1024
+
+
+def avatar_path(user_id):
+    return f"users/{user_id}/profile/avatar.jpg"
+
+
+def create_upload_session(user_id, content_type):
+    """Returns a short-lived V4 signed PUT URL for the user's avatar."""
+    if content_type not in ALLOWED_CONTENT_TYPES:
+        raise InvalidImage(f"Unsupported content type: {content_type}")
+
+    upload_url = get_storage(BUCKET_NAME).signed_url(
+        avatar_path(user_id),
+        expiration=UPLOAD_URL_EXPIRATION,
+        method="PUT",
+        content_type=content_type,  # signed, so the client must send exactly this header
+    )
+    return {
+        "upload_url": upload_url,
+        "method": "PUT",
+        "headers": {"Content-Type": content_type},
+        "expires_in": int(UPLOAD_URL_EXPIRATION.total_seconds()),
+        "max_bytes": MAX_AVATAR_UPLOAD_BYTES,
+    }
+
+
+def _sniff_content_type(header):
+    for content_type, signatures in ALLOWED_CONTENT_TYPES.items():
+        if any(header.startswith(sig) for sig in signatures):
+            if content_type == "image/webp" and header[8:12] != b"WEBP":
+                continue
+            return content_type
+    return None
+
+
+def validate_uploaded_avatar(user_id):
+    """
+    Checks the object the app uploaded directly, reading only its first bytes.
+    Returns (blob_info, width, height). Invalid uploads are deleted.
+    """
+    storage = get_storage(BUCKET_NAME)
+    path = avatar_path(user_id)
+
+    info = storage.get_metadata(path)
+    if info is None:
+        raise InvalidImage("No uploaded image found")
+
+    try:
+        if info.size > MAX_AVATAR_UPLOAD_BYTES:
+            raise InvalidImage(f"Image is larger than {MAX_AVATAR_UPLOAD_BYTES // (1024 * 1024)}MB")
+
+        header = storage.read_bytes(path, 0, HEADER_BYTES - 1) or b""
+        sniffed = _sniff_content_type(header)
+        if sniffed is None:
+            raise InvalidImage("Uploaded file is not a supported image")
+        info.content_type = info.content_type or sniffed
+
+        try:
+            # Image.open only parses the header, so a partial file is fine here
+            width, height = Image.open(io.BytesIO(header)).size
+        except Exception:
+            width = height = None
+    except InvalidImage:
+        storage.delete(path)
+        raise
+
+    return info, width, height
+
+
+def content_hash(info):
+    """Hex MD5 of the object, from the metadata storage already returns."""
+    return base64.b64decode(info.md5_hash).hex() if info.md5_hash else None
+
+
+def record_avatar(user, info, width=None, height=None):
+    """Stores avatar metadata on the user's Profile, so status checks never touch the bucket."""
+    profile, _ = Profile.objects.get_or_create(user=user)
+    profile.avatar_path = info.name
+    profile.avatar_generation = info.generation
+    profile.avatar_size = info.size
+    profile.avatar_content_type = info.content_type
+    profile.avatar_content_hash = content_hash(info)
+    profile.avatar_width = width
+    profile.avatar_height = height
+    profile.avatar_updated_at = timezone.now()
+    profile.save()
+    signed_url_cache.invalidate(BUCKET_NAME, info.name)
+    return profile
+
+
+def backfill_avatar(user, storage=None):
+    """
+    Records metadata for an avatar uploaded before Profile tracked it. Returns
+    the Profile, or None when the bucket has no avatar either; both outcomes
+    are stamped on the Profile, so each user's bucket is only checked once.
+    """
+    storage = storage or get_storage(BUCKET_NAME)
+    path = avatar_path(user.id)
+    info = storage.get_metadata(path)
+    if info is None:
+        Profile.objects.get_or_create(user=user)
+        Profile.objects.filter(user=user).update(avatar_updated_at=timezone.now())
+        return None
+
+    width = height = None
+    header = storage.read_bytes(path, 0, HEADER_BYTES - 1)
+    try:
+        width, height = Image.open(io.BytesIO(header)).size
+    except Exception:
+        pass
+    return record_avatar(user, info, width, height)
+
+
+def clear_avatar(user):
+    """Forgets the avatar (e.g. after a rejected direct upload overwrote it)."""
+    Profile.objects.filter(user=user).update(
+        avatar_path=None, avatar_generation=None, avatar_size=None,
+        avatar_content_type=None, avatar_content_hash=None,
+        avatar_width=None, avatar_height=None, avatar_updated_at=timezone.now(),
+    )
+    signed_url_cache.invalidate(BUCKET_NAME, avatar_path(user.id))
@@ -0,0 +1,45 @@
+# Pipeline stages in the order generate_manifestation reaches them
+STAGES = ["QUEUED", "ASSETS_FETCHED", "SUBMITTED", "CLIP_RETRIEVED", "STITCHED", "UPLOADED"]
+
+# Fields a checkpoint may carry from one attempt to the next
+CHECKPOINT_FIELDS = [
+    "operation_name",
+    "generation_prefix",
+    "ai_clip_gcs_path",
+    "final_video_gcs_path",
+    "hls_playlist_gcs_path",
+]
+
+
+class Checkpoint:
+    """
+    In-memory record of how far a manifestation got.
+    The engine only talks to this interface; VideoCheckpoint (api/jobs.py)
+    persists the same thing on the Video row so retries can resume.
+    """
+
+    def __init__(self, stage="QUEUED", **fields):
+        self.stage = stage or "QUEUED"
+        for name in CHECKPOINT_FIELDS:
+            setattr(self, name, fields.get(name))
+
+    def reached(self, stage):
+        return STAGES.index(self.stage) >= STAGES.index(stage)
+
+    def save(self, stage, **fields):
+        """Records that `stage` finished, along with any data needed to resume after it."""
+        for name, value in fields.items():
+            if name not in CHECKPOINT_FIELDS:
+                raise ValueError(f"Unknown checkpoint field: {name}")
+            setattr(self, name, value)
+        if not self.reached(stage):
+            self.stage = stage
+        self.persist(fields)
+        print(f"📍 Checkpoint: {self.stage}")
+
+    def persist(self, fields):
+        pass
+
+    def heartbeat(self):
+        """Called periodically during long waits so other workers see the job is alive."""
+        pass
@@ -0,0 +1,54 @@
+import os
+
+from .workspace import CPU_BUDGET, active_cpu_jobs
+
+# --- CONFIGURATION ---
+DEFAULT_PROFILE = os.environ.get("MANIFEST_ENCODING_PROFILE", "standard")
+
+
+class EncodingProfile:
+    """x264 settings for the per-job encodes (AI segment, moviepy stitch, HLS ladder)."""
+
+    def __init__(self, name, preset, crf, tune=None, description=""):
+        self.name = name
+        self.preset = preset
+        self.crf = crf
+        self.tune = tune
+        self.description = description
+
+    def x264_args(self, threads=None):
+        args = ["-preset", self.preset, "-crf", str(self.crf)]
+        if self.tune:
+            args += ["-tune", self.tune]
+        return args + ["-threads", str(threads or encoder_threads())]
+
+    def moviepy_kwargs(self, threads=None):
+        params = ["-crf", str(self.crf)] + (["-tune", self.tune] if self.tune else [])
+        return {"preset": self.preset, "threads": threads or encoder_threads(), "ffmpeg_params": params}
+
+
+PROFILES = {
+    profile.name: profile
+    for profile in [
+        EncodingProfile("fast-preview", "ultrafast", 28, tune="fastdecode",
+                        description="Quickest render, biggest files; for drafts and load tests."),
+        # Matches what the ffmpeg stitch used before profiles existed
+        EncodingProfile("standard", "veryfast", 20,
+                        description="The default balance of render time and size."),
+        EncodingProfile("archival", "slow", 17,
+                        description="Smallest files at high quality; several times slower."),
+    ]
+}
+
+
+def get_profile(name=None):
+    """The named profile; unknown or missing names get the deployment default."""
+    return PROFILES.get(name) or PROFILES.get(DEFAULT_PROFILE) or PROFILES["standard"]
+
+
+def encoder_threads():
+    """
+    Splits the worker's CPU budget between the encodes running right now,
+    so concurrent jobs share cores instead of each starting one thread per core.
+    """
+    return max(1, CPU_BUDGET // max(1, active_cpu_jobs()))
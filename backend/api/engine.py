@@ -1,10 +1,21 @@
 import os
 import time
+import concurrent.futures
 import uuid  # <--- NEW: For unique folder names
 from google import genai
 from google.genai import types
-from google.cloud import storage
-from moviepy.editor import VideoFileClip, concatenate_videoclips
+from .storage import get_storage
+from .signing import get_signed_url, signed_url_cache
+from . import stitch
+from .workspace import JobWorkspace, job_slot, cpu_slot
+from .operations import OperationTracker
+from .checkpoints import Checkpoint
+from .template_cache import template_cache
+from .references import reference_cache
+from .generation_cache import generation_cache, generation_fingerprint
+from .template_registry import registry as template_registry, load_metadata
+from .encoding import get_profile
+from . import metrics
 
 # --- 1. FORCE AUTHENTICATION ---
 os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "/app/google_credentials.json"
@@ -13,6 +24,15 @@ os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = "/app/google_credentials.json"
 PROJECT_ID = "manifest-me-app"
 LOCATION = "us-central1"
 BUCKET_NAME = "manifest-me-videos-nick"
+VEO_MODEL = "veo-3.1-generate-preview"
+# Everything besides the prompt/image that changes what Veo returns (also part of the generation cache key)
+VEO_CONFIG = {
+    "aspect_ratio": "16:9",
+    "person_generation": "allow_adult",
+    "reference_type": "asset",
+}
+# Threads shared by every job for fetching template clips in the background
+ASSET_FETCH_CONCURRENCY = int(os.environ.get("MANIFEST_ASSET_FETCH_CONCURRENCY", "8"))
 
 # --- 3. INITIALIZE CLIENTS ---
 client = genai.Client(
@@ -20,64 +40,138 @@ client = genai.Client(
     project=PROJECT_ID,
     location=LOCATION
 )
-def get_storage_client():
-    """Returns a storage client, initializing only when called."""
-    return storage.Client()
+# One background event loop polls every in-flight Vertex operation
+operation_tracker = OperationTracker(lambda: client)
+asset_pool = concurrent.futures.ThreadPoolExecutor(max_workers=ASSET_FETCH_CONCURRENCY,
+                                                   thread_name_prefix="asset-fetch")
 
-# --- MONKEYPATCH ---
-import PIL.Image
-if not hasattr(PIL.Image, 'ANTIALIAS'):
-    PIL.Image.ANTIALIAS = PIL.Image.LANCZOS
+
+def _collect_metrics():
+    """Scrape-time numbers the caches and the operation tracker already keep."""
+    caches = {
+        "template": template_cache.stats(),
+        "reference": reference_cache.stats(),
+        "generation": generation_cache.stats(),
+        "signed_url": signed_url_cache.stats(),
+    }
+    return [
+        ("manifest_cache_hits_total", "counter", "Cache hits, per cache.",
+         [({"cache": name}, stats["hits"]) for name, stats in caches.items()]),
+        ("manifest_cache_misses_total", "counter", "Cache misses, per cache.",
+         [({"cache": name}, stats["misses"]) for name, stats in caches.items()]),
+        ("manifest_vertex_polls_total", "counter", "Vertex operation status polls.",
+         [({}, operation_tracker.polls)]),
+        ("manifest_vertex_poll_errors_total", "counter", "Vertex status polls that failed transiently and were retried.",
+         [({}, operation_tracker.poll_errors)]),
+        ("manifest_vertex_operations_in_flight", "gauge", "Vertex operations being waited on.",
+         [({}, operation_tracker.in_flight)]),
+    ]
+
+
+metrics.registry.register_collector(_collect_metrics)
 
 def download_blob(bucket_name, source_blob_name, destination_file_name):
-    storage_client = get_storage_client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(source_blob_name)
-    if not blob.exists():
-        print(f"⚠️ Warning: {source_blob_name} not found.")
-        return False
-    blob.download_to_filename(destination_file_name)
-    return True
+    """Downloads an object. Returns False if it doesn't exist."""
+    return get_storage(bucket_name).download(source_blob_name, destination_file_name)
+
+def fetch_template_asset(bucket_name, source_blob_name, destination_file_name, mezzanine=False):
+    """Like download_blob, but served from the local template cache when possible."""
+    storage = get_storage(bucket_name)
+    if mezzanine:
+        return template_cache.fetch(
+            storage, source_blob_name, destination_file_name,
+            suffix=stitch.MEZZANINE_SUFFIX, build=stitch.normalize_to_mezzanine,
+        )
+    return template_cache.fetch(storage, source_blob_name, destination_file_name)
+
+def fetch_template_clip(blob_name, destination_file_name, mezzanine):
+    """
+    Fetches one template clip, in mezzanine form if asked and possible.
+    Returns whether it got the mezzanine; raises FileNotFoundError if the clip is missing.
+    """
+    if mezzanine:
+        try:
+            found = fetch_template_asset(BUCKET_NAME, blob_name, destination_file_name, mezzanine=True)
+        except stitch.StitchError as e:
+            print(f"⚠️ Mezzanine unavailable for {blob_name} ({e}), using moviepy stitch")
+            mezzanine = False
+    if not mezzanine:
+        found = fetch_template_asset(BUCKET_NAME, blob_name, destination_file_name)
+    if not found:
+        raise FileNotFoundError(f"Template clip {blob_name} not found")
+    return mezzanine
+
+HLS_CONTENT_TYPES = {
+    ".m3u8": "application/vnd.apple.mpegurl",
+    ".m4s": "video/iso.segment",
+    ".mp4": "video/mp4",
+}
+
+def publish_hls(workspace, source_path, output_key, profile=None):
+    """
+    Packages the final video as an HLS ladder and uploads it next to the MP4.
+    Returns the master playlist's key, or None if packaging failed (the MP4 still works).
+    """
+    hls_dir = workspace.path("hls")
+    prefix = output_key[:-len(".mp4")] + "_hls/"
+    storage = get_storage(BUCKET_NAME)
+
+    def upload(name):
+        content_type = HLS_CONTENT_TYPES.get(os.path.splitext(name)[1])
+        storage.upload_file(os.path.join(hls_dir, name), prefix + name, content_type=content_type)
+
+    try:
+        print("📺 Packaging HLS ladder...")
+        with cpu_slot():
+            files = stitch.package_hls(source_path, hls_dir, profile=profile)
+        workspace.check_budget()
+        # Playlists go up last, so none ever points at a segment that isn't there yet
+        media = [name for name in files if not name.endswith(".m3u8")]
+        playlists = [name for name in files if name.endswith(".m3u8")]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(upload, media))
+            list(pool.map(upload, playlists))
+    except Exception as e:
+        print(f"⚠️ HLS packaging failed ({e}); serving the MP4 only")
+        return None
+    return prefix + stitch.HLS_MASTER_PLAYLIST
 
 def upload_blob(bucket_name, source_file_name, destination_blob_name):
-    """Uploads a file to the bucket."""
-    storage_client = get_storage_client()
-    bucket = storage_client.bucket(bucket_name)
-    blob = bucket.blob(destination_blob_name)
-    blob.upload_from_filename(source_file_name)
-    return blob.generate_signed_url(version="v4", expiration=604800, method="GET")
-
-def generate_veo_video(local_avatar_path, prompt, output_local_path):
+    """Uploads a file to the bucket. Returns its BlobInfo (clients get short-lived URLs from signing.py)."""
+    return get_storage(bucket_name).upload_file(source_file_name, destination_blob_name, content_type="video/mp4")
+
+def submit_veo_generation(reference, prompt, generation_prefix=None):
+    """Submits a Veo job with a PreparedReference. Returns (operation_name, generation_prefix)."""
     print(f"🧠 Calling Vertex AI with prompt: '{prompt}'...")
     
     # 1. Load Avatar
-    if not os.path.exists(local_avatar_path):
-        raise FileNotFoundError(f"Avatar not found at {local_avatar_path}")
-    with open(local_avatar_path, "rb") as f:
-        image_bytes = f.read()
+    if reference is None:
+        raise FileNotFoundError("Avatar not found")
 
-    # 2. Configure Asset
+    # 2. Configure Asset (prepared once per photo, so the payload is already right-sized)
     person_image = types.VideoGenerationReferenceImage(
-        image=types.Image(image_bytes=image_bytes, mime_type="image/jpeg"),
-        reference_type="asset" 
+        image=types.Image(image_bytes=reference.image_bytes, mime_type=reference.mime_type),
+        reference_type=VEO_CONFIG["reference_type"]
     )
 
     # 3. SETUP MAILBOX (Unique Output Folder)
-    # We create a unique folder for this specific run
-    run_id = str(uuid.uuid4())
-    output_gcs_folder = f"gs://{BUCKET_NAME}/generated/{run_id}/"
+    # We create a unique folder for this specific run, unless the caller picked one
+    if generation_prefix is None:
+        run_id = str(uuid.uuid4())
+        generation_prefix = f"generated/{run_id}/"
+    output_gcs_folder = f"gs://{BUCKET_NAME}/{generation_prefix}"
     print(f"📂 Target Mailbox: {output_gcs_folder}")
 
     # 4. SUBMIT JOB
     print("🚀 Submitting Job...")
     try:
         operation = client.models.generate_videos(
-            model="veo-3.1-generate-preview",
+            model=VEO_MODEL,
             prompt=prompt,
             config=types.GenerateVideosConfig(
                 reference_images=[person_image],
-                aspect_ratio="16:9",
-                person_generation="allow_adult",
+                aspect_ratio=VEO_CONFIG["aspect_ratio"],
+                person_generation=VEO_CONFIG["person_generation"],
                 output_gcs_uri=output_gcs_folder  # <--- FORCE OUTPUT HERE
             )
         )
@@ -86,17 +180,25 @@ def generate_veo_video(local_avatar_path, prompt, output_local_path):
         print(f"❌ Submission Failed: {e}")
         raise e
 
-    # 5. POLL
-    while not operation.done:
-        print("   ...generating (approx 60s)...")
-        time.sleep(10)
-        operation = client.operations.get(operation=operation)
+    return operation.name, generation_prefix
+
+def wait_for_veo_operation(operation_name, heartbeat=None, heartbeat_seconds=60):
+    """Waits for a (possibly earlier-submitted) Veo operation, re-attaching by name."""
+    # hands the wait to the tracker; this thread holds no CPU slot meanwhile
+    print(f"   ...generating (approx 60s, {operation_tracker.in_flight + 1} in flight)...")
+    future = operation_tracker.track(types.GenerateVideosOperation(name=operation_name))
+    while True:
+        try:
+            return future.result(timeout=heartbeat_seconds)
+        except concurrent.futures.TimeoutError:
+            if heartbeat:
+                heartbeat()
 
-    # 6. RETRIEVE FROM MAILBOX
+def find_generated_clip(generation_prefix):
+    """Returns the blob name of the clip Veo wrote into our mailbox folder."""
     # We ignore the API response and look directly in the folder we created.
-    print(f"📦 Checking mailbox: generated/{run_id}/")
-    storage_client = get_storage_client()
-    blobs = list(storage_client.list_blobs(BUCKET_NAME, prefix=f"generated/{run_id}/"))
+    print(f"📦 Checking mailbox: {generation_prefix}")
+    blobs = get_storage(BUCKET_NAME).list(generation_prefix)
     
     if not blobs:
         raise Exception("Video generated but NOT found in bucket. Model output failed.")
@@ -104,76 +206,230 @@ def generate_veo_video(local_avatar_path, prompt, output_local_path):
     # Grab the first file in that folder (there should only be one)
     video_blob = blobs[0]
     print(f"✅ Found Video: {video_blob.name}")
-    
-    video_blob.download_to_filename(output_local_path)
+    return video_blob.name
+
+def get_reference_image(user_id):
+    """The user's avatar, prepared for Veo (cached by content hash). None if missing."""
+    return reference_cache.get(get_storage(BUCKET_NAME), f"users/{user_id}/profile/avatar.jpg")
+
+def generate_veo_video(user_id, prompt, output_local_path):
+    """Submit, wait and download in one call (no checkpointing)."""
+    with metrics.span("avatar"):
+        reference = get_reference_image(user_id)
+    with metrics.span("vertex_submit"):
+        operation_name, generation_prefix = submit_veo_generation(reference, prompt)
+    with metrics.span("vertex_wait"):
+        wait_for_veo_operation(operation_name)
+    with metrics.span("find_clip"):
+        clip_blob_name = find_generated_clip(generation_prefix)
+    with metrics.span("clip_download"):
+        download_blob(BUCKET_NAME, clip_blob_name, output_local_path)
     print(f"💾 Saved to {output_local_path}")
 
-def generate_manifestation(user_prompt, template_name="beach_manifestation", user_id="guest"):
-    
-    base_dir = "/tmp"
-    intro_path = f"{base_dir}/intro.mp4"
-    outro_path = f"{base_dir}/outro.mp4"
-    avatar_path = f"{base_dir}/avatar.jpg"
-    ai_clip_path = f"{base_dir}/generated.mp4"
-    final_output_path = f"{base_dir}/final.mp4"
+def generate_manifestation(user_prompt, template_name="beach_manifestation", user_id="guest", job_id=None,
+                           checkpoint=None, use_generation_cache=True, encoding_profile=None):
+    job_id = job_id or uuid.uuid4().hex[:8]
+    # Without a persisted checkpoint the job simply starts from scratch
+    checkpoint = checkpoint or Checkpoint()
+    if checkpoint.reached("UPLOADED"):
+        return checkpoint.final_video_gcs_path
+
+    # Wait for a free slot, then give this job its own scratch folder
+    with metrics.job_context(job_id), job_slot(), JobWorkspace(job_id) as workspace:
+        return _run_manifestation(workspace, checkpoint, user_prompt, template_name, user_id,
+                                  use_generation_cache, encoding_profile)
+
+def _run_manifestation(workspace, checkpoint, user_prompt, template_name, user_id, use_generation_cache,
+                       encoding_profile=None):
+    intro_path = workspace.path("intro.mp4")
+    outro_path = workspace.path("outro.mp4")
+    ai_clip_path = workspace.path("generated.mp4")
+    final_output_path = workspace.path("final.mp4")
+    template = template_registry.get(template_name)
+    fallback_clip = template.fallback_clip
+    # Request's choice, else the template's, else the deployment default
+    profile = get_profile(encoding_profile or template.encoding_profile)
     
-    print(f"🎬 Starting Manifestation for User {user_id}...")
+    print(f"🎬 Starting Manifestation for User {user_id} (job {workspace.job_id}, after {checkpoint.stage})...")
 
     # 1. DOWNLOAD ASSETS
+    # Only the avatar is needed before Vertex; the intro and outro aren't needed
+    # until the stitch, so both download in the background while Veo generates.
+    # Local files don't survive a crash, so this always runs; it's cheap with the template cache.
+    # The fast stitch needs the templates in mezzanine form; if that can't be
+    # built we fall back to the raw clips and the moviepy stitch.
+    use_ffmpeg = stitch.STITCH_MODE == "ffmpeg"
+    template_fetches = [
+        workspace.run_in_background(asset_pool, fetch_template_clip, blob_name, path, use_ffmpeg)
+        for blob_name, path in ((template.intro, intro_path), (template.outro, outro_path))
+    ]
     try:
-        download_blob(BUCKET_NAME, f"{template_name}/intro.mp4", intro_path)
-        download_blob(BUCKET_NAME, f"{template_name}/outro.mp4", outro_path)
-        download_blob(BUCKET_NAME, f"users/{user_id}/profile/avatar.jpg", avatar_path)
+        # The avatar is only needed if we still have to submit to Vertex
+        reference = None
+        if not checkpoint.reached("SUBMITTED"):
+            with metrics.span("avatar"):
+                reference = get_reference_image(user_id)
     except Exception as e:
         print(f"❌ Asset Download Error: {e}")
         raise e
+    if not checkpoint.reached("ASSETS_FETCHED"):
+        checkpoint.save("ASSETS_FETCHED")
 
-    # 2. PROMPT
-    base_prompt = ""
-    if template_name == "beach_manifestation":
-        base_prompt = "Cinematic video of the character from the reference image relaxing on a luxury tropical beach. Smiling, linen clothes. Golden hour lighting, 4k."
-    elif template_name == "work_abroad_manifestation":
-        # Added: "Wearing a stylish blazer and business attire" to force the look
-        base_prompt = "Cinematic video of the character from the reference image walking through an old European city. Wearing business attire. Cobblestone streets. Vintage style, warm lighting, 4k."
-    else: 
-        # Added: "Wearing technical hiking gear" to force the look
-        base_prompt = "Cinematic video of the character from the reference image hiking in a green forest. Wearing technical hiking gear and a backpack. Nature atmosphere, 4k."
-        
-    final_prompt = f"{base_prompt} Action: {user_prompt}"
+    # 2. PROMPT (each template's base prompt lives in templates.json)
+    final_prompt = f"{template.base_prompt} Action: {user_prompt}"
 
     # 3. GENERATE
+    # A retry re-attaches to the operation it already paid for; it never submits twice.
+    # Same photo + template + prompt + model settings as an earlier job? Reuse its clip.
+    cache_prefix = None
+    if not checkpoint.reached("SUBMITTED") and reference is not None and use_generation_cache:
+        fingerprint = generation_fingerprint(reference.content_hash, template.name, final_prompt, VEO_MODEL, VEO_CONFIG)
+        with metrics.span("generation_cache"):
+            cached_clip = generation_cache.lookup(get_storage(BUCKET_NAME), fingerprint)
+        if cached_clip:
+            print(f"♻️ Generation cache hit: {cached_clip}")
+            checkpoint.save("CLIP_RETRIEVED", ai_clip_gcs_path=cached_clip)
+        else:
+            # Write this generation where the next identical request will find it
+            cache_prefix = generation_cache.folder(fingerprint)
+
+    if not checkpoint.reached("CLIP_RETRIEVED"):
+        clip_blob_name = None
+        if not checkpoint.reached("SUBMITTED"):
+            try:
+                with metrics.span("vertex_submit"):
+                    operation_name, generation_prefix = submit_veo_generation(reference, final_prompt, cache_prefix)
+            except Exception as e:
+                print(f"❌ AI Generation Failed: {e}")
+                print("⚠️ Falling back to intro clip...")
+                metrics.FALLBACKS.inc(kind="ai_clip")
+                clip_blob_name = fallback_clip
+            else:
+                checkpoint.save("SUBMITTED", operation_name=operation_name, generation_prefix=generation_prefix)
+        else:
+            print(f"🔁 Re-attaching to Vertex operation {checkpoint.operation_name}")
+
+        if clip_blob_name is None:
+            # The generation is paid for now: a failed wait or a missing clip fails
+            # the job, and the retry re-attaches to the same operation
+            with metrics.span("vertex_wait"):
+                operation = wait_for_veo_operation(checkpoint.operation_name, heartbeat=checkpoint.heartbeat)
+            if getattr(operation, "error", None):
+                # Vertex finished and produced nothing; waiting again won't change that
+                print(f"❌ AI Generation Failed: {operation.error}")
+                print("⚠️ Falling back to intro clip...")
+                metrics.FALLBACKS.inc(kind="ai_clip")
+                clip_blob_name = fallback_clip
+            else:
+                with metrics.span("find_clip"):
+                    clip_blob_name = find_generated_clip(checkpoint.generation_prefix)
+        checkpoint.save("CLIP_RETRIEVED", ai_clip_gcs_path=clip_blob_name)
+
+    # Templates should have arrived long ago; a missing one fails the job here,
+    # after the clip is safely checkpointed, so a retry doesn't pay Vertex again
     try:
-        generate_veo_video(avatar_path, final_prompt, ai_clip_path)
+        # Only the part the Veo wait didn't hide shows up here
+        with metrics.span("template_fetch"):
+            mezzanine = [fetch.result() for fetch in template_fetches]
+        if use_ffmpeg and not all(mezzanine):
+            # Both clips have to be in the same form for the stitch
+            use_ffmpeg = False
+            metrics.FALLBACKS.inc(kind="moviepy_stitch")
+            fetch_template_clip(template.intro, intro_path, mezzanine=False)
+            fetch_template_clip(template.outro, outro_path, mezzanine=False)
     except Exception as e:
-        print(f"❌ AI Generation Failed: {e}")
-        print("⚠️ Falling back to intro clip...")
-        download_blob(BUCKET_NAME, f"{template_name}/intro.mp4", ai_clip_path)
+        print(f"❌ Asset Download Error: {e}")
+        raise e
+    print(f"📊 Template cache: {template_cache.stats()}, reference cache: {reference_cache.stats()}")
+    workspace.check_budget()
+
+    def stage_ai_clip():
+        with metrics.span("clip_download"):
+            if checkpoint.ai_clip_gcs_path == fallback_clip:
+                fetch_template_asset(BUCKET_NAME, fallback_clip, ai_clip_path)
+            else:
+                download_blob(BUCKET_NAME, checkpoint.ai_clip_gcs_path, ai_clip_path)
+        workspace.check_budget()
+        return ai_clip_path
+
+    # The fallback clip is a template clip, probed when templates were prewarmed;
+    # reuse that instead of running ffprobe on it again
+    ai_clip_audio = None
+    if checkpoint.ai_clip_gcs_path == fallback_clip:
+        try:
+            load_metadata(get_storage(BUCKET_NAME), template)
+            probe = template.probe_for(fallback_clip)
+            if probe:
+                ai_clip_audio = bool(probe.get("audio_codec"))
+        except Exception as e:
+            print(f"⚠️ No template metadata ({e}); probing the clip instead")
+
+    # With streaming I/O the generated clip is decoded straight from storage
+    # (the fallback clip is already local in the template cache)
+    streaming = use_ffmpeg and stitch.STREAMING_IO
+    if streaming and checkpoint.ai_clip_gcs_path != fallback_clip:
+        ai_clip_source = get_signed_url(BUCKET_NAME, checkpoint.ai_clip_gcs_path)
+    else:
+        ai_clip_source = stage_ai_clip()
+
+    # Keep the key from an earlier attempt so a retry overwrites instead of duplicating
+    output_key = checkpoint.final_video_gcs_path
+    if not output_key:
+        timestamp = int(time.time())
+        # The job id keeps two renders from the same second apart
+        output_key = f"users/{user_id}/videos/manifest_{timestamp}_{workspace.job_id[:8]}.mp4"
 
-    # 4. STITCH
-    print("✂️ Stitching...")
+    # 4. STITCH (CPU-bound, so only MAX_CPU_JOBS of these run at once)
+    # The stitched file is local, so a crash after this point re-stitches from the stored clip.
+    # Streaming I/O stitches straight into the upload instead; that object is only
+    # committed once the encoder finishes, so a crash leaves nothing half-written.
+    print(f"✂️ Stitching ({profile.name} profile)...")
+    streamed = False
     try:
-        clip_intro = VideoFileClip(intro_path)
-        clip_outro = VideoFileClip(outro_path)
-        clip_ai = VideoFileClip(ai_clip_path)
-        
-        if clip_ai.duration < 6:
-             clip_ai = clip_ai.loop(duration=6)
-        else:
-             clip_ai = clip_ai.subclip(0, 6)
-            
-        clip_ai = clip_ai.resize(newsize=clip_intro.size)
-        
-        final = concatenate_videoclips([clip_intro, clip_ai, clip_outro], method="compose")
-        final.write_videofile(final_output_path, codec="libx264", audio_codec="aac", fps=24, verbose=False, logger=None)
+        with metrics.span("stitch"), cpu_slot():
+            if streaming:
+                try:
+                    with get_storage(BUCKET_NAME).open_writer(output_key, content_type="video/mp4") as writer:
+                        stitch.stitch_ffmpeg_to_stream(intro_path, ai_clip_source, outro_path, writer,
+                                                       workspace.dir, profile=profile.name,
+                                                       ai_clip_audio=ai_clip_audio)
+                    streamed = True
+                except Exception as e:
+                    print(f"⚠️ Streaming stitch failed ({e}), stitching on local disk...")
+                    metrics.FALLBACKS.inc(kind="disk_stitch")
+                    if ai_clip_source != ai_clip_path:
+                        stage_ai_clip()
+            if streamed:
+                pass  # already in storage
+            elif use_ffmpeg:
+                try:
+                    stitch.stitch_ffmpeg(intro_path, ai_clip_path, outro_path, final_output_path, workspace.dir,
+                                         profile=profile.name, ai_clip_audio=ai_clip_audio)
+                except Exception as e:
+                    print(f"⚠️ Fast stitch failed ({e}), falling back to moviepy...")
+                    metrics.FALLBACKS.inc(kind="moviepy_stitch")
+                    stitch.stitch_moviepy(intro_path, ai_clip_path, outro_path, final_output_path, profile=profile.name)
+            else:
+                stitch.stitch_moviepy(intro_path, ai_clip_path, outro_path, final_output_path, profile=profile.name)
+        workspace.check_budget()
         
     except Exception as e:
         print(f"❌ Stitching Error: {e}")
         raise e
 
-    # 5. UPLOAD
-    timestamp = int(time.time())
-    output_key = f"users/{user_id}/videos/manifest_{timestamp}.mp4"
+    checkpoint.save("STITCHED", final_video_gcs_path=output_key)
+
+    # 5. UPLOAD (already done if the stitch streamed into storage)
+    if not streamed:
+        with metrics.span("upload"):
+            upload_blob(BUCKET_NAME, final_output_path, output_key)
 
-    upload_blob(BUCKET_NAME, final_output_path, output_key)
+    # 6. ADAPTIVE STREAMING (optional; clients without it keep using the MP4)
+    hls_playlist = checkpoint.hls_playlist_gcs_path
+    if stitch.HLS_OUTPUT and not hls_playlist:
+        hls_source = get_signed_url(BUCKET_NAME, output_key) if streamed else final_output_path
+        with metrics.span("hls"):
+            hls_playlist = publish_hls(workspace, hls_source, output_key, profile=profile.name)
+    checkpoint.save("UPLOADED", hls_playlist_gcs_path=hls_playlist)
 
-    return output_key
\ No newline at end of file
+    return output_key
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import threading
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+
+# Statuses after which a video's stream has nothing more to say
+TERMINAL_STATUSES = ("COMPLETED", "FAILED")
+
+
+def video_channel(video_id):
+    return f"video:{video_id}"
+
+
+class LocalBroker:
+    """
+    In-process pub/sub. Enough when the worker runs in the same process as the
+    API (the eager queue backend, local runs, load tests).
+    """
+
+    def __init__(self):
+        self._subscribers = {}  # channel -> set of (loop, asyncio.Queue)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for loop, queue in subscribers:
+            # Publishers are worker threads; hand the message to the subscriber's loop
+            loop.call_soon_threadsafe(queue.put_nowait, message)
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        entry = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(entry)
+                    if not subscribers:
+                        del self._subscribers[channel]
+
+
+class RedisBroker:
+    """Redis pub/sub, for when workers and the API run as separate services."""
+
+    def __init__(self, url):
+        import redis
+        self.url = url
+        self.client = redis.Redis.from_url(url)
+
+    def publish(self, channel, message):
+        self.client.publish(channel, json.dumps(message))
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        import redis.asyncio
+
+        client = redis.asyncio.Redis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(channel)
+        queue = asyncio.Queue()
+
+        async def reader():
+            async for item in pubsub.listen():
+                if item["type"] == "message":
+                    await queue.put(json.loads(item["data"]))
+
+        task = asyncio.create_task(reader())
+        try:
+            yield queue
+        finally:
+            task.cancel()
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Redis when EVENTS_REDIS_URL is set, otherwise the in-process broker."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            url = getattr(settings, "EVENTS_REDIS_URL", None)
+            _broker = RedisBroker(url) if url else LocalBroker()
+        return _broker
+
+
+def set_broker(broker):
+    global _broker
+    with _broker_lock:
+        _broker = broker
+
+
+def video_event(video):
+    return {
+        "video_id": str(video.id),
+        "status": video.status,
+        "stage": video.stage,
+        "updated_at": video.updated_at.isoformat() if video.updated_at else None,
+    }
+
+
+def publish_video_event(video):
+    """Tells anyone watching this video about its new status/stage. Never raises."""
+    try:
+        get_broker().publish(video_channel(video.id), video_event(video))
+    except Exception as e:
+        print(f"⚠️ Could not publish event for {video.id}: {e}")
@@ -0,0 +1,122 @@
+"""
+Local stand-ins for the cloud services the engine talks to, so the pipeline
+can be exercised (and benchmarked) without spending Vertex quota.
+"""
+import asyncio
+import itertools
+import threading
+import time
+
+
+class FakeOperation:
+    def __init__(self, name, done=False, response=None):
+        self.name = name
+        self.done = done
+        self.response = response
+        self.error = None
+
+
+class _FakeJob:
+    def __init__(self, name, ready_at, output_gcs_uri):
+        self.name = name
+        self.ready_at = ready_at
+        self.output_gcs_uri = output_gcs_uri
+        self.delivered = False
+
+
+class FakeGenaiClient:
+    """
+    Quacks like genai.Client for generate_videos + operations.get.
+    Each generation finishes `delay` seconds after submission; on_complete
+    (if given) is called once with the output_gcs_uri so the caller can drop
+    a canned clip into its fake bucket.
+    """
+
+    def __init__(self, delay=60.0, on_complete=None):
+        self.delay = delay
+        self.on_complete = on_complete
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.polls = 0
+
+        self.models = _FakeModels(self)
+        self.operations = _FakeOperations(self)
+        self.aio = _FakeAio(self)
+
+    def _submit(self, config):
+        with self._lock:
+            name = f"projects/fake/locations/local/operations/{next(self._ids)}"
+            self._jobs[name] = _FakeJob(name, time.monotonic() + self.delay, getattr(config, "output_gcs_uri", None))
+            self.submitted += 1
+        return FakeOperation(name)
+
+    def _get(self, operation):
+        with self._lock:
+            self.polls += 1
+            job = self._jobs.get(operation.name)
+        if job is None:
+            raise ValueError(f"Unknown operation {operation.name}")
+        if time.monotonic() < job.ready_at:
+            return FakeOperation(job.name)
+
+        with self._lock:
+            deliver = not job.delivered
+            job.delivered = True
+        if deliver and self.on_complete:
+            self.on_complete(job.output_gcs_uri)
+        return FakeOperation(job.name, done=True)
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_videos(self, model, prompt, config=None, **kwargs):
+        return self._client._submit(config)
+
+
+class _FakeOperations:
+    def __init__(self, client):
+        self._client = client
+
+    def get(self, operation):
+        return self._client._get(operation)
+
+
+class _FakeAioOperations:
+    def __init__(self, client):
+        self._client = client
+
+    async def get(self, operation):
+        return await asyncio.to_thread(self._client._get, operation)
+
+
+class _FakeAio:
+    def __init__(self, client):
+        self.operations = _FakeAioOperations(client)
+
+
+class FakeCloudTasksClient:
+    """Quacks like tasks_v2.CloudTasksClient: keeps created tasks and refuses a reused name."""
+
+    def __init__(self):
+        self.tasks = {}
+        self._lock = threading.Lock()
+
+    def queue_path(self, project, location, queue):
+        return f"projects/{project}/locations/{location}/queues/{queue}"
+
+    def task_path(self, project, location, queue, task):
+        return f"{self.queue_path(project, location, queue)}/tasks/{task}"
+
+    def create_task(self, request):
+        from google.api_core.exceptions import AlreadyExists
+
+        task = request["task"]
+        with self._lock:
+            if task["name"] in self.tasks:
+                raise AlreadyExists(f"Task {task['name']} already exists")
+            self.tasks[task["name"]] = task
+        return task
@@ -0,0 +1,55 @@
+import hashlib
+import json
+import re
+import threading
+
+# Veo writes cacheable generations straight into a folder named after their fingerprint,
+# so the bucket itself is the index: no extra copies, and it works across workers.
+CACHE_PREFIX = "generated/cache"
+
+
+def normalize_prompt(prompt):
+    """Case and whitespace differences shouldn't cost a new generation."""
+    return re.sub(r"\s+", " ", prompt or "").strip().lower()
+
+
+def generation_fingerprint(avatar_hash, template_name, final_prompt, model, config):
+    """Identifies a generation by everything that affects its output."""
+    payload = json.dumps({
+        "avatar": avatar_hash,
+        "template": template_name,
+        "prompt": normalize_prompt(final_prompt),
+        "model": model,
+        "config": config,
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class GenerationCache:
+
+    def __init__(self, prefix=CACHE_PREFIX):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def folder(self, fingerprint):
+        """Where a generation with this fingerprint should be written."""
+        return f"{self.prefix}/{fingerprint}/"
+
+    def lookup(self, storage, fingerprint):
+        """Returns the blob name of an earlier clip with this fingerprint, or None."""
+        blobs = [info for info in storage.list(self.folder(fingerprint)) if info.name.endswith(".mp4")]
+        with self._lock:
+            if blobs:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return blobs[0].name if blobs else None
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+generation_cache = GenerationCache()
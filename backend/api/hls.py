@@ -0,0 +1,76 @@
+import posixpath
+import re
+
+from django.core import signing
+from django.core.cache import cache
+from django.urls import reverse
+
+from .engine import BUCKET_NAME
+from .signing import get_signed_url
+from .stitch import HLS_MASTER_PLAYLIST
+from .storage import get_storage
+
+# --- CONFIGURATION ---
+# Players fetch playlists without our auth header, so the URLs carry a signed token instead
+HLS_TOKEN_MAX_AGE = 6 * 60 * 60
+# Rewritten playlists are reused this long; well inside the signed segment URLs' lifetime
+PLAYLIST_CACHE_SECONDS = 300
+
+_MAP_URI = re.compile(r'URI="([^"]+)"')
+
+
+class PlaylistNotFound(Exception):
+    pass
+
+
+def hls_token(video_id):
+    return signing.dumps(str(video_id), salt="hls-playlist")
+
+
+def check_hls_token(token, video_id):
+    try:
+        return signing.loads(token, salt="hls-playlist", max_age=HLS_TOKEN_MAX_AGE) == str(video_id)
+    except signing.BadSignature:
+        return False
+
+
+def playlist_url(video):
+    """Path of the video's master playlist on this API (token included), or None without HLS."""
+    if not video.hls_playlist_gcs_path:
+        return None
+    path = reverse("video_hls", args=[video.id, HLS_MASTER_PLAYLIST])
+    return f"{path}?token={hls_token(video.id)}"
+
+
+def _rewrite(text, blob_dir, token):
+    """Playlist links stay on this endpoint; init/segment links become signed bucket URLs."""
+    def signed(uri):
+        return get_signed_url(BUCKET_NAME, posixpath.join(blob_dir, uri))
+
+    lines = []
+    for line in text.splitlines():
+        if line.startswith("#EXT-X-MAP:"):
+            line = _MAP_URI.sub(lambda m: f'URI="{signed(m.group(1))}"', line)
+        elif line and not line.startswith("#"):
+            line = f"{line}?token={token}" if line.endswith(".m3u8") else signed(line)
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def render_playlist(video_id, master_blob, name):
+    """Returns the text of playlist `name` (relative to the master's folder), ready for a player."""
+    blob_dir = posixpath.dirname(master_blob)
+    blob_name = posixpath.normpath(posixpath.join(blob_dir, name))
+    if not name.endswith(".m3u8") or not blob_name.startswith(blob_dir + "/"):
+        raise PlaylistNotFound(name)
+
+    cache_key = f"hls-playlist:{blob_name}"
+    text = cache.get(cache_key)
+    if text is None:
+        data = get_storage(BUCKET_NAME).read_bytes(blob_name)
+        if data is None:
+            raise PlaylistNotFound(name)
+        # A fresh token, so a cached playlist never hands out one close to expiry
+        text = _rewrite(data.decode(), posixpath.dirname(blob_name), hls_token(video_id))
+        cache.set(cache_key, text, PLAYLIST_CACHE_SECONDS)
+    return text
@@ -0,0 +1,94 @@
+import io
+import os
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from PIL import Image, ImageFile, ImageOps
+
+# --- CONFIGURATION ---
+# Veo renders 16:9 at 720p; a reference image bigger than this only adds bytes
+AVATAR_MAX_EDGE = int(os.environ.get("MANIFEST_AVATAR_MAX_EDGE", "1280"))
+AVATAR_JPEG_QUALITY = 90
+MAX_AVATAR_UPLOAD_BYTES = int(os.environ.get("MANIFEST_MAX_AVATAR_UPLOAD_MB", "20")) * 1024 * 1024
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def crop_to_aspect(image, max_ratio):
+    """Center-crops images wider or taller than max_ratio:1."""
+    width, height = image.size
+    if width > height * max_ratio:
+        new_width = int(height * max_ratio)
+        left = (width - new_width) // 2
+        return image.crop((left, 0, left + new_width, height))
+    if height > width * max_ratio:
+        new_height = int(width * max_ratio)
+        top = (height - new_height) // 2
+        return image.crop((0, top, width, top + new_height))
+    return image
+
+
+def normalize_image(image, max_edge=AVATAR_MAX_EDGE, quality=AVATAR_JPEG_QUALITY):
+    """
+    Applies EXIF orientation, shrinks to max_edge and re-encodes as a plain JPEG
+    (no EXIF/GPS data). Returns (jpeg_bytes, width, height).
+    """
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+    out = io.BytesIO()
+    image.save(out, format="JPEG", quality=quality, optimize=True)
+    return out.getvalue(), image.width, image.height
+
+
+class AvatarUploadHandler(FileUploadHandler):
+    """
+    Feeds multipart chunks straight into an incremental image decoder instead of
+    spooling the upload to memory or /tmp. The resulting request.FILES entry is
+    the normalized JPEG, not the original bytes.
+    """
+
+    def __init__(self, request=None, max_bytes=MAX_AVATAR_UPLOAD_BYTES):
+        super().__init__(request)
+        self.max_bytes = max_bytes
+        self.error = None
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.parser = ImageFile.Parser()
+        self.received = 0
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.error:
+            return None
+        if self.received > self.max_bytes:
+            self.error = f"Image is larger than {self.max_bytes // (1024 * 1024)}MB"
+            return None
+        try:
+            self.parser.feed(raw_data)
+        except Exception as e:
+            self.error = f"Could not read image: {e}"
+        # Returning None tells Django we consumed the chunk; nothing is buffered
+        return None
+
+    def file_complete(self, file_size):
+        if self.error:
+            return None
+        try:
+            image = self.parser.close()
+            jpeg_bytes, width, height = normalize_image(image)
+        except Exception as e:
+            self.error = f"Could not read image: {e}"
+            return None
+
+        upload = SimpleUploadedFile("avatar.jpg", jpeg_bytes, content_type="image/jpeg")
+        upload.width = width
+        upload.height = height
+        upload.original_size = file_size
+        return upload
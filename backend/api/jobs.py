@@ -0,0 +1,134 @@
+import datetime
+import os
+import uuid
+
+from django.db import transaction
+from django.utils import timezone
+
+from .checkpoints import Checkpoint, CHECKPOINT_FIELDS
+from .engine import generate_manifestation
+from .events import publish_video_event
+from . import metrics
+from .models import Video
+
+# A PROCESSING job whose row hasn't been touched for this long is assumed dead
+# (container killed, deploy, OOM) and may be resumed by the next delivery.
+JOB_LEASE_SECONDS = int(os.environ.get("MANIFEST_JOB_LEASE_SECONDS", "900"))
+
+
+def video_changed(video):
+    """Every status/stage transition: drop the cached status and tell stream listeners."""
+    from .status_cache import invalidate_video_state
+    invalidate_video_state(video.id)
+    publish_video_event(video)
+
+
+class VideoCheckpoint(Checkpoint):
+    """Checkpoint stored on the Video row itself."""
+
+    def __init__(self, video):
+        self.video = video
+        super().__init__(
+            stage=video.stage,
+            **{name: getattr(video, name) for name in CHECKPOINT_FIELDS},
+        )
+
+    def persist(self, fields):
+        updates = dict(fields, stage=self.stage, updated_at=timezone.now())
+        Video.objects.filter(pk=self.video.pk).update(**updates)
+        for name, value in updates.items():
+            setattr(self.video, name, value)
+        video_changed(self.video)
+
+    def heartbeat(self):
+        Video.objects.filter(pk=self.video.pk).update(updated_at=timezone.now())
+
+
+def claim_video(job_id):
+    """
+    Atomically marks a job PROCESSING. Returns (video, note); video is None
+    when this delivery should not run the job.
+    """
+    with transaction.atomic():
+        video_obj = Video.objects.select_for_update().get(id=job_id)
+
+        if video_obj.status == "COMPLETED":
+            return None, "already completed"
+
+        lease_expiry = timezone.now() - datetime.timedelta(seconds=JOB_LEASE_SECONDS)
+        if video_obj.status == "PROCESSING" and video_obj.updated_at > lease_expiry:
+            return None, "already processing"
+
+        # PENDING, FAILED, or PROCESSING with a dead worker: (re)run from the last checkpoint
+        video_obj.status = "PROCESSING"
+        video_obj.attempts += 1
+        video_obj.save()
+        return video_obj, None
+
+
+def run_video_job(job_id, template_name, user_id):
+    """
+    Runs one manifestation job end to end. Returns (payload, http_status)
+    so any transport (Cloud Tasks, Celery, in-process) can report the result.
+    """
+    run_id = str(uuid.uuid4())[:8]
+    print(f"[worker {run_id}] START job_id={job_id}")
+
+    video_obj, note = claim_video(job_id)
+    if video_obj is None:
+        print(f"[worker {run_id}] SKIP ({note})")
+        metrics.JOBS.inc(outcome="busy" if note == "already processing" else "skipped")
+        if note == "already processing":
+            # Non-2xx so Cloud Tasks tries again later; if that worker died,
+            # the lease will have expired and the retry resumes the job.
+            return {"status": "busy", "note": note}, 409
+        return {"status": "ok", "note": note}, 200
+
+    video_changed(video_obj)
+    if video_obj.attempts == 1:
+        queue_wait = (timezone.now() - video_obj.created_at).total_seconds()
+        metrics.QUEUE_WAIT_SECONDS.observe(queue_wait, lane=video_obj.lane)
+
+    if template_name and video_obj.template_name != template_name:
+        video_obj.template_name = template_name
+        video_obj.save(update_fields=["template_name", "updated_at"])
+    checkpoint = VideoCheckpoint(video_obj)
+    print(f"[worker {run_id}] attempt={video_obj.attempts} resuming_after={checkpoint.stage}")
+
+    try:
+        output_key = generate_manifestation(
+            video_obj.prompt,
+            template_name=video_obj.template_name or template_name,
+            user_id=user_id,
+            job_id=str(video_obj.id),
+            checkpoint=checkpoint,
+            use_generation_cache=not video_obj.fresh_take,
+            encoding_profile=video_obj.encoding_profile,
+        )
+
+        video_obj.final_video_gcs_path = output_key
+        video_obj.status = "COMPLETED"
+        video_obj.save()
+        video_changed(video_obj)
+        metrics.JOBS.inc(outcome="completed")
+
+        print(f"[worker {run_id}] DONE")
+        return {"status": "success"}, 200
+
+    except Exception as e:
+        video_obj.status = "FAILED"
+        video_obj.save(update_fields=["status", "updated_at"])
+        video_changed(video_obj)
+        metrics.JOBS.inc(outcome="failed")
+        print(f"[worker {run_id}] ENGINE ERROR: {e}")
+        # 500 lets Cloud Tasks retry; the retry resumes from the last checkpoint
+        # instead of paying for a new Vertex generation.
+        return {"error": str(e)}, 500
+
+    finally:
+        # This job's slot is free: let the scheduler hand out the next one
+        from .scheduler import pump
+        try:
+            pump()
+        except Exception as e:
+            print(f"[worker {run_id}] SCHEDULER ERROR: {e}")
@@ -0,0 +1,30 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from api.avatars import backfill_avatar
+from api.engine import BUCKET_NAME
+from api.models import Profile
+from api.storage import get_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Records avatar metadata on Profile for avatars uploaded before it was tracked. "
+        "Optional: /api/profile/status/ does the same for each user on first check."
+    )
+
+    def handle(self, *args, **options):
+        storage = get_storage(BUCKET_NAME)
+        tracked = Profile.objects.filter(avatar_path__isnull=False).values_list("user_id", flat=True)
+        found = 0
+
+        for user in User.objects.exclude(id__in=tracked).iterator():
+            profile = backfill_avatar(user, storage)
+            if profile is None:
+                continue
+            found += 1
+            self.stdout.write(
+                f"✅ {user.username}: {profile.avatar_path} ({profile.avatar_width}x{profile.avatar_height})"
+            )
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {found} avatar(s)"))
@@ -0,0 +1,73 @@
+import json
+import os
+import re
+import subprocess
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from api import stitch
+from api.encoding import PROFILES, encoder_threads
+
+
+def make_test_clip(path, seconds):
+    """A synthetic clip with motion and audio, close enough to a Veo clip for relative numbers."""
+    stitch.run_ffmpeg([
+        "-f", "lavfi", "-i", f"testsrc2=size=1280x720:rate=24:duration={seconds}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+        "-c:v", "libx264", "-preset", "veryfast", "-crf", "12", "-c:a", "aac", "-shortest", path,
+    ])
+
+
+def measure_ssim(encoded_path, reference_path, seconds):
+    """Mean SSIM of the encoded segment against the reference, scaled/trimmed the same way."""
+    ref_chain = (
+        f"[1:v]trim=duration={seconds},setpts=PTS-STARTPTS,"
+        f"scale={stitch.MEZZANINE_WIDTH}:{stitch.MEZZANINE_HEIGHT},setsar=1,fps={stitch.MEZZANINE_FPS}[ref]"
+    )
+    result = subprocess.run(
+        [stitch.FFMPEG_BIN, "-hide_banner", "-i", encoded_path, "-i", reference_path,
+         "-lavfi", f"{ref_chain};[0:v][ref]ssim", "-f", "null", "-"],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    match = re.search(r"All:([\d.]+)", result.stderr.decode(errors="replace"))
+    return float(match.group(1)) if match else None
+
+
+class Command(BaseCommand):
+    help = "Encodes the AI segment with every encoding profile and reports time, size and SSIM as JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", help="Clip to encode (default: a synthetic 1280x720 clip).")
+        parser.add_argument("--profiles", nargs="+", default=list(PROFILES), choices=list(PROFILES))
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per profile; the median time is reported.")
+
+    def handle(self, *args, **options):
+        seconds = stitch.AI_SEGMENT_SECONDS
+        with tempfile.TemporaryDirectory(prefix="encoding_bench_") as workdir:
+            source = options["source"]
+            if not source:
+                source = os.path.join(workdir, "source.mp4")
+                make_test_clip(source, seconds)
+
+            results = []
+            for name in options["profiles"]:
+                output = os.path.join(workdir, f"{name}.mp4")
+                timings = []
+                for _ in range(max(1, options["repeat"])):
+                    started = time.perf_counter()
+                    stitch.transcode_ai_segment(source, output, duration=seconds, profile=name)
+                    timings.append(time.perf_counter() - started)
+                timings.sort()
+                results.append({
+                    "profile": name,
+                    "preset": PROFILES[name].preset,
+                    "crf": PROFILES[name].crf,
+                    "threads": encoder_threads(),
+                    "encode_seconds": round(timings[len(timings) // 2], 3),
+                    "output_bytes": os.path.getsize(output),
+                    "ssim": measure_ssim(output, source, seconds),
+                })
+
+        self.stdout.write(json.dumps(results, indent=2))
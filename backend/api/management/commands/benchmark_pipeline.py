@@ -0,0 +1,266 @@
+import glob
+import json
+import math
+import os
+import resource
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.utils import timezone
+from PIL import Image
+
+from api import engine, scheduler
+from api.checkpoints import STAGES
+from api.events import LocalBroker, set_broker
+from api.fakes import FakeGenaiClient
+from api.management.commands.benchmark_encoding import make_test_clip
+from api.models import Video
+from api.storage import LocalStorage, set_storage
+from api.tasks import InMemoryTaskQueue, set_task_queue
+from api.template_registry import prewarm, registry
+from api.views import video_worker
+from api.workspace import WORKSPACE_ROOT
+
+BENCHMARK_USERNAME = "pipeline-benchmark"
+DISK_SAMPLE_SECONDS = 0.2
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return round(ordered[rank - 1], 3)
+
+
+def summarize(values):
+    return {"p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99),
+            "count": len(values)}
+
+
+class RecordingBroker(LocalBroker):
+    """Notes when each video reaches each stage; otherwise a normal in-process broker."""
+
+    def __init__(self):
+        super().__init__()
+        self.timeline = {}  # video_id -> {"PROCESSING"/stage/"COMPLETED"/"FAILED": monotonic time}
+        self._timeline_lock = threading.Lock()
+
+    def publish(self, channel, message):
+        now = time.monotonic()
+        with self._timeline_lock:
+            seen = self.timeline.setdefault(message["video_id"], {})
+            for key in (message["status"], message["stage"]):
+                seen.setdefault(key, now)
+        super().publish(channel, message)
+
+
+class DiskSampler(threading.Thread):
+    """Polls every job workspace and keeps the largest size seen for each."""
+
+    def __init__(self, job_ids, root=WORKSPACE_ROOT):
+        super().__init__(name="benchmark-disk-sampler", daemon=True)
+        self.job_ids = job_ids
+        self.root = root
+        self.peak = {job_id: 0 for job_id in job_ids}
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(DISK_SAMPLE_SECONDS):
+            for job_id in self.job_ids:
+                for folder in glob.glob(os.path.join(self.root, f"job_{job_id}_*")):
+                    size = 0
+                    for dirpath, _, files in os.walk(folder):
+                        for name in files:
+                            try:
+                                size += os.path.getsize(os.path.join(dirpath, name))
+                            except OSError:
+                                pass
+                    self.peak[job_id] = max(self.peak[job_id], size)
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs N manifestations concurrently through the worker endpoint against a fake Vertex "
+        "client and a local bucket, and reports per-stage latency, throughput, CPU, RSS and disk as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--jobs", type=int, default=8, help="Manifestations to run.")
+        parser.add_argument("--concurrency", type=int, default=4, help="Worker requests in flight at once.")
+        parser.add_argument("--veo-delay", type=float, default=5.0, help="Seconds the fake Veo takes per clip.")
+        parser.add_argument("--poll-seconds", type=float, default=1.0, help="Operation poll interval.")
+        parser.add_argument("--template", default=registry.default.name, choices=[t.name for t in registry])
+        parser.add_argument("--clip", help="Canned clip Veo 'returns' (default: a synthetic 8s clip).")
+        parser.add_argument("--use-generation-cache", action="store_true",
+                            help="Let jobs reuse each other's clips (off: every job generates).")
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout.")
+        parser.add_argument("--keep", action="store_true", help="Keep the benchmark's bucket and Video rows.")
+        parser.add_argument("--allow-shared-database", action="store_true",
+                            help="Run even though the default database isn't a local SQLite file.")
+
+    def handle(self, *args, **options):
+        # Jobs run against the real default database; only a local one is safe by default
+        if connection.vendor != "sqlite" and not options["allow_shared_database"]:
+            raise CommandError(
+                f"The default database is {connection.vendor}, not a local SQLite file. "
+                "The benchmark creates and deletes Video rows there; pass --allow-shared-database to run anyway."
+            )
+        # The fakes below replace process-wide singletons; this command is its own process
+        workdir = tempfile.mkdtemp(prefix="pipeline_bench_")
+        try:
+            report = self._run(workdir, options)
+        finally:
+            if not options["keep"]:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+        report = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(report + "\n")
+        else:
+            self.stdout.write(report)
+
+    def _setup(self, workdir, options):
+        """A local bucket holding the template clips, an avatar, and the clip Veo will 'return'."""
+        storage = LocalStorage(engine.BUCKET_NAME, root=os.path.join(workdir, "bucket"))
+        set_storage(engine.BUCKET_NAME, storage)
+
+        template = registry.get(options["template"])
+        template_clip = os.path.join(workdir, "template.mp4")
+        make_test_clip(template_clip, 4)
+        for blob_name in template.assets.values():
+            storage.upload_file(template_clip, blob_name, content_type="video/mp4")
+        # Workers prewarm on start, so one-off template work isn't part of any job's numbers
+        errors = {name: err for name, err in prewarm(storage, [template]).items() if err}
+        if errors:
+            raise CommandError(f"Could not prewarm templates: {errors}")
+
+        clip = options["clip"]
+        if not clip:
+            clip = os.path.join(workdir, "veo.mp4")
+            make_test_clip(clip, 8)
+
+        user, self.created_user = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        avatar = os.path.join(workdir, "avatar.jpg")
+        Image.new("RGB", (1024, 768), "gray").save(avatar)
+        storage.upload_file(avatar, f"users/{user.id}/profile/avatar.jpg", content_type="image/jpeg")
+
+        def deliver(output_gcs_uri):
+            # gs://<bucket>/<prefix> -> drop the canned clip in the job's mailbox
+            prefix = output_gcs_uri.split("/", 3)[3]
+            storage.upload_file(clip, prefix + "sample_0.mp4", content_type="video/mp4")
+
+        engine.client = FakeGenaiClient(delay=options["veo_delay"], on_complete=deliver)
+        engine.operation_tracker.initial_delay = options["poll_seconds"]
+        engine.operation_tracker.max_delay = options["poll_seconds"]
+        # Anything the scheduler dispatches stays in memory; nothing reaches a real queue
+        set_task_queue(InMemoryTaskQueue())
+        return user, template
+
+    def _run(self, workdir, options):
+        user, template = self._setup(workdir, options)
+        broker = RecordingBroker()
+        set_broker(broker)
+
+        now = timezone.now()
+        videos = Video.objects.bulk_create([
+            Video(user=user, prompt=f"benchmark run {i}: walking along the shore", template_name=template.name,
+                  fresh_take=not options["use_generation_cache"], dispatched_at=now)
+            for i in range(options["jobs"])
+        ])
+        job_ids = [str(video.id) for video in videos]
+        try:
+            # Finishing jobs pump the scheduler; keep those pumps away from real users' waiting jobs
+            with scheduler.scoped(job_ids):
+                return self._drive(user, template, job_ids, broker, options)
+        finally:
+            if not options["keep"]:
+                Video.objects.filter(id__in=job_ids).delete()
+                if self.created_user:
+                    user.delete()
+
+    def _drive(self, user, template, job_ids, broker, options):
+        factory = RequestFactory()
+        secret = os.environ.get("WORKER_SECRET", "")
+        started = {}
+        errors = {}
+
+        def run(job_id):
+            request = factory.post(
+                "/api/worker/", {"job_id": job_id, "template_name": template.name, "user_id": str(user.id)},
+                content_type="application/json", HTTP_X_WORKER_SECRET=secret,
+            )
+            started[job_id] = time.monotonic()
+            try:
+                return video_worker(request).status_code
+            except Exception as e:
+                # One job blowing up is a failed job, not a lost report
+                errors[job_id] = f"{type(e).__name__}: {e}"
+                return None
+            finally:
+                connection.close()
+
+        sampler = DiskSampler(job_ids)
+        sampler.start()
+        usage_before = (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN))
+        wall_start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            status_codes = list(pool.map(run, job_ids))
+        wall_seconds = time.monotonic() - wall_start
+        usage_after = (resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN))
+        sampler.stopped.set()
+        sampler.join()
+
+        return self._report(job_ids, status_codes, errors, started, broker.timeline, wall_seconds,
+                            usage_before, usage_after, sampler.peak, options)
+
+    def _report(self, job_ids, status_codes, errors, started, timeline, wall_seconds, usage_before, usage_after,
+                peak_disk, options):
+        stage_seconds = {stage: [] for stage in STAGES[1:]}
+        totals = []
+        for job_id in job_ids:
+            seen = timeline.get(job_id, {})
+            previous = seen.get("PROCESSING", started[job_id])
+            for stage in STAGES[1:]:
+                # Stages a job skips (e.g. SUBMITTED on a generation-cache hit) are left out
+                if stage in seen:
+                    stage_seconds[stage].append(seen[stage] - previous)
+                    previous = seen[stage]
+            if "COMPLETED" in seen:
+                totals.append(seen["COMPLETED"] - started[job_id])
+
+        cpu_seconds = sum(
+            (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+            for before, after in zip(usage_before, usage_after)
+        )
+        completed = len(totals)
+        return {
+            "jobs": len(job_ids),
+            "concurrency": options["concurrency"],
+            "veo_delay_seconds": options["veo_delay"],
+            "completed": completed,
+            "failed": sum(1 for code in status_codes if code != 200),
+            # Jobs whose worker call raised instead of answering, by job id
+            "errors": errors,
+            "wall_seconds": round(wall_seconds, 3),
+            "jobs_per_minute": round(completed / wall_seconds * 60, 2) if wall_seconds else None,
+            "latency_seconds": summarize(totals),
+            # Time from the previous checkpoint (or the claim) to this one
+            "stage_seconds": {stage: summarize(values) for stage, values in stage_seconds.items()},
+            # This process plus every ffmpeg it ran
+            "cpu_seconds": round(cpu_seconds, 3),
+            "cpu_seconds_per_job": round(cpu_seconds / completed, 3) if completed else None,
+            # ru_maxrss is KiB on Linux
+            "peak_rss_mb": round(usage_after[0].ru_maxrss / 1024, 1),
+            "peak_child_rss_mb": round(usage_after[1].ru_maxrss / 1024, 1),
+            "peak_disk_mb_per_job": summarize([size / (1024 * 1024) for size in peak_disk.values()]),
+        }
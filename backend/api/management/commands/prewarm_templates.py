@@ -0,0 +1,32 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from api.engine import BUCKET_NAME
+from api.storage import get_storage
+from api.template_registry import registry, prewarm
+
+
+class Command(BaseCommand):
+    help = (
+        "Downloads, probes and normalizes every registered template into the local "
+        "template cache. Run at worker start so the first job doesn't pay for it."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--strict", action="store_true", help="Exit non-zero if any template fails.")
+
+    def handle(self, *args, **options):
+        results = prewarm(get_storage(BUCKET_NAME))
+
+        failed = 0
+        for template in registry:
+            error = results.get(template.name)
+            if error is None:
+                self.stdout.write(f"✅ {template.name}: {json.dumps(template.metadata)}")
+            else:
+                failed += 1
+                self.stderr.write(f"❌ {template.name}: {error}")
+
+        if failed and options["strict"]:
+            raise SystemExit(1)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api import scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        "Dispatches waiting videos the caps now allow. Jobs finishing normally do this "
+        "themselves; run it on a schedule to recover slots held by dead workers and "
+        "re-dispatch jobs the queue lost or failed to accept."
+    )
+
+    def handle(self, *args, **options):
+        failed = scheduler.pump()
+        waiting = scheduler.waiting_count()
+        self.stdout.write(f"{waiting} waiting, {len(failed)} failed to enqueue")
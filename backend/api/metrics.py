@@ -0,0 +1,221 @@
+"""
+In-process metrics: counters and histograms kept in this process's memory and
+rendered in the Prometheus text format by /api/metrics/. Nothing external is
+needed; each process has its own registry, so scrape every worker.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# --- CONFIGURATION ---
+# Seconds; spans range from a cache lookup to a multi-minute Veo wait
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+# One JSON line per span (with the job id), to follow a single slow video through the logs
+LOG_SPANS = os.environ.get("MANIFEST_LOG_SPANS", "1") == "1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """[(sample name, [(label, value)], value)] for the text format."""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [(self.name, list(zip(self.labelnames, key)), value) for key, value in values]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        samples = []
+        for key, (counts, total) in values:
+            labels = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, counts):
+                samples.append((f"{self.name}_bucket", labels + [("le", _format_value(bound))], count))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, counts[-1]))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Named metrics, plus collectors: callables run at scrape time that report
+    numbers other objects already keep (cache stats, the operation tracker).
+    A collector returns [(name, type, help, [(labels dict, value)])].
+    """
+
+    def __init__(self):
+        self._metrics = OrderedDict()
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name, help, labelnames, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"{name} is already registered as a {metric.type}")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def register_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """Everything in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        families = [(m.name, m.type, m.help, m.samples()) for m in metrics]
+        for collector in collectors:
+            try:
+                for name, kind, help, values in collector():
+                    families.append((name, kind, help, [(name, sorted(labels.items()), value)
+                                                        for labels, value in values]))
+            except Exception as e:
+                # A broken collector shouldn't take the whole scrape down
+                print(f"⚠️ Metrics collector {collector!r} failed: {e}")
+
+        lines = []
+        for name, kind, help, samples in families:
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# --- ENGINE METRICS ---
+STAGE_SECONDS = registry.histogram(
+    "manifest_stage_seconds", "Time spent in each pipeline stage.", ["stage", "outcome"],
+)
+QUEUE_WAIT_SECONDS = registry.histogram(
+    "manifest_queue_wait_seconds", "Time from a video's creation until a worker first claims it.", ["lane"],
+)
+JOBS = registry.counter(
+    "manifest_jobs_total", "Worker deliveries by outcome (completed, failed, busy, skipped).", ["outcome"],
+)
+FALLBACKS = registry.counter(
+    "manifest_fallbacks_total",
+    "Times the pipeline took a degraded path (ai_clip = template instead of Veo, "
+    "moviepy_stitch, disk_stitch = streaming I/O abandoned).",
+    ["kind"],
+)
+STATUS_REQUESTS = registry.counter(
+    "manifest_status_requests_total", "Status polls answered, by HTTP status.", ["code"],
+)
+ENQUEUES = registry.counter(
+    "manifest_enqueues_total", "Jobs handed to the queue backend.", ["outcome"],
+)
+
+
+# --- SPANS ---
+_context = threading.local()
+
+
+@contextmanager
+def job_context(job_id):
+    """Tags every span opened on this thread inside the block with job_id."""
+    previous = getattr(_context, "job_id", None)
+    _context.job_id = job_id
+    try:
+        yield
+    finally:
+        _context.job_id = previous
+
+
+def current_job_id():
+    return getattr(_context, "job_id", None)
+
+
+@contextmanager
+def span(stage, job_id=None):
+    """
+    Times the block into manifest_stage_seconds{stage, outcome}. The job id
+    goes in the log line, not a label, so the metric's cardinality stays fixed.
+    """
+    job_id = job_id or current_job_id()
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(seconds, stage=stage, outcome=outcome)
+        if LOG_SPANS:
+            print(json.dumps({"span": stage, "job_id": job_id, "seconds": round(seconds, 3), "outcome": outcome}))
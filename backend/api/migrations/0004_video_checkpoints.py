@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_video_final_video_gcs_path_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='ai_clip_gcs_path',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='generation_prefix',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='operation_name',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='stage',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('ASSETS_FETCHED', 'Assets fetched'), ('SUBMITTED', 'Submitted to Vertex'), ('CLIP_RETRIEVED', 'Clip retrieved'), ('STITCHED', 'Stitched'), ('UPLOADED', 'Uploaded')], default='QUEUED', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='template_name',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_video_user_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_content_type',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_generation',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_path',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_size',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_profile_avatar_hash_and_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='fresh_take',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:44
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_dispatched(apps, schema_editor):
+    # Everything created before the scheduler was already enqueued directly
+    Video = apps.get_model('api', 'Video')
+    Video.objects.filter(dispatched_at__isnull=True).update(dispatched_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_video_fresh_take'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='plan',
+            field=models.CharField(choices=[('beta', 'Beta'), ('paid', 'Paid')], default='beta', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='dispatched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='lane',
+            field=models.CharField(default='beta', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='virtual_finish',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='video',
+            index=models.Index(fields=['status', 'dispatched_at', 'virtual_finish'], name='video_schedule_idx'),
+        ),
+        migrations.RunPython(mark_existing_dispatched, migrations.RunPython.noop),
+    ]
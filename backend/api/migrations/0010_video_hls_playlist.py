@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_video_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='hls_playlist_gcs_path',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
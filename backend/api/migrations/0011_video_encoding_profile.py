@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_video_hls_playlist'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='encoding_profile',
+            field=models.CharField(blank=True, max_length=20, null=True),
+        ),
+    ]
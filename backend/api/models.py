@@ -14,6 +14,16 @@ class Video(models.Model):
         ("FAILED", "Failed"),
     ]
 
+    # Pipeline checkpoints, in order. A retried job resumes after the last one reached.
+    STAGE_CHOICES = [
+        ("QUEUED", "Queued"),
+        ("ASSETS_FETCHED", "Assets fetched"),
+        ("SUBMITTED", "Submitted to Vertex"),
+        ("CLIP_RETRIEVED", "Clip retrieved"),
+        ("STITCHED", "Stitched"),
+        ("UPLOADED", "Uploaded"),
+    ]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
     prompt = models.TextField()
@@ -21,6 +31,31 @@ class Video(models.Model):
     final_video_url = models.TextField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     final_video_gcs_path = models.TextField(null=True, blank=True)
+    fresh_take = models.BooleanField(default=False)  # skip the generation cache for this video
+    encoding_profile = models.CharField(max_length=20, null=True, blank=True)  # None = template/deployment default
+
+    # --- CHECKPOINTS ---
+    stage = models.CharField(max_length=20, choices=STAGE_CHOICES, default="QUEUED")
+    template_name = models.CharField(max_length=100, null=True, blank=True)
+    operation_name = models.TextField(null=True, blank=True)  # Vertex operation to re-attach to
+    generation_prefix = models.TextField(null=True, blank=True)  # GCS "mailbox" the clip lands in
+    ai_clip_gcs_path = models.TextField(null=True, blank=True)
+    hls_playlist_gcs_path = models.TextField(null=True, blank=True)  # master.m3u8, when HLS output is on
+    attempts = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)  # doubles as the worker's heartbeat
+
+    # --- SCHEDULING (see scheduler.py) ---
+    lane = models.CharField(max_length=20, default="beta")
+    virtual_finish = models.FloatField(null=True, blank=True)  # fair-queuing tag; lowest goes next
+    dispatched_at = models.DateTimeField(null=True, blank=True)  # handed to the queue backend
+
+    class Meta:
+        indexes = [
+            # Serves the gallery: one user's videos, newest first, keyset-paginated
+            models.Index(fields=["user", "-created_at", "-id"], name="video_user_created_idx"),
+            # Serves the scheduler: the head of the waiting queue, in tag order
+            models.Index(fields=["status", "dispatched_at", "virtual_finish"], name="video_schedule_idx"),
+        ]
 
     def __str__(self):
         return f"{self.prompt[:20]}... ({self.status})"
@@ -30,6 +65,18 @@ class Profile(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     profile_picture_url = models.URLField(null=True, blank=True)
+    # Scheduling lane: paid users' jobs get a larger share of the video workers
+    plan = models.CharField(max_length=20, choices=[("beta", "Beta"), ("paid", "Paid")], default="beta")
+
+    # --- AVATAR METADATA (recorded by the upload flows) ---
+    avatar_path = models.TextField(null=True, blank=True)
+    avatar_generation = models.BigIntegerField(null=True, blank=True)
+    avatar_size = models.IntegerField(null=True, blank=True)
+    avatar_content_type = models.CharField(max_length=50, null=True, blank=True)
+    avatar_content_hash = models.CharField(max_length=64, null=True, blank=True)  # hex MD5, same key the reference cache uses
+    avatar_width = models.IntegerField(null=True, blank=True)
+    avatar_height = models.IntegerField(null=True, blank=True)
+    avatar_updated_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.user.username}'s Profile"
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+import httpx
+
+# --- CONFIGURATION ---
+POLL_INITIAL_SECONDS = float(os.environ.get("MANIFEST_POLL_INITIAL_SECONDS", "10"))
+POLL_MAX_SECONDS = float(os.environ.get("MANIFEST_POLL_MAX_SECONDS", "30"))
+POLL_MULTIPLIER = 1.5
+POLL_JITTER = 0.25  # +/- 25% so jobs submitted together don't poll in lockstep
+OPERATION_TIMEOUT_SECONDS = float(os.environ.get("MANIFEST_OPERATION_TIMEOUT_SECONDS", "900"))
+# HTTP statuses a later poll may not see again (google-genai's APIError and
+# google-api-core's exceptions both carry the status as .code)
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class OperationTimeout(Exception):
+    pass
+
+
+def is_transient(error):
+    """True for poll failures worth another try: dropped connections, timeouts, retryable statuses."""
+    if isinstance(error, (ConnectionError, TimeoutError, httpx.TransportError)):
+        return True
+    return getattr(error, "code", None) in RETRYABLE_STATUS_CODES
+
+
+class OperationTracker:
+    """
+    Waits on many Vertex long-running operations from one background event loop.
+
+    Worker threads hand their operation over with wait() and block on a future
+    without holding a CPU slot; all polling happens on the tracker's loop with
+    exponential, jittered backoff per operation. A poll that fails transiently
+    is retried on the same schedule; only the deadline or a permanent error
+    ends the wait early.
+    """
+
+    def __init__(self, get_client, initial_delay=POLL_INITIAL_SECONDS, max_delay=POLL_MAX_SECONDS,
+                 multiplier=POLL_MULTIPLIER, jitter=POLL_JITTER, timeout=OPERATION_TIMEOUT_SECONDS):
+        self.get_client = get_client
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.timeout = timeout
+
+        self._loop = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.polls = 0
+        self.poll_errors = 0
+
+    # --- EVENT LOOP ---
+    def _ensure_loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="vertex-operation-poller", daemon=True)
+                thread.start()
+                self._loop = loop
+            return self._loop
+
+    async def _get(self, operation):
+        client = self.get_client()
+        aio = getattr(client, "aio", None)
+        if aio is not None:
+            return await aio.operations.get(operation=operation)
+        # Sync-only clients: run the call off the loop
+        return await asyncio.to_thread(client.operations.get, operation=operation)
+
+    async def _poll(self, operation, on_poll=None):
+        self.in_flight += 1
+        delay = self.initial_delay
+        deadline = time.monotonic() + self.timeout
+        try:
+            while not operation.done:
+                if time.monotonic() > deadline:
+                    raise OperationTimeout(f"Operation {operation.name} not done after {self.timeout:.0f}s")
+                await asyncio.sleep(delay * random.uniform(1 - self.jitter, 1 + self.jitter))
+                try:
+                    operation = await self._get(operation)
+                except Exception as e:
+                    # One flaky status call shouldn't fail a generation we've paid for;
+                    # keep backing off until the deadline
+                    if not is_transient(e):
+                        raise
+                    self.poll_errors += 1
+                    print(f"⚠️ Polling {operation.name} failed, will retry: {e}")
+                else:
+                    self.polls += 1
+                    if on_poll:
+                        on_poll(operation)
+                delay = min(delay * self.multiplier, self.max_delay)
+            return operation
+        finally:
+            self.in_flight -= 1
+
+    # --- PUBLIC API ---
+    def track(self, operation, on_poll=None):
+        """Starts tracking an operation. Returns a concurrent.futures.Future of the finished operation."""
+        return asyncio.run_coroutine_threadsafe(self._poll(operation, on_poll), self._ensure_loop())
+
+    def wait(self, operation, on_poll=None):
+        """Blocks the calling thread (not the loop) until the operation is done."""
+        return self.track(operation, on_poll).result()
@@ -0,0 +1,58 @@
+import base64
+import json
+import uuid
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(obj):
+    raw = json.dumps({"t": obj.created_at.isoformat(), "id": str(obj.id)})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        created_at = parse_datetime(data["t"])
+        if created_at is None:
+            raise ValueError("bad timestamp")
+        return created_at, uuid.UUID(data["id"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+
+
+def clamp_page_size(limit):
+    try:
+        limit = int(limit) if limit is not None else DEFAULT_PAGE_SIZE
+    except (TypeError, ValueError):
+        limit = DEFAULT_PAGE_SIZE
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def paginate_newest_first(queryset, cursor=None, limit=None):
+    """
+    Keyset pagination over (created_at, id), newest first.
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    Each page is one index range scan, however deep the user scrolls.
+    """
+    limit = clamp_page_size(limit)
+    queryset = queryset.order_by("-created_at", "-id")
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        queryset = queryset.filter(
+            Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=last_id)
+        )
+
+    # Fetch one extra row to know whether there's another page
+    items = list(queryset[:limit + 1])
+    next_cursor = encode_cursor(items[limit - 1]) if len(items) > limit else None
+    return items[:limit], next_cursor
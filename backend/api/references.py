@@ -0,0 +1,128 @@
+import base64
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+from .images import crop_to_aspect, normalize_image
+
+# --- CONFIGURATION ---
+REFERENCE_CACHE_DIR = os.environ.get("MANIFEST_REFERENCE_CACHE_DIR", "/tmp/manifest_reference_cache")
+REFERENCE_CACHE_MAX_BYTES = int(os.environ.get("MANIFEST_REFERENCE_CACHE_MB", "256")) * 1024 * 1024
+REFERENCE_MEMORY_ENTRIES = int(os.environ.get("MANIFEST_REFERENCE_MEMORY_ENTRIES", "64"))
+# Wider/taller than this gets center-cropped; Veo gains nothing from panorama borders
+REFERENCE_MAX_ASPECT = 2.0
+
+
+class PreparedReference:
+    def __init__(self, image_bytes, content_hash, mime_type="image/jpeg"):
+        self.image_bytes = image_bytes
+        self.content_hash = content_hash
+        self.mime_type = mime_type
+
+
+def prepare_reference_image(raw_bytes):
+    """Decode once, orient, crop extreme aspect ratios, shrink and recompress."""
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(raw_bytes)))
+    image = crop_to_aspect(image, REFERENCE_MAX_ASPECT)
+    jpeg_bytes, _, _ = normalize_image(image)
+    return jpeg_bytes
+
+
+class PreparedReferenceCache:
+    """
+    Prepared avatar bytes keyed by the source object's content hash (the MD5
+    that storage already reports), kept in memory and on local disk. A user
+    making many videos from the same photo downloads and decodes it once.
+    """
+
+    def __init__(self, root=REFERENCE_CACHE_DIR, max_bytes=REFERENCE_CACHE_MAX_BYTES,
+                 memory_entries=REFERENCE_MEMORY_ENTRIES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()  # content_hash -> bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    def _disk_path(self, content_hash):
+        return os.path.join(self.root, f"{content_hash}.jpg")
+
+    def _remember(self, content_hash, image_bytes):
+        with self._lock:
+            self._memory[content_hash] = image_bytes
+            self._memory.move_to_end(content_hash)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, storage, blob_name):
+        """Returns a PreparedReference for blob_name, or None if it doesn't exist."""
+        # One metadata call tells us whether the photo changed since we last prepared it
+        info = storage.get_metadata(blob_name)
+        if info is None:
+            print(f"⚠️ Warning: {blob_name} not found.")
+            return None
+        content_hash = base64.b64decode(info.md5_hash).hex() if info.md5_hash else f"gen{info.generation}"
+
+        with self._lock:
+            image_bytes = self._memory.get(content_hash)
+            if image_bytes is not None:
+                self._memory.move_to_end(content_hash)
+                self.hits += 1
+                return PreparedReference(image_bytes, content_hash)
+
+        path = self._disk_path(content_hash)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                image_bytes = f.read()
+            with self._lock:
+                self.hits += 1
+            self._remember(content_hash, image_bytes)
+            return PreparedReference(image_bytes, content_hash)
+
+        with self._lock:
+            self.misses += 1
+        raw_bytes = storage.read_bytes(blob_name)
+        if raw_bytes is None:
+            return None
+        image_bytes = prepare_reference_image(raw_bytes)
+        print(f"🖼️ Prepared reference {content_hash[:8]}: {len(raw_bytes)} -> {len(image_bytes)} bytes")
+
+        part_path = f"{path}.{threading.get_ident()}.part"
+        with open(part_path, "wb") as f:
+            f.write(image_bytes)
+        os.replace(part_path, path)
+        self._remember(content_hash, image_bytes)
+        self._prune_disk()
+        return PreparedReference(image_bytes, content_hash)
+
+    def _prune_disk(self):
+        files = []
+        for name in os.listdir(self.root):
+            if name.endswith(".jpg"):
+                path = os.path.join(self.root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "memory_entries": len(self._memory)}
+
+
+reference_cache = PreparedReferenceCache()
@@ -0,0 +1,186 @@
+import datetime
+import os
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+
+from .jobs import JOB_LEASE_SECONDS, video_changed
+from .models import Profile, Video
+from .tasks import enqueue_video_tasks
+
+# --- CONFIGURATION ---
+# Jobs handed to the queue backend at once; the rest wait here, in fair order
+MAX_DISPATCHED = int(os.environ.get("MANIFEST_SCHEDULER_MAX_DISPATCHED", "24"))
+# Jobs one user may have dispatched/running at once
+MAX_IN_FLIGHT_PER_USER = int(os.environ.get("MANIFEST_MAX_IN_FLIGHT_PER_USER", "2"))
+# A dispatched job no worker has touched for this long was lost by the queue; dispatch it again
+DISPATCH_TIMEOUT_SECONDS = int(os.environ.get("MANIFEST_DISPATCH_TIMEOUT_SECONDS", str(2 * JOB_LEASE_SECONDS)))
+
+# Lane weights for weighted fair queuing: a paid user's jobs advance 4x as fast
+# as a beta user's, and campaign batches trickle in behind interactive requests.
+# Nothing starves; a heavier weight just means a smaller step in virtual time.
+LANE_WEIGHTS = {
+    "paid": 4.0,
+    "beta": 1.0,
+    "bulk": 0.25,
+}
+DEFAULT_LANE = "beta"
+
+
+def lane_for_user(user):
+    plan = Profile.objects.filter(user=user).values_list("plan", flat=True).first()
+    return plan if plan in LANE_WEIGHTS else DEFAULT_LANE
+
+
+def _in_flight():
+    """Dispatched jobs that are still queued or running with a live lease."""
+    lease_expiry = timezone.now() - datetime.timedelta(seconds=JOB_LEASE_SECONDS)
+    return Video.objects.filter(
+        dispatched_at__isnull=False,
+        status__in=["PENDING", "PROCESSING"],
+        updated_at__gt=lease_expiry,
+    )
+
+
+# When set, pump() only looks at these video ids (see scoped())
+_scope = None
+
+
+@contextmanager
+def scoped(video_ids):
+    """
+    Restricts this process's pumps to the given videos, so a benchmark or
+    load test running against a shared database never dispatches real jobs.
+    """
+    global _scope
+    previous, _scope = _scope, list(video_ids)
+    try:
+        yield
+    finally:
+        _scope = previous
+
+
+def _scoped(queryset):
+    return queryset if _scope is None else queryset.filter(id__in=_scope)
+
+
+def _waiting():
+    return Video.objects.filter(status="PENDING", dispatched_at__isnull=True)
+
+
+def _reclaim_lost():
+    """
+    Puts dispatched jobs that never reached a worker back in line. Claiming a
+    job makes it PROCESSING, so a PENDING row untouched since its dispatch
+    was never picked up. Its fair-queuing tag is kept, so it goes out first.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=DISPATCH_TIMEOUT_SECONDS)
+    return _scoped(Video.objects.filter(
+        status="PENDING", dispatched_at__lt=cutoff, updated_at__lt=cutoff,
+    )).update(dispatched_at=None)
+
+
+def submit(videos, lane=None):
+    """
+    Inserts unsaved Video rows with their fair-queuing tags, then dispatches
+    whatever the caps allow. Returns the ids whose enqueue failed.
+
+    Tags follow self-clocked fair queuing: a job finishes at
+    max(system virtual time, the user's last tag) + 1 / lane weight, and jobs
+    are dispatched in tag order, so a user with 30 queued prompts interleaves
+    with everyone else instead of going ahead of them.
+    """
+    if not videos:
+        return set()
+    user = videos[0].user
+    lane = lane or lane_for_user(user)
+    step = 1.0 / LANE_WEIGHTS[lane]
+
+    with transaction.atomic():
+        # System virtual time: the latest tag handed out among jobs still in the system
+        virtual_time = Video.objects.filter(
+            status__in=["PENDING", "PROCESSING"], dispatched_at__isnull=False,
+        ).aggregate(t=Max("virtual_finish"))["t"] or 0.0
+        last_tag = _waiting().filter(user=user).aggregate(t=Max("virtual_finish"))["t"] or 0.0
+        tag = max(virtual_time, last_tag)
+        for video in videos:
+            tag += step
+            video.lane = lane
+            video.virtual_finish = tag
+        Video.objects.bulk_create(videos)
+
+    return pump()
+
+
+def pump():
+    """Dispatches waiting jobs in tag order while the global and per-user caps allow."""
+    reclaimed = _reclaim_lost()
+    if reclaimed:
+        print(f"🔁 Scheduler: {reclaimed} lost job(s) back in line")
+
+    with transaction.atomic():
+        # Locking the head of the queue first serializes concurrent pumps,
+        # so the in-flight counts below can't be stale
+        candidates = list(
+            _scoped(_waiting())
+            .select_for_update()
+            .order_by("virtual_finish", "created_at")
+            .values_list("id", "user_id", "template_name")[:MAX_DISPATCHED * 4]
+        )
+        if not candidates:
+            return set()
+
+        in_flight = _in_flight()
+        free = MAX_DISPATCHED - in_flight.count()
+        per_user = dict(in_flight.values_list("user_id").annotate(n=Count("id")))
+
+        now = timezone.now()
+        # Each dispatch gets its own task name, so a reclaimed job isn't refused as a duplicate
+        dispatch = now.strftime("%Y%m%d%H%M%S%f")
+        chosen = []
+        for video_id, user_id, template_name in candidates:
+            if free <= 0:
+                break
+            if per_user.get(user_id, 0) >= MAX_IN_FLIGHT_PER_USER:
+                continue
+            per_user[user_id] = per_user.get(user_id, 0) + 1
+            free -= 1
+            chosen.append((video_id, template_name, str(user_id), dispatch))
+
+        if not chosen:
+            return set()
+        chosen_ids = [c[0] for c in chosen]
+        Video.objects.filter(id__in=chosen_ids).update(dispatched_at=now, updated_at=now)
+
+    try:
+        failures = enqueue_video_tasks(chosen)
+    except Exception as e:
+        # The whole backend failed (broker/API down): nothing was queued, so
+        # the jobs go back in line for the next pump instead of waiting forever
+        print(f"❌ Scheduler: enqueue failed, {len(chosen)} job(s) back in line: {e}")
+        Video.objects.filter(id__in=chosen_ids, status="PENDING", dispatched_at=now).update(dispatched_at=None)
+        return set()
+    failed_ids = {job_id for job_id, _ in failures}
+    for video in Video.objects.filter(id__in=chosen_ids):
+        if video.id in failed_ids:
+            video.status = "FAILED"
+            video.save(update_fields=["status", "updated_at"])
+        video_changed(video)
+    return failed_ids
+
+
+def waiting_count():
+    return _waiting().count()
+
+
+def queue_position(video):
+    """1-based place among jobs still waiting for dispatch, or None once dispatched."""
+    if video.status != "PENDING" or video.dispatched_at is not None or video.virtual_finish is None:
+        return None
+    ahead = _waiting().filter(
+        Q(virtual_finish__lt=video.virtual_finish)
+        | Q(virtual_finish=video.virtual_finish, created_at__lt=video.created_at)
+    ).count()
+    return ahead + 1
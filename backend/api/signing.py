@@ -0,0 +1,67 @@
+import datetime
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from .storage import get_storage
+
+# --- CONFIGURATION ---
+SIGNED_URL_EXPIRATION = datetime.timedelta(hours=1)
+# Hand out a cached URL until this fraction of its lifetime has passed,
+# so clients always get a URL with a useful amount of time left on it.
+REUSE_FRACTION = 0.8
+MAX_ENTRIES = int(os.environ.get("MANIFEST_SIGNED_URL_CACHE_SIZE", "10000"))
+
+
+class SignedUrlCache:
+    """LRU of V4 signed URLs keyed by (bucket, blob path, method, expiration)."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, reuse_fraction=REUSE_FRACTION):
+        self.max_entries = max_entries
+        self.reuse_fraction = reuse_fraction
+        self._entries = OrderedDict()  # key -> (url, reuse_until)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, bucket_name, blob_path, expiration=SIGNED_URL_EXPIRATION, method="GET"):
+        key = (bucket_name, blob_path, method, int(expiration.total_seconds()))
+        now = time.time()
+
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached and cached[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+            self.misses += 1
+
+        # Signing happens outside the lock; two threads may race to sign the same blob, which is harmless
+        url = get_storage(bucket_name).signed_url(blob_path, expiration=expiration, method=method)
+        reuse_until = now + expiration.total_seconds() * self.reuse_fraction
+
+        with self._lock:
+            self._entries[key] = (url, reuse_until)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return url
+
+    def invalidate(self, bucket_name, blob_path):
+        """Drops every cached URL for a blob (e.g. after it's overwritten or deleted)."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == bucket_name and k[1] == blob_path]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+signed_url_cache = SignedUrlCache()
+
+
+def get_signed_url(bucket_name, blob_path, expiration=SIGNED_URL_EXPIRATION):
+    """Returns a (possibly cached) V4 signed GET URL for a blob."""
+    return signed_url_cache.get(bucket_name, blob_path, expiration)
@@ -0,0 +1,102 @@
+import asyncio
+import hashlib
+import os
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+
+from . import scheduler
+from .engine import BUCKET_NAME
+from .events import get_broker, video_channel
+from .hls import playlist_url
+from .models import Video
+from .signing import get_signed_url
+
+# --- CONFIGURATION ---
+# The worker deletes the entry on every transition, so the TTL only bounds how
+# stale queue positions (which move when *other* jobs start) can get
+STATUS_CACHE_SECONDS = int(os.environ.get("MANIFEST_STATUS_CACHE_SECONDS", "5"))
+# Longest a ?wait= long-poll may hold the request
+MAX_STATUS_WAIT_SECONDS = 25
+# A long-poll wakes on the video's events; between them it re-reads this often,
+# since queue positions move without one
+STATUS_WAIT_RECHECK_SECONDS = STATUS_CACHE_SECONDS
+
+
+def _cache_key(video_id):
+    return f"video-status:{video_id}"
+
+
+def video_status_payload(video):
+    signed_url = None
+
+    if video.status == "COMPLETED" and video.final_video_gcs_path:
+        signed_url = get_signed_url(BUCKET_NAME, video.final_video_gcs_path)
+
+    return {
+        "status": video.status,
+        "stage": video.stage,
+        "video_url": signed_url,
+        # HLS master playlist (relative to this API), when the video has one
+        "playlist_url": playlist_url(video) if video.status == "COMPLETED" else None,
+        # How many jobs go before this one; None once it has been dispatched
+        "queue_position": scheduler.queue_position(video),
+    }
+
+
+def status_etag(video, payload):
+    state = f"{video.status}|{video.stage}|{video.updated_at.isoformat()}|{payload['queue_position']}"
+    return '"' + hashlib.md5(state.encode()).hexdigest() + '"'
+
+
+def get_video_state(video_id):
+    """
+    Returns {"user_id", "etag", "payload"} for a video, or None if it doesn't
+    exist. Read through a short-lived cache so pollers skip the ORM and signing.
+    """
+    key = _cache_key(video_id)
+    state = cache.get(key)
+    if state is not None:
+        return state
+
+    video = Video.objects.filter(id=video_id).first()
+    if video is None:
+        return None
+    payload = video_status_payload(video)
+    state = {"user_id": video.user_id, "etag": status_etag(video, payload), "payload": payload}
+    cache.set(key, state, STATUS_CACHE_SECONDS)
+    return state
+
+
+def invalidate_video_state(video_id):
+    cache.delete(_cache_key(video_id))
+
+
+async def _wait_for_change(video_id, etag, timeout):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(timeout, MAX_STATUS_WAIT_SECONDS)
+
+    # Subscribe before reading, so a transition in between isn't missed
+    async with get_broker().subscribe(video_channel(video_id)) as queue:
+        state = await sync_to_async(get_video_state)(video_id)
+        while state is not None and state["etag"] == etag:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                await asyncio.wait_for(queue.get(), timeout=min(remaining, STATUS_WAIT_RECHECK_SECONDS))
+                # The worker's invalidation only reaches its own process's cache (LocMem)
+                invalidate_video_state(video_id)
+            except asyncio.TimeoutError:
+                pass
+            state = await sync_to_async(get_video_state)(video_id)
+        return state
+
+
+def wait_for_change(video_id, etag, timeout):
+    """
+    Long-poll: returns the state once its ETag differs from `etag`, or at
+    `timeout`. Woken by the video's events (see events.py), so a worker in
+    another process is seen as soon as it publishes, not when the cache expires.
+    """
+    return async_to_sync(_wait_for_change)(video_id, etag, timeout)
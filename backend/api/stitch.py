@@ -0,0 +1,309 @@
+import json
+import os
+import subprocess
+
+from moviepy.editor import VideoFileClip, concatenate_videoclips
+
+from .encoding import get_profile, encoder_threads
+from . import metrics
+
+# --- MONKEYPATCH ---
+import PIL.Image
+if not hasattr(PIL.Image, 'ANTIALIAS'):
+    PIL.Image.ANTIALIAS = PIL.Image.LANCZOS
+
+# --- CONFIGURATION ---
+# "ffmpeg" = stream-copy intro/outro and only encode the AI segment
+# "moviepy" = the original full re-encode (also used as the fallback)
+STITCH_MODE = os.environ.get("MANIFEST_STITCH_MODE", "ffmpeg")
+
+FFMPEG_BIN = os.environ.get("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BIN = os.environ.get("FFPROBE_BINARY", "ffprobe")
+
+AI_SEGMENT_SECONDS = 6
+
+# The "mezzanine" format every template is normalized to once, so the AI
+# segment can be encoded to match and all three parts joined without re-encoding.
+MEZZANINE_WIDTH, MEZZANINE_HEIGHT = (
+    int(x) for x in os.environ.get("MANIFEST_MEZZANINE_SIZE", "1280x720").split("x")
+)
+MEZZANINE_FPS = 24
+MEZZANINE_SUFFIX = "mezz.mp4"
+
+# Every encoder call must use exactly these settings or the concat copy breaks
+MEZZANINE_VIDEO_ARGS = [
+    "-c:v", "libx264", "-profile:v", "high", "-pix_fmt", "yuv420p",
+    "-r", str(MEZZANINE_FPS), "-video_track_timescale", "12288",
+]
+MEZZANINE_AUDIO_ARGS = ["-c:a", "aac", "-ar", "48000", "-ac", "2", "-b:a", "128k"]
+
+
+# Optional adaptive-streaming output next to the MP4: fMP4 HLS at these (height, video bitrate) rungs.
+# Rungs taller than the source are skipped.
+HLS_OUTPUT = os.environ.get("MANIFEST_HLS_OUTPUT", "0") == "1"
+HLS_LADDER = [(720, 3000), (480, 1400), (360, 700)]
+HLS_SEGMENT_SECONDS = 2
+HLS_MASTER_PLAYLIST = "master.m3u8"
+
+# Streaming I/O: the AI clip is read straight from storage (ranged reads on a
+# signed URL) and the final MP4 is written as fragmented MP4 straight into a
+# chunked upload, so neither is staged in the job workspace. Only the ffmpeg
+# stitch can do this; moviepy always works from local files.
+STREAMING_IO = os.environ.get("MANIFEST_STREAMING_IO", "0") == "1"
+STREAM_READ_BYTES = 1024 * 1024
+# Fragmented MP4: an empty moov up front and a moof per keyframe, so nothing
+# needs seeking back to once written (unlike +faststart)
+FRAGMENTED_MP4_FLAGS = "frag_keyframe+empty_moov+default_base_moof"
+
+
+class StitchError(Exception):
+    pass
+
+
+# --- FFMPEG HELPERS ---
+def run_ffmpeg(args):
+    cmd = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-y"] + args
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if result.returncode != 0:
+        raise StitchError(f"ffmpeg failed ({result.returncode}): {result.stderr.decode(errors='replace')[-500:]}")
+    return result
+
+
+def has_audio(path):
+    result = subprocess.run(
+        [FFPROBE_BIN, "-v", "error", "-select_streams", "a", "-show_entries", "stream=index", "-of", "csv=p=0", path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        raise StitchError(f"ffprobe failed on {path}: {result.stderr.decode(errors='replace')[-300:]}")
+    return bool(result.stdout.strip())
+
+
+def probe_video(path):
+    """Duration, frame size, frame rate and codecs of a clip."""
+    result = subprocess.run(
+        [FFPROBE_BIN, "-v", "error", "-show_entries",
+         "format=duration:stream=codec_type,codec_name,width,height,r_frame_rate",
+         "-of", "json", path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        raise StitchError(f"ffprobe failed on {path}: {result.stderr.decode(errors='replace')[-300:]}")
+    data = json.loads(result.stdout)
+    streams = data.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), {})
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), {})
+    num, _, den = video.get("r_frame_rate", "0/1").partition("/")
+    return {
+        "duration": float(data.get("format", {}).get("duration", 0)),
+        "width": video.get("width"),
+        "height": video.get("height"),
+        "fps": round(float(num) / float(den or 1), 3) if float(den or 1) else None,
+        "video_codec": video.get("codec_name"),
+        "audio_codec": audio.get("codec_name"),
+    }
+
+
+def _scale_filter():
+    # Stretch to the mezzanine frame, same as the old moviepy resize(newsize=...)
+    return f"scale={MEZZANINE_WIDTH}:{MEZZANINE_HEIGHT},setsar=1,fps={MEZZANINE_FPS}"
+
+
+def normalize_to_mezzanine(source_path, output_path):
+    """Re-encodes a template clip into the mezzanine format (done once per template version)."""
+    part_path = f"{output_path}.part.mp4"
+    args = ["-i", source_path]
+    if has_audio(source_path):
+        audio_map = "0:a:0"
+    else:
+        # Concat needs identical streams in every part, so add silence
+        args += ["-f", "lavfi", "-i", "anullsrc=r=48000:cl=stereo"]
+        audio_map = "1:a:0"
+    args += ["-filter_complex", f"[0:v:0]{_scale_filter()}[v]", "-map", "[v]", "-map", audio_map, "-shortest"]
+    # Done once per template version, so always high quality regardless of the job's profile
+    args += MEZZANINE_VIDEO_ARGS + ["-preset", "slow", "-crf", "18", "-threads", str(encoder_threads())]
+    args += MEZZANINE_AUDIO_ARGS
+    args += ["-movflags", "+faststart", part_path]
+    run_ffmpeg(args)
+    os.replace(part_path, output_path)
+    return output_path
+
+
+def transcode_ai_segment(source_path, output_path, duration=AI_SEGMENT_SECONDS, profile=None, source_audio=None):
+    """
+    Loops/trims the AI clip to `duration` seconds and encodes it to match the mezzanine.
+    `source_audio` says whether the source has an audio track; None = ask ffprobe.
+    """
+    # -stream_loop repeats the input at the demuxer, so short clips loop without buffering frames
+    args = ["-stream_loop", "-1", "-i", source_path]
+    video = f"[0:v:0]trim=duration={duration},setpts=PTS-STARTPTS,{_scale_filter()}[v]"
+    if source_audio is None:
+        source_audio = has_audio(source_path)
+    if source_audio:
+        audio = (
+            f"[0:a:0]atrim=duration={duration},asetpts=PTS-STARTPTS,"
+            f"aresample=48000,aformat=channel_layouts=stereo[a]"
+        )
+    else:
+        audio = f"anullsrc=r=48000:cl=stereo,atrim=duration={duration}[a]"
+    args += ["-filter_complex", f"{video};{audio}", "-map", "[v]", "-map", "[a]", "-t", str(duration)]
+    args += MEZZANINE_VIDEO_ARGS + get_profile(profile).x264_args() + MEZZANINE_AUDIO_ARGS
+    args += [output_path]
+    run_ffmpeg(args)
+    return output_path
+
+
+def _write_concat_list(segment_paths, list_path):
+    with open(list_path, "w") as f:
+        for path in segment_paths:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+
+
+def concat_segments(segment_paths, output_path, list_path):
+    """Joins mezzanine segments with the concat demuxer (no re-encode)."""
+    _write_concat_list(segment_paths, list_path)
+    run_ffmpeg([
+        "-f", "concat", "-safe", "0", "-i", list_path,
+        "-c", "copy", "-movflags", "+faststart", output_path,
+    ])
+    return output_path
+
+
+def concat_segments_to_stream(segment_paths, writer, list_path):
+    """
+    Like concat_segments, but muxes fragmented MP4 to ffmpeg's stdout and copies
+    it into `writer` (any object with write()) as it's produced.
+    """
+    _write_concat_list(segment_paths, list_path)
+    cmd = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-y",
+           "-f", "concat", "-safe", "0", "-i", list_path,
+           "-c", "copy", "-movflags", FRAGMENTED_MP4_FLAGS, "-f", "mp4", "pipe:1"]
+    # stderr goes to a file: a full stderr pipe would stall ffmpeg while we block on stdout
+    with open(f"{list_path}.log", "w+b") as log:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=log)
+        try:
+            for chunk in iter(lambda: proc.stdout.read(STREAM_READ_BYTES), b""):
+                writer.write(chunk)
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            proc.stdout.close()
+            returncode = proc.wait()
+        if returncode != 0:
+            log.seek(0)
+            raise StitchError(f"ffmpeg failed ({returncode}): {log.read().decode(errors='replace')[-500:]}")
+    return writer
+
+
+# --- STITCH ENGINES ---
+def stitch_ffmpeg(intro_path, ai_clip_path, outro_path, output_path, workdir, profile=None, ai_clip_audio=None):
+    """Fast path: intro/outro must already be mezzanine files."""
+    segment_path = os.path.join(workdir, "ai_segment.mp4")
+    with metrics.span("encode"):
+        transcode_ai_segment(ai_clip_path, segment_path, profile=profile, source_audio=ai_clip_audio)
+    concat_segments(
+        [intro_path, segment_path, outro_path],
+        output_path,
+        os.path.join(workdir, "concat.txt"),
+    )
+    return output_path
+
+
+def stitch_ffmpeg_to_stream(intro_path, ai_clip_source, outro_path, writer, workdir, profile=None,
+                            ai_clip_audio=None):
+    """
+    Streaming variant of stitch_ffmpeg: `ai_clip_source` may be a URL (ffmpeg
+    reads it with range requests) and the result goes to `writer`, not a file.
+    Only the small re-encoded AI segment touches the workspace.
+    """
+    segment_path = os.path.join(workdir, "ai_segment.mp4")
+    with metrics.span("encode"):
+        transcode_ai_segment(ai_clip_source, segment_path, profile=profile, source_audio=ai_clip_audio)
+    concat_segments_to_stream(
+        [intro_path, segment_path, outro_path],
+        writer,
+        os.path.join(workdir, "concat.txt"),
+    )
+    return writer
+
+
+def stitch_moviepy(intro_path, ai_clip_path, outro_path, output_path, profile=None):
+    """Original path: decodes everything and re-encodes the whole timeline."""
+    clip_intro = VideoFileClip(intro_path)
+    clip_outro = VideoFileClip(outro_path)
+    clip_ai_source = VideoFileClip(ai_clip_path)
+    clip_ai = clip_ai_source
+
+    try:
+        if clip_ai.duration < AI_SEGMENT_SECONDS:
+            clip_ai = clip_ai.loop(duration=AI_SEGMENT_SECONDS)
+        else:
+            clip_ai = clip_ai.subclip(0, AI_SEGMENT_SECONDS)
+
+        clip_ai = clip_ai.resize(newsize=clip_intro.size)
+
+        final = concatenate_videoclips([clip_intro, clip_ai, clip_outro], method="compose")
+        final.write_videofile(
+            output_path, codec="libx264", audio_codec="aac", fps=MEZZANINE_FPS, verbose=False, logger=None,
+            **get_profile(profile).moviepy_kwargs(),
+        )
+    finally:
+        for clip in (clip_intro, clip_outro, clip_ai_source):
+            clip.close()
+    return output_path
+
+
+# --- ADAPTIVE STREAMING ---
+def package_hls(source_path, output_dir, ladder=None, segment_seconds=HLS_SEGMENT_SECONDS, profile=None):
+    """
+    Encodes source_path into an fMP4 HLS ladder in one ffmpeg pass:
+    output_dir/master.m3u8 plus v<N>/index.m3u8, init.mp4 and seg_NNN.m4s per rung.
+    Returns the list of files written, relative to output_dir.
+    """
+    probe = probe_video(source_path)
+    source_height = probe["height"] or MEZZANINE_HEIGHT
+    rungs = [r for r in (ladder or HLS_LADDER) if r[0] <= source_height] or [min(ladder or HLS_LADDER)]
+    audio = probe["audio_codec"] is not None
+    # Every rung keyframes on the same frames, so players can switch at any segment boundary
+    gop = max(1, round((probe["fps"] or MEZZANINE_FPS) * segment_seconds))
+
+    splits = "".join(f"[s{i}]" for i in range(len(rungs)))
+    filters = [f"[0:v:0]split={len(rungs)}{splits}"]
+    args = ["-i", source_path]
+    stream_map = []
+    for i, (height, kbps) in enumerate(rungs):
+        filters.append(f"[s{i}]scale=-2:{height},setsar=1[v{i}]")
+        args += ["-map", f"[v{i}]"]
+        if audio:
+            args += ["-map", "0:a:0"]
+        args += [
+            f"-b:v:{i}", f"{kbps}k", f"-maxrate:v:{i}", f"{int(kbps * 1.1)}k", f"-bufsize:v:{i}", f"{kbps * 2}k",
+        ]
+        stream_map.append(f"v:{i},a:{i}" if audio else f"v:{i}")
+    args[2:2] = ["-filter_complex", ";".join(filters)]
+
+    args += [
+        "-c:v", "libx264", "-preset", get_profile(profile).preset, "-threads", str(encoder_threads()),
+        "-profile:v", "main", "-pix_fmt", "yuv420p",
+        "-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0",
+    ]
+    if audio:
+        args += ["-c:a", "aac", "-ar", "48000", "-ac", "2", "-b:a", "128k"]
+    args += [
+        "-f", "hls", "-hls_time", str(segment_seconds), "-hls_playlist_type", "vod",
+        "-hls_segment_type", "fmp4", "-hls_fmp4_init_filename", "init.mp4",
+        "-hls_segment_filename", os.path.join(output_dir, "v%v", "seg_%03d.m4s"),
+        "-master_pl_name", HLS_MASTER_PLAYLIST,
+        "-var_stream_map", " ".join(stream_map),
+        os.path.join(output_dir, "v%v", "index.m3u8"),
+    ]
+    os.makedirs(output_dir, exist_ok=True)
+    run_ffmpeg(args)
+
+    written = []
+    for root, _, files in os.walk(output_dir):
+        for name in files:
+            written.append(os.path.relpath(os.path.join(root, name), output_dir))
+    return sorted(written)
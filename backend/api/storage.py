@@ -0,0 +1,298 @@
+import base64
+import datetime
+import hashlib
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+
+# --- CONFIGURATION ---
+# "gcs" in production; "local" keeps everything on disk (tests, benchmarks, offline dev)
+STORAGE_BACKEND = os.environ.get("MANIFEST_STORAGE_BACKEND", "gcs")
+LOCAL_STORAGE_ROOT = os.environ.get("MANIFEST_LOCAL_STORAGE_ROOT", "/tmp/manifest_storage")
+# HTTP connections kept open to GCS; roughly one per concurrent job/request thread
+GCS_POOL_SIZE = int(os.environ.get("MANIFEST_GCS_POOL_SIZE", "32"))
+# Chunk size for streamed (resumable) uploads; GCS wants a multiple of 256 KiB
+UPLOAD_CHUNK_BYTES = int(os.environ.get("MANIFEST_UPLOAD_CHUNK_MB", "8")) * 1024 * 1024
+
+
+class BlobInfo:
+    """The metadata we care about, whichever backend it came from."""
+
+    def __init__(self, name, size, generation, md5_hash=None, content_type=None, updated=None):
+        self.name = name
+        self.size = size
+        self.generation = generation
+        self.md5_hash = md5_hash  # base64, same format GCS uses
+        self.content_type = content_type
+        self.updated = updated
+
+
+class StorageBackend:
+    """Everything the engine and views need from a bucket."""
+
+    def __init__(self, bucket_name):
+        self.bucket_name = bucket_name
+
+    def get_metadata(self, name):
+        """Returns a BlobInfo, or None if the object doesn't exist."""
+        raise NotImplementedError
+
+    def exists(self, name):
+        return self.get_metadata(name) is not None
+
+    def download(self, name, destination_file_name, generation=None):
+        """Downloads an object. Returns False (instead of raising) if it doesn't exist."""
+        raise NotImplementedError
+
+    def read_bytes(self, name, start=0, end=None):
+        """Ranged read; `end` is inclusive like an HTTP Range header. Returns None if missing."""
+        raise NotImplementedError
+
+    def upload_file(self, source_file_name, name, content_type=None):
+        """Uploads a local file. Returns the new object's BlobInfo."""
+        raise NotImplementedError
+
+    def upload_bytes(self, data, name, content_type=None):
+        """Uploads bytes. Returns the new object's BlobInfo."""
+        raise NotImplementedError
+
+    def open_writer(self, name, content_type=None):
+        """
+        Context manager yielding a writable file object for a new object. The
+        object only appears if the block finishes; on an exception nothing is committed.
+        """
+        raise NotImplementedError
+
+    def list(self, prefix):
+        """Returns BlobInfos for every object under prefix."""
+        raise NotImplementedError
+
+    def delete(self, name):
+        raise NotImplementedError
+
+    def signed_url(self, name, expiration, method="GET", content_type=None):
+        raise NotImplementedError
+
+
+# --- GOOGLE CLOUD STORAGE ---
+_gcs_client = None
+_gcs_client_lock = threading.Lock()
+
+
+def gcs_client():
+    """
+    One storage.Client per process, on a pooled HTTP session so every
+    download/upload reuses warm TLS connections instead of opening new ones.
+    """
+    global _gcs_client
+    with _gcs_client_lock:
+        if _gcs_client is None:
+            import google.auth
+            import requests
+            from google.auth.transport.requests import AuthorizedSession
+            from google.cloud import storage
+
+            credentials, project = google.auth.default(
+                scopes=["https://www.googleapis.com/auth/devstorage.read_write"]
+            )
+            session = AuthorizedSession(credentials)
+            adapter = requests.adapters.HTTPAdapter(pool_connections=GCS_POOL_SIZE, pool_maxsize=GCS_POOL_SIZE)
+            session.mount("https://", adapter)
+            _gcs_client = storage.Client(project=project, credentials=credentials, _http=session)
+        return _gcs_client
+
+
+class GCSStorage(StorageBackend):
+
+    def __init__(self, bucket_name, client=None):
+        super().__init__(bucket_name)
+        self.client = client or gcs_client()
+        self.bucket = self.client.bucket(bucket_name)
+
+    @staticmethod
+    def _info(blob):
+        return BlobInfo(blob.name, blob.size, blob.generation, blob.md5_hash, blob.content_type, blob.updated)
+
+    def get_metadata(self, name):
+        blob = self.bucket.get_blob(name)
+        return self._info(blob) if blob else None
+
+    def download(self, name, destination_file_name, generation=None):
+        from google.api_core.exceptions import NotFound
+
+        # No exists() round-trip first: just try, and treat 404 as "missing"
+        try:
+            self.bucket.blob(name, generation=generation).download_to_filename(destination_file_name)
+        except NotFound:
+            if os.path.exists(destination_file_name):
+                os.remove(destination_file_name)
+            print(f"⚠️ Warning: {name} not found.")
+            return False
+        return True
+
+    def read_bytes(self, name, start=0, end=None):
+        from google.api_core.exceptions import NotFound
+
+        try:
+            return self.bucket.blob(name).download_as_bytes(start=start, end=end)
+        except NotFound:
+            return None
+
+    def upload_file(self, source_file_name, name, content_type=None):
+        blob = self.bucket.blob(name)
+        blob.upload_from_filename(source_file_name, content_type=content_type)
+        return self._info(blob)
+
+    def upload_bytes(self, data, name, content_type=None):
+        blob = self.bucket.blob(name)
+        blob.upload_from_string(data, content_type=content_type)
+        return self._info(blob)
+
+    @contextmanager
+    def open_writer(self, name, content_type=None):
+        # A resumable upload sent UPLOAD_CHUNK_BYTES at a time; only close() finalizes
+        # the object, so an abandoned session (exception in the block) leaves nothing behind
+        writer = self.bucket.blob(name, chunk_size=UPLOAD_CHUNK_BYTES).open(
+            "wb", content_type=content_type, ignore_flush=True,
+        )
+        yield writer
+        writer.close()
+
+    def list(self, prefix):
+        return [self._info(blob) for blob in self.client.list_blobs(self.bucket_name, prefix=prefix)]
+
+    def delete(self, name):
+        self.bucket.blob(name).delete()
+
+    def signed_url(self, name, expiration, method="GET", content_type=None):
+        return self.bucket.blob(name).generate_signed_url(
+            version="v4", expiration=expiration, method=method, content_type=content_type,
+        )
+
+
+# --- LOCAL FILESYSTEM ---
+class LocalStorage(StorageBackend):
+    """
+    Same interface, backed by a directory. Objects live at <root>/<bucket>/<name>;
+    the file's mtime stands in for the GCS generation.
+    """
+
+    def __init__(self, bucket_name, root=LOCAL_STORAGE_ROOT):
+        super().__init__(bucket_name)
+        self.root = os.path.join(root, bucket_name)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, name):
+        path = os.path.normpath(os.path.join(self.root, name))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"Invalid object name: {name}")
+        return path
+
+    def _info(self, name, path):
+        stat = os.stat(path)
+        md5 = hashlib.md5()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                md5.update(chunk)
+        return BlobInfo(
+            name, stat.st_size, stat.st_mtime_ns,
+            base64.b64encode(md5.digest()).decode(),
+            updated=datetime.datetime.fromtimestamp(stat.st_mtime, tz=datetime.timezone.utc),
+        )
+
+    def get_metadata(self, name):
+        path = self._path(name)
+        return self._info(name, path) if os.path.isfile(path) else None
+
+    def download(self, name, destination_file_name, generation=None):
+        path = self._path(name)
+        if not os.path.isfile(path):
+            print(f"⚠️ Warning: {name} not found.")
+            return False
+        shutil.copyfile(path, destination_file_name)
+        return True
+
+    def read_bytes(self, name, start=0, end=None):
+        path = self._path(name)
+        if not os.path.isfile(path):
+            return None
+        with open(path, "rb") as f:
+            f.seek(start)
+            return f.read() if end is None else f.read(end - start + 1)
+
+    def _write(self, name, write):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = f"{path}.part"
+        write(part_path)
+        os.replace(part_path, path)
+        return self._info(name, path)
+
+    def upload_file(self, source_file_name, name, content_type=None):
+        return self._write(name, lambda dest: shutil.copyfile(source_file_name, dest))
+
+    def upload_bytes(self, data, name, content_type=None):
+        def write(dest):
+            with open(dest, "wb") as f:
+                f.write(data)
+        return self._write(name, write)
+
+    @contextmanager
+    def open_writer(self, name, content_type=None):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        part_path = f"{path}.part"
+        try:
+            with open(part_path, "wb") as f:
+                yield f
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        os.replace(part_path, path)
+
+    def list(self, prefix):
+        results = []
+        for folder, _, files in os.walk(self.root):
+            for filename in files:
+                if filename.endswith(".part"):
+                    continue
+                path = os.path.join(folder, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if name.startswith(prefix):
+                    results.append(self._info(name, path))
+        return sorted(results, key=lambda info: info.name)
+
+    def delete(self, name):
+        os.remove(self._path(name))
+
+    def signed_url(self, name, expiration, method="GET", content_type=None):
+        return "file://" + quote(self._path(name))
+
+
+# --- FACTORY ---
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_storage(bucket_name):
+    """Returns the process-wide storage backend for a bucket."""
+    with _backends_lock:
+        backend = _backends.get(bucket_name)
+        if backend is None:
+            if STORAGE_BACKEND == "local":
+                backend = LocalStorage(bucket_name)
+            elif STORAGE_BACKEND == "gcs":
+                backend = GCSStorage(bucket_name)
+            else:
+                raise ValueError(f"Unknown MANIFEST_STORAGE_BACKEND: {STORAGE_BACKEND}")
+            _backends[bucket_name] = backend
+        return backend
+
+
+def set_storage(bucket_name, backend):
+    """Swaps in a backend for a bucket (benchmarks, local runs)."""
+    with _backends_lock:
+        _backends[bucket_name] = backend
@@ -1,51 +1,273 @@
 import os
 import json
 import logging
-from google.cloud import tasks_v2
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
-WORKER_URL = os.environ["WORKER_URL"]
-WORKER_SECRET = os.environ["WORKER_SECRET"]
+from celery import shared_task
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+# --- CONFIGURATION ---
+PROJECT = "manifest-me-app"
+LOCATION = "us-central1"
+QUEUE = "video-generation-queue"
+# Celery queue the video worker consumes (start_worker.sh passes it to -Q)
+VIDEO_QUEUE = "video"
+# How long Celery waits before retrying a job another worker is still running
+BUSY_RETRY_SECONDS = int(os.environ.get("MANIFEST_BUSY_RETRY_SECONDS", "60"))
+FAILED_RETRY_SECONDS = int(os.environ.get("MANIFEST_FAILED_RETRY_SECONDS", "30"))
+MAX_JOB_RETRIES = int(os.environ.get("MANIFEST_MAX_JOB_RETRIES", "5"))
+# Cloud Tasks has no batch-create RPC, so a batch fans out over this many threads
+ENQUEUE_CONCURRENCY = int(os.environ.get("MANIFEST_ENQUEUE_CONCURRENCY", "16"))
 
 # Set up a logger that Google Cloud can see easily
 logger = logging.getLogger(__name__)
 
-def enqueue_video_task(job_id, template_name, user_id):
-    print(f"DEBUG STEP 1: Entering enqueue_video_task for job {job_id}")
-    
-    try:
-        client = tasks_v2.CloudTasksClient()
-        print("DEBUG STEP 2: CloudTasksClient initialized")
 
-        project = "manifest-me-app"
-        queue = "video-generation-queue"
-        location = "us-central1"
-        url = WORKER_URL
+def task_name(job_id, dispatch=None):
+    """
+    Name for one dispatch of a job. Cloud Tasks keeps a finished task's name
+    reserved for a while, so a job dispatched again needs a new one.
+    """
+    return f"video-{job_id}-{dispatch}" if dispatch else f"video-{job_id}"
 
-        parent = client.queue_path(project, location, queue)
 
-        payload = {
-            "job_id": str(job_id),
-            "template_name": template_name,
-            "user_id": user_id
-        }
+def task_payload(job_id, template_name, user_id):
+    return {
+        "job_id": str(job_id),
+        "template_name": template_name,
+        "user_id": user_id
+    }
+
+
+_tasks_client = None
+_tasks_client_lock = threading.Lock()
 
-        task_name = client.task_path(project, location, queue, f"video-{job_id}")
 
-        task = {
-            "name": task_name,
+def tasks_client():
+    """One CloudTasksClient per process: the gRPC channel and auth are set up once."""
+    global _tasks_client
+    with _tasks_client_lock:
+        if _tasks_client is None:
+            from google.cloud import tasks_v2
+            _tasks_client = tasks_v2.CloudTasksClient()
+        return _tasks_client
+
+
+class CloudTasksQueue:
+    """Each job becomes an HTTP task that POSTs to the worker endpoint."""
+
+    def __init__(self, worker_url=None, worker_secret=None, client=None):
+        self.worker_url = worker_url or os.environ["WORKER_URL"]
+        self.worker_secret = worker_secret or os.environ["WORKER_SECRET"]
+        self.client = client or tasks_client()
+        self.parent = self.client.queue_path(PROJECT, LOCATION, QUEUE)
+
+    def _task(self, job_id, template_name, user_id, dispatch=None):
+        from google.cloud import tasks_v2
+        return {
+            # Named after the job and dispatch, so a repeated enqueue can't run it twice
+            "name": self.client.task_path(PROJECT, LOCATION, QUEUE, task_name(job_id, dispatch)),
             "http_request": {
                 "http_method": tasks_v2.HttpMethod.POST,
-                "url": url,
+                "url": self.worker_url,
                 "headers": {
                     "Content-Type": "application/json",
-                    "X-Worker-Secret": WORKER_SECRET,
+                    "X-Worker-Secret": self.worker_secret,
                 },
-                "body": json.dumps(payload).encode("utf-8"),
+                "body": json.dumps(task_payload(job_id, template_name, user_id)).encode("utf-8"),
             }
         }
-        client.create_task(request={"parent": parent, "task": task})
-        
+
+    def enqueue(self, job_id, template_name, user_id, dispatch=None):
+        from google.api_core.exceptions import AlreadyExists
+
+        task = self._task(job_id, template_name, user_id, dispatch)
+        try:
+            self.client.create_task(request={"parent": self.parent, "task": task})
+        except AlreadyExists:
+            if dispatch is None:
+                raise
+            # This same dispatch was already created (a retried create call): it will run
+            print(f"ℹ️ Task for job {job_id} (dispatch {dispatch}) already exists")
+
+    def enqueue_many(self, jobs):
+        """
+        Enqueues (job_id, template_name, user_id[, dispatch]) tuples over the shared client.
+        Returns [(job_id, error)] for the ones that failed.
+        """
+        def attempt(job):
+            try:
+                self.enqueue(*job)
+                return None
+            except Exception as e:
+                return job[0], e
+
+        jobs = list(jobs)
+        if not jobs:
+            return []
+        with ThreadPoolExecutor(max_workers=min(ENQUEUE_CONCURRENCY, len(jobs))) as pool:
+            return [failure for failure in pool.map(attempt, jobs) if failure]
+
+
+class InMemoryTaskQueue:
+    """
+    Same interface as CloudTasksQueue, but tasks wait in a local deque until
+    someone drains them. For load tests and running without GCP.
+    """
+
+    def __init__(self):
+        self.tasks = deque()
+        self._lock = threading.Lock()
+
+    def enqueue(self, job_id, template_name, user_id, dispatch=None):
+        with self._lock:
+            self.tasks.append(task_payload(job_id, template_name, user_id))
+
+    def enqueue_many(self, jobs):
+        with self._lock:
+            self.tasks.extend(task_payload(*job[:3]) for job in jobs)
+        return []
+
+    def pop(self):
+        with self._lock:
+            return self.tasks.popleft() if self.tasks else None
+
+    def drain(self, handler=None):
+        """Runs queued tasks until the queue is empty; returns their (payload, status) results."""
+        if handler is None:
+            from .jobs import run_video_job
+
+            def handler(task):
+                return run_video_job(task["job_id"], task["template_name"], task["user_id"])
+
+        results = []
+        while (task := self.pop()) is not None:
+            results.append(handler(task))
+        return results
+
+    def __len__(self):
+        with self._lock:
+            return len(self.tasks)
+
+
+@shared_task(bind=True, name="api.run_video_job", acks_late=True, reject_on_worker_lost=True,
+             ignore_result=True, max_retries=MAX_JOB_RETRIES)
+def run_video_job_task(self, job_id, template_name, user_id):
+    """The Celery side of a job: runs it in the worker, no HTTP hop to /api/worker/."""
+    from .jobs import run_video_job
+
+    payload, status_code = run_video_job(job_id, template_name, user_id)
+    if status_code == 409:
+        # Same contract as Cloud Tasks: try later, by then a dead worker's lease has expired
+        raise self.retry(countdown=BUSY_RETRY_SECONDS)
+    if status_code >= 500:
+        raise self.retry(countdown=FAILED_RETRY_SECONDS * (self.request.retries + 1))
+    return payload
+
+
+class CeleryQueue:
+    """Publishes jobs to the Redis broker for `celery -A core worker -Q video`."""
+
+    def enqueue(self, job_id, template_name, user_id, dispatch=None, producer=None):
+        run_video_job_task.apply_async(
+            args=[str(job_id), template_name, user_id],
+            queue=VIDEO_QUEUE,
+            task_id=task_name(job_id, dispatch),
+            producer=producer,
+        )
+
+    def enqueue_many(self, jobs):
+        """Publishes every job over one broker connection."""
+        failures = []
+        with run_video_job_task.app.producer_or_acquire() as producer:
+            for job in jobs:
+                try:
+                    self.enqueue(*job, producer=producer)
+                except Exception as e:
+                    failures.append((job[0], e))
+        return failures
+
+
+class EagerQueue:
+    """
+    Runs jobs on a thread pool inside this process: no broker, no worker
+    service. The enqueueing request still returns immediately.
+    """
+
+    def __init__(self, max_workers=None):
+        from .workspace import MAX_CONCURRENT_JOBS
+        self.pool = ThreadPoolExecutor(max_workers=max_workers or MAX_CONCURRENT_JOBS,
+                                       thread_name_prefix="eager-job")
+
+    def _run(self, job_id, template_name, user_id):
+        from .jobs import run_video_job
+        try:
+            return run_video_job(job_id, template_name, user_id)
+        finally:
+            # Pool threads outlive the job; don't leave their DB connections open
+            connections.close_all()
+
+    def enqueue(self, job_id, template_name, user_id, dispatch=None):
+        return self.pool.submit(self._run, str(job_id), template_name, user_id)
+
+    def enqueue_many(self, jobs):
+        for job in jobs:
+            self.enqueue(*job)
+        return []
+
+
+QUEUE_BACKENDS = {
+    "cloudtasks": CloudTasksQueue,
+    "celery": CeleryQueue,
+    "eager": EagerQueue,
+    "memory": InMemoryTaskQueue,
+}
+
+_task_queue = None
+_task_queue_lock = threading.Lock()
+
+
+def get_task_queue():
+    """The process-wide queue, picked by settings.JOB_QUEUE_BACKEND."""
+    global _task_queue
+    with _task_queue_lock:
+        if _task_queue is None:
+            backend = getattr(settings, "JOB_QUEUE_BACKEND", "cloudtasks")
+            if backend not in QUEUE_BACKENDS:
+                raise ValueError(f"Unknown JOB_QUEUE_BACKEND: {backend}")
+            _task_queue = QUEUE_BACKENDS[backend]()
+        return _task_queue
+
+
+def set_task_queue(queue):
+    """Swaps the process-wide queue (e.g. an InMemoryTaskQueue for a load test)."""
+    global _task_queue
+    with _task_queue_lock:
+        _task_queue = queue
+
+
+def enqueue_video_task(job_id, template_name, user_id):
+    try:
+        get_task_queue().enqueue(job_id, template_name, user_id)
+        metrics.ENQUEUES.inc(outcome="ok")
     except Exception as e:
-        print(f"❌ DEBUG ERROR in tasks.py: {str(e)}")
+        metrics.ENQUEUES.inc(outcome="failed")
+        print(f"❌ ERROR in tasks.py: {str(e)}")
         # Re-raise the error so the View knows it failed
-        raise e
\ No newline at end of file
+        raise e
+
+
+def enqueue_video_tasks(jobs):
+    """Enqueues many jobs in one call. Returns [(job_id, error)] for the failures."""
+    jobs = list(jobs)
+    failures = get_task_queue().enqueue_many(jobs)
+    metrics.ENQUEUES.inc(len(jobs) - len(failures), outcome="ok")
+    metrics.ENQUEUES.inc(len(failures), outcome="failed")
+    for job_id, error in failures:
+        print(f"❌ ERROR in tasks.py: job {job_id}: {error}")
+    return failures
@@ -0,0 +1,215 @@
+import glob
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import quote, unquote
+
+# --- CONFIGURATION ---
+CACHE_DIR = os.environ.get("MANIFEST_TEMPLATE_CACHE_DIR", "/tmp/manifest_template_cache")
+CACHE_MAX_BYTES = int(os.environ.get("MANIFEST_TEMPLATE_CACHE_MB", "1024")) * 1024 * 1024
+# Within this window a cached file is trusted without asking GCS at all
+REVALIDATE_SECONDS = int(os.environ.get("MANIFEST_TEMPLATE_REVALIDATE_SECONDS", "300"))
+
+
+class CacheEntry:
+    def __init__(self, blob_name, generation, path, size):
+        self.blob_name = blob_name
+        self.generation = generation
+        self.path = path
+        self.size = size
+        self.checked_at = 0.0
+
+
+class TemplateCache:
+    """
+    Local disk cache for template assets (intro/outro clips).
+    Files are keyed by blob name + GCS generation, so a re-uploaded template
+    is picked up automatically, and the least recently used files are
+    evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, revalidate_seconds=REVALIDATE_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.revalidate_seconds = revalidate_seconds
+
+        self._entries = OrderedDict()  # blob_name -> CacheEntry, most recent last
+        self._lock = threading.Lock()
+        self._blob_locks = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+        os.makedirs(self.root, exist_ok=True)
+        self._load_index()
+
+    # --- DISK LAYOUT ---
+    def _entry_path(self, blob_name, generation):
+        return os.path.join(self.root, f"{quote(blob_name, safe='')}@{generation}")
+
+    def _load_index(self):
+        """Picks up files a previous process left behind (e.g. gunicorn restarts)."""
+        for name in sorted(os.listdir(self.root), key=lambda n: os.path.getmtime(os.path.join(self.root, n))):
+            if "@" not in name or "." in name.rsplit("@", 1)[1]:
+                continue
+            quoted, generation = name.rsplit("@", 1)
+            path = os.path.join(self.root, name)
+            size = sum(os.path.getsize(p) for p in [path] + glob.glob(glob.escape(path) + ".*"))
+            entry = CacheEntry(unquote(quoted), int(generation), path, size)
+            old = self._entries.pop(entry.blob_name, None)
+            if old:
+                self._remove_files(old)
+            self._entries[entry.blob_name] = entry
+
+    def _remove_files(self, entry):
+        # Derived files (e.g. normalized copies) live next to the entry as "<path>.<suffix>"
+        for path in [entry.path] + glob.glob(glob.escape(entry.path) + ".*"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _blob_lock(self, blob_name):
+        with self._lock:
+            return self._blob_locks.setdefault(blob_name, threading.Lock())
+
+    # --- PUBLIC API ---
+    def get(self, storage, blob_name):
+        """
+        Returns the local path of a cached copy of blob_name, downloading it if
+        needed. Returns None if the blob doesn't exist.
+        """
+        with self._blob_lock(blob_name):
+            with self._lock:
+                entry = self._entries.get(blob_name)
+                if entry and time.time() - entry.checked_at < self.revalidate_seconds:
+                    self._entries.move_to_end(blob_name)
+                    self.hits += 1
+                    return entry.path
+
+            # Cheap revalidation: one metadata GET, no bytes
+            blob = storage.get_metadata(blob_name)
+            with self._lock:
+                self.revalidations += 1
+            if blob is None:
+                print(f"⚠️ Warning: {blob_name} not found.")
+                self.invalidate(blob_name)
+                return None
+
+            with self._lock:
+                entry = self._entries.get(blob_name)
+                if entry and entry.generation == blob.generation:
+                    entry.checked_at = time.time()
+                    self._entries.move_to_end(blob_name)
+                    self.hits += 1
+                    return entry.path
+                self.misses += 1
+
+            return self._download(storage, blob, entry)
+
+    def get_derived(self, storage, blob_name, suffix, build):
+        """
+        Returns the path of a file derived from blob_name (e.g. a normalized
+        copy), calling build(source_path, derived_path) the first time.
+        Derived files share the entry's lifetime and count toward its size.
+        """
+        path = self.get(storage, blob_name)
+        if path is None:
+            return None
+
+        derived_path = f"{path}.{suffix}"
+        with self._blob_lock(f"{blob_name}#{suffix}"):
+            if not os.path.exists(derived_path):
+                print(f"🛠️ Building {suffix} for {blob_name}...")
+                build(path, derived_path)
+                with self._lock:
+                    entry = self._entries.get(blob_name)
+                    if entry and entry.path == path:
+                        entry.size += os.path.getsize(derived_path)
+                self._evict()
+        return derived_path
+
+    def fetch(self, storage, blob_name, destination_file_name, suffix=None, build=None):
+        """
+        Places a cached copy of blob_name (or of its derived `suffix` file) at
+        destination_file_name. Returns False if the blob doesn't exist.
+        """
+        if suffix:
+            path = self.get_derived(storage, blob_name, suffix, build)
+        else:
+            path = self.get(storage, blob_name)
+        if path is None:
+            return False
+
+        # A hard link is free and keeps the file alive even if it gets evicted mid-job
+        if os.path.exists(destination_file_name):
+            os.remove(destination_file_name)
+        try:
+            os.link(path, destination_file_name)
+        except FileNotFoundError:
+            # Evicted between lookup and link: forget it and fetch again
+            self.invalidate(blob_name)
+            return self.fetch(storage, blob_name, destination_file_name, suffix, build)
+        except OSError:
+            shutil.copyfile(path, destination_file_name)
+        return True
+
+    def invalidate(self, blob_name):
+        with self._lock:
+            entry = self._entries.pop(blob_name, None)
+        if entry:
+            self._remove_files(entry)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": sum(e.size for e in self._entries.values()),
+            }
+
+    # --- INTERNALS ---
+    def _download(self, storage, blob, stale_entry):
+        path = self._entry_path(blob.name, blob.generation)
+        part_path = f"{path}.part"
+        print(f"📥 Caching template asset {blob.name} (generation {blob.generation})...")
+
+        # Pinned to the generation we just looked up
+        if not storage.download(blob.name, part_path, generation=blob.generation):
+            return None
+        os.replace(part_path, path)
+
+        entry = CacheEntry(blob.name, blob.generation, path, os.path.getsize(path))
+        entry.checked_at = time.time()
+        with self._lock:
+            self._entries[blob.name] = entry
+            self._entries.move_to_end(blob.name)
+        if stale_entry and stale_entry.path != path:
+            self._remove_files(stale_entry)
+
+        self._evict()
+        return path
+
+    def _evict(self):
+        with self._lock:
+            victims = []
+            total = sum(e.size for e in self._entries.values())
+            # Always keep the newest entry, even if it alone is over budget
+            while total > self.max_bytes and len(self._entries) > 1:
+                _, victim = self._entries.popitem(last=False)
+                total -= victim.size
+                victims.append(victim)
+                self.evictions += 1
+        for victim in victims:
+            print(f"🧹 Evicting cached template {victim.blob_name}")
+            self._remove_files(victim)
+
+
+template_cache = TemplateCache()
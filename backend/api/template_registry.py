@@ -0,0 +1,145 @@
+import json
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from . import stitch
+from .template_cache import template_cache
+
+# --- CONFIGURATION ---
+REGISTRY_PATH = os.environ.get(
+    "MANIFEST_TEMPLATE_REGISTRY", os.path.join(os.path.dirname(__file__), "templates.json")
+)
+PREWARM_CONCURRENCY = int(os.environ.get("MANIFEST_PREWARM_CONCURRENCY", "4"))
+PROBE_SUFFIX = "probe.json"
+
+
+class Template:
+    """One entry of templates.json, plus what prewarming learned about its clips."""
+
+    def __init__(self, name, base_prompt, intro, outro, keywords=(), default=False, encoding_profile=None):
+        self.name = name
+        self.base_prompt = base_prompt
+        self.intro = intro
+        self.outro = outro
+        self.keywords = [k.lower() for k in keywords]
+        self.default = default
+        self.encoding_profile = encoding_profile  # see encoding.PROFILES; None = deployment default
+        self.metadata = {}  # "intro"/"outro" -> probe_video() result
+
+    @property
+    def assets(self):
+        return {"intro": self.intro, "outro": self.outro}
+
+    @property
+    def fallback_clip(self):
+        """Shown in place of the AI segment when generation fails."""
+        return self.intro
+
+    def probe_for(self, blob_name):
+        """The loaded probe result for one of this template's clips, or None."""
+        for role, name in self.assets.items():
+            if name == blob_name:
+                return self.metadata.get(role)
+        return None
+
+
+class TemplateRegistry:
+    """
+    Templates in routing order. A prompt goes to the first template with a
+    keyword anywhere in it, or to the default template.
+    """
+
+    def __init__(self, templates):
+        self.templates = OrderedDict((t.name, t) for t in templates)
+        defaults = [t for t in templates if t.default]
+        self.default = defaults[0] if defaults else templates[-1]
+        self._compile()
+
+    @classmethod
+    def from_file(cls, path=REGISTRY_PATH):
+        with open(path) as f:
+            return cls([Template(**entry) for entry in json.load(f)])
+
+    def _compile(self):
+        # One pattern for every keyword, alternatives in template order. The
+        # lookahead reports a match at every position (overlaps included), and at
+        # each position the alternation prefers the earliest template, so taking
+        # the lowest index seen keeps "first template wins" with a single scan.
+        self._keyword_rank = {}
+        for rank, template in enumerate(self.templates.values()):
+            for keyword in template.keywords:
+                self._keyword_rank.setdefault(keyword, rank)
+        ordered = sorted(self._keyword_rank, key=self._keyword_rank.get)
+        self._pattern = re.compile("(?=(" + "|".join(map(re.escape, ordered)) + "))") if ordered else None
+        self._by_rank = list(self.templates.values())
+
+    def route(self, prompt):
+        if self._pattern is None:
+            return self.default
+        best = None
+        for match in self._pattern.finditer(prompt.lower()):
+            rank = self._keyword_rank[match.group(1)]
+            if best is None or rank < best:
+                best = rank
+                if best == 0:
+                    break
+        return self._by_rank[best] if best is not None else self.default
+
+    def get(self, name):
+        """The named template; unknown names get the default, as the old else-branch did."""
+        return self.templates.get(name, self.default)
+
+    def __iter__(self):
+        return iter(self.templates.values())
+
+
+def _write_probe(source_path, probe_path):
+    with open(probe_path, "w") as f:
+        json.dump(stitch.probe_video(source_path), f)
+
+
+def load_metadata(storage, template):
+    """
+    Probes the template's clips (once per template version; cached next to them).
+    Prewarming does the probing; workers call this per job and just read the cached probe.json.
+    """
+    for role, blob_name in template.assets.items():
+        path = template_cache.get_derived(storage, blob_name, PROBE_SUFFIX, _write_probe)
+        if path:
+            with open(path) as f:
+                template.metadata[role] = json.load(f)
+    return template.metadata
+
+
+def prewarm(storage, templates=None, mezzanine=None):
+    """
+    Downloads, probes and (for the ffmpeg stitch) normalizes every template
+    clip into the local template cache, so no job pays for it.
+    Returns {template name: error or None}.
+    """
+    templates = list(templates or registry)
+    if mezzanine is None:
+        mezzanine = stitch.STITCH_MODE == "ffmpeg"
+
+    def warm(template):
+        try:
+            for blob_name in template.assets.values():
+                if template_cache.get(storage, blob_name) is None:
+                    raise FileNotFoundError(blob_name)
+            load_metadata(storage, template)
+            if mezzanine:
+                for blob_name in template.assets.values():
+                    template_cache.get_derived(
+                        storage, blob_name, stitch.MEZZANINE_SUFFIX, stitch.normalize_to_mezzanine,
+                    )
+            return None
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=PREWARM_CONCURRENCY) as pool:
+        return dict(zip((t.name for t in templates), pool.map(warm, templates)))
+
+
+registry = TemplateRegistry.from_file()
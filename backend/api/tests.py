@@ -1,3 +1,1314 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import uuid
+import time
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (avatars, engine, events, generation_cache, metrics, scheduler, status_cache, stitch, storage, tasks,
+               template_registry)
+from .avatars import avatar_path
+from .fakes import FakeCloudTasksClient, FakeGenaiClient, FakeOperation
+from .images import AvatarUploadHandler, normalize_image
+from .jobs import run_video_job
+from .models import Profile, Video
+from .operations import OperationTimeout, OperationTracker
+from .references import PreparedReferenceCache
+from .signing import SignedUrlCache
+from .storage import LocalStorage, get_storage, set_storage
+from .template_cache import TemplateCache
+from .template_registry import Template, TemplateRegistry
+from .tasks import CeleryQueue, CloudTasksQueue, EagerQueue, InMemoryTaskQueue, set_task_queue
+
+
+class LocalBucketMixin:
+    """Points the engine's bucket at a throwaway LocalStorage for the test."""
+
+    def setUp(self):
+        super().setUp()
+        self.bucket_root = tempfile.mkdtemp(prefix="manifest_test_bucket_")
+        previous = storage._backends.get(engine.BUCKET_NAME)
+        self.bucket = LocalStorage(engine.BUCKET_NAME, root=self.bucket_root)
+        set_storage(engine.BUCKET_NAME, self.bucket)
+        self.addCleanup(set_storage, engine.BUCKET_NAME, previous)
+        self.addCleanup(shutil.rmtree, self.bucket_root, True)
+
+        self.queue = InMemoryTaskQueue()
+        set_task_queue(self.queue)
+        self.addCleanup(set_task_queue, None)
+
+class FlakyGenaiClient(FakeGenaiClient):
+    """Fails its next `failures` status polls with `error`."""
+
+    def __init__(self, failures, error, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.error = error
+
+    def _get(self, operation):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        return super()._get(operation)
+
+
+class OperationTrackerTests(TestCase):
+
+    def _submit(self, client):
+        return client.models.generate_videos(model="fake", prompt="p", config=SimpleNamespace(output_gcs_uri=None))
+
+    def test_polls_with_backoff_until_done(self):
+        client = FakeGenaiClient(delay=0.3)
+        tracker = OperationTracker(lambda: client, initial_delay=0.02, max_delay=0.08, multiplier=2, jitter=0)
+        poll_times = []
+
+        operation = tracker.wait(self._submit(client), on_poll=lambda op: poll_times.append(time.monotonic()))
+
+        self.assertTrue(operation.done)
+        # 0.02 + 0.04 + 0.08 + 0.08 + ... : a handful of polls, not one every 20ms
+        self.assertLessEqual(client.polls, 8)
+        self.assertEqual(tracker.polls, client.polls)
+        gaps = [b - a for a, b in zip(poll_times, poll_times[1:])]
+        self.assertGreater(gaps[0], 0.03)
+        self.assertEqual(tracker.in_flight, 0)
+
+    def test_times_out(self):
+        client = FakeGenaiClient(delay=60)
+        tracker = OperationTracker(lambda: client, initial_delay=0.02, max_delay=0.02, jitter=0, timeout=0.1)
+
+        with self.assertRaises(OperationTimeout):
+            tracker.wait(self._submit(client))
+        self.assertEqual(tracker.in_flight, 0)
+
+    def test_retries_transient_poll_errors(self):
+        client = FlakyGenaiClient(2, ConnectionError("connection reset"), delay=0.05)
+        tracker = OperationTracker(lambda: client, initial_delay=0.01, max_delay=0.02, jitter=0)
+
+        operation = tracker.wait(self._submit(client))
+
+        self.assertTrue(operation.done)
+        self.assertEqual(tracker.poll_errors, 2)
+
+    def test_retryable_status_codes_are_transient(self):
+        unavailable = Exception("503 UNAVAILABLE")
+        unavailable.code = 503
+        client = FlakyGenaiClient(1, unavailable, delay=0)
+        tracker = OperationTracker(lambda: client, initial_delay=0.01, jitter=0)
+
+        self.assertTrue(tracker.wait(self._submit(client)).done)
+
+    def test_transient_errors_still_time_out(self):
+        client = FlakyGenaiClient(1000, TimeoutError("read timeout"), delay=0)
+        tracker = OperationTracker(lambda: client, initial_delay=0.02, max_delay=0.02, jitter=0, timeout=0.1)
+
+        with self.assertRaises(OperationTimeout):
+            tracker.wait(self._submit(client))
+
+    def test_permanent_errors_are_not_retried(self):
+        forbidden = Exception("403 PERMISSION_DENIED")
+        forbidden.code = 403
+        client = FlakyGenaiClient(1, forbidden, delay=0)
+        tracker = OperationTracker(lambda: client, initial_delay=0.01, jitter=0)
+
+        with self.assertRaises(Exception) as raised:
+            tracker.wait(self._submit(client))
+        self.assertIs(raised.exception, forbidden)
+        self.assertEqual(tracker.poll_errors, 0)
+
+    def test_unknown_operation_raises(self):
+        client = FakeGenaiClient(delay=0)
+        tracker = OperationTracker(lambda: client, initial_delay=0.01, jitter=0)
+
+        with self.assertRaises(ValueError):
+            tracker.wait(FakeOperation("projects/fake/locations/local/operations/404"))
+
+class FakePipelineMixin(LocalBucketMixin):
+    """Runs jobs against a fake Veo and no ffmpeg, so tests exercise the pipeline's control flow."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username="pipeline@example.com")
+        self.template = engine.template_registry.default
+
+    def _fake_media(self):
+        """Stand-ins for the ffmpeg work."""
+
+        def fetch_template_clip(blob_name, destination_file_name, mezzanine):
+            with open(destination_file_name, "wb") as f:
+                f.write(b"template")
+            return mezzanine
+
+        def stitch_ffmpeg(intro_path, ai_clip_path, outro_path, output_path, workdir, **kwargs):
+            with open(output_path, "wb") as f:
+                f.write(b"final")
+
+        return [
+            mock.patch.object(engine, "fetch_template_clip", side_effect=fetch_template_clip),
+            mock.patch.object(stitch, "stitch_ffmpeg", side_effect=stitch_ffmpeg),
+            mock.patch.object(stitch, "STITCH_MODE", "ffmpeg"),
+            mock.patch.object(stitch, "STREAMING_IO", False),
+            mock.patch.object(stitch, "HLS_OUTPUT", False),
+            mock.patch.object(engine.operation_tracker, "initial_delay", 0.01),
+            mock.patch.object(engine.operation_tracker, "max_delay", 0.01),
+        ]
+
+    def _start(self, client):
+        for patch in self._fake_media() + [mock.patch.object(engine, "client", client)]:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def _deliver(self, output_gcs_uri):
+        self.bucket.upload_bytes(b"clip", output_gcs_uri.split("/", 3)[3] + "sample_0.mp4")
+
+    def _run(self, video):
+        return run_video_job(str(video.id), self.template.name, str(self.user.id))
+
+
+class CheckpointResumeTests(FakePipelineMixin, TestCase):
+
+    def test_submitted_job_reattaches_instead_of_resubmitting(self):
+        client = FakeGenaiClient(delay=0.05, on_complete=self._deliver)
+        prefix = "generated/resume-test/"
+        # The first attempt submitted, checkpointed, then died
+        operation = client.models.generate_videos(
+            model=engine.VEO_MODEL, prompt="p",
+            config=SimpleNamespace(output_gcs_uri=f"gs://{engine.BUCKET_NAME}/{prefix}"),
+        )
+        video = Video.objects.create(
+            user=self.user, prompt="walking on the beach", template_name=self.template.name,
+            status="PENDING", dispatched_at=timezone.now(),
+            stage="SUBMITTED", operation_name=operation.name, generation_prefix=prefix,
+        )
+
+        self._start(client)
+
+        payload, status_code = run_video_job(str(video.id), self.template.name, str(self.user.id))
+
+        self.assertEqual(status_code, 200, payload)
+        self.assertEqual(client.submitted, 1)
+        video.refresh_from_db()
+        self.assertEqual(video.status, "COMPLETED")
+        self.assertEqual(video.stage, "UPLOADED")
+        self.assertEqual(video.ai_clip_gcs_path, prefix + "sample_0.mp4")
+        self.assertTrue(self.bucket.exists(video.final_video_gcs_path))
+
+    def test_failed_wait_keeps_the_operation_for_the_retry(self):
+        forbidden = Exception("403 PERMISSION_DENIED")
+        forbidden.code = 403
+        client = FlakyGenaiClient(1, forbidden, delay=0.05, on_complete=self._deliver)
+        self._start(client)
+        video = Video.objects.create(user=self.user, prompt="p", template_name=self.template.name,
+                                     status="PENDING", dispatched_at=timezone.now())
+
+        reference = SimpleNamespace(image_bytes=b"jpeg", mime_type="image/jpeg", content_hash="abc")
+        with mock.patch.object(engine, "get_reference_image", return_value=reference):
+            first, first_status = run_video_job(str(video.id), self.template.name, str(self.user.id))
+            video.refresh_from_db()
+            # No fallback: the job fails at SUBMITTED so the retry can pick the clip up
+            self.assertEqual(first_status, 500, first)
+            self.assertEqual((video.status, video.stage), ("FAILED", "SUBMITTED"))
+
+            second, second_status = run_video_job(str(video.id), self.template.name, str(self.user.id))
+
+        self.assertEqual(second_status, 200, second)
+        self.assertEqual(client.submitted, 1)
+        video.refresh_from_db()
+        self.assertEqual(video.ai_clip_gcs_path, video.generation_prefix + "sample_0.mp4")
+
+    def test_failed_submit_falls_back_to_the_template_clip(self):
+        self._start(FakeGenaiClient(delay=0))
+        video = Video.objects.create(user=self.user, prompt="p", template_name=self.template.name,
+                                     status="PENDING", dispatched_at=timezone.now())
+
+        with mock.patch.object(engine, "submit_veo_generation", side_effect=RuntimeError("quota exceeded")), \
+                mock.patch.object(engine, "fetch_template_asset"):
+            payload, status_code = run_video_job(str(video.id), self.template.name, str(self.user.id))
+
+        self.assertEqual(status_code, 200, payload)
+        video.refresh_from_db()
+        self.assertEqual(video.ai_clip_gcs_path, self.template.fallback_clip)
+
+    def test_completed_job_is_not_run_again(self):
+        video = Video.objects.create(user=self.user, prompt="p", template_name=self.template.name,
+                                     status="COMPLETED", stage="UPLOADED", final_video_gcs_path="users/x.mp4")
+
+        payload, status_code = run_video_job(str(video.id), self.template.name, str(self.user.id))
+
+        self.assertEqual(status_code, 200)
+        self.assertEqual(payload["note"], "already completed")
+
+class GalleryPaginationTests(LocalBucketMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username="gallery@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        base = timezone.now()
+        for i in range(5):
+            video = Video.objects.create(user=self.user, prompt=f"p{i}", status="COMPLETED",
+                                         final_video_gcs_path=f"users/{self.user.id}/videos/v{i}.mp4")
+            # Newest last; auto_now_add ignores a passed created_at
+            Video.objects.filter(pk=video.pk).update(created_at=base - datetime.timedelta(minutes=5 - i))
+        # Someone else's and an unfinished video never show up
+        Video.objects.create(user=User.objects.create(username="other@example.com"), prompt="x",
+                             status="COMPLETED", final_video_gcs_path="users/other/videos/x.mp4")
+        Video.objects.create(user=self.user, prompt="pending", status="PENDING")
+
+    def test_pages_newest_first_until_exhausted(self):
+        names = []
+        cursor = None
+        for _ in range(3):
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.client.get("/api/videos/", params)
+            self.assertEqual(response.status_code, 200)
+            names += [item["name"] for item in response.json()]
+            cursor = response.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        self.assertEqual(names, ["v4.mp4", "v3.mp4", "v2.mp4", "v1.mp4", "v0.mp4"])
+        self.assertIsNone(cursor)
+
+    def test_bad_cursor_is_a_400(self):
+        response = self.client.get("/api/videos/", {"cursor": "not-a-cursor"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Invalid cursor", response.json()["error"])
+
+
+class SchedulerTests(LocalBucketMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create(username="alice@example.com")
+        self.bob = User.objects.create(username="bob@example.com")
+
+    def _videos(self, user, n):
+        return [Video(user=user, prompt=f"prompt {i}", template_name="wildlife_retreat") for i in range(n)]
+
+    def _enqueued_users(self):
+        return [int(task["user_id"]) for task in self.queue.tasks]
+
+    def test_users_interleave_in_fair_order(self):
+        with mock.patch.object(scheduler, "MAX_DISPATCHED", 0):
+            scheduler.submit(self._videos(self.alice, 3))
+            scheduler.submit(self._videos(self.bob, 3))
+        self.assertEqual(len(self.queue), 0)
+
+        with mock.patch.object(scheduler, "MAX_DISPATCHED", 4), \
+                mock.patch.object(scheduler, "MAX_IN_FLIGHT_PER_USER", 10):
+            scheduler.pump()
+
+        # Alice queued first, but her backlog doesn't go ahead of Bob's first job
+        self.assertEqual(self._enqueued_users(), [self.alice.id, self.bob.id, self.alice.id, self.bob.id])
+
+    def test_paid_lane_advances_faster(self):
+        Profile.objects.create(user=self.bob, plan="paid")
+        with mock.patch.object(scheduler, "MAX_DISPATCHED", 0):
+            scheduler.submit(self._videos(self.alice, 2))
+            scheduler.submit(self._videos(self.bob, 4))
+
+        with mock.patch.object(scheduler, "MAX_DISPATCHED", 5), \
+                mock.patch.object(scheduler, "MAX_IN_FLIGHT_PER_USER", 10):
+            scheduler.pump()
+
+        self.assertEqual(self._enqueued_users().count(self.bob.id), 4)
+
+    def test_per_user_cap(self):
+        with mock.patch.object(scheduler, "MAX_DISPATCHED", 10), \
+                mock.patch.object(scheduler, "MAX_IN_FLIGHT_PER_USER", 2):
+            scheduler.submit(self._videos(self.alice, 4))
+            scheduler.submit(self._videos(self.bob, 1))
+
+        self.assertEqual(sorted(self._enqueued_users()), sorted([self.alice.id, self.alice.id, self.bob.id]))
+        waiting = Video.objects.filter(user=self.alice, dispatched_at__isnull=True).order_by("virtual_finish")
+        self.assertEqual([scheduler.queue_position(v) for v in waiting], [1, 2])
+
+    def test_failed_enqueue_puts_jobs_back_in_line(self):
+        broken = mock.Mock()
+        broken.enqueue_many.side_effect = RuntimeError("broker down")
+        set_task_queue(broken)
+
+        self.assertEqual(scheduler.submit(self._videos(self.alice, 1)), set())
+        video = Video.objects.get(user=self.alice)
+        self.assertEqual(video.status, "PENDING")
+        self.assertIsNone(video.dispatched_at)
+
+        set_task_queue(self.queue)
+        scheduler.pump()
+        self.assertEqual(len(self.queue), 1)
+
+    def test_lost_dispatch_is_reclaimed(self):
+        scheduler.submit(self._videos(self.alice, 1))
+        self.queue.tasks.clear()  # the queue lost it
+        long_ago = timezone.now() - datetime.timedelta(seconds=scheduler.DISPATCH_TIMEOUT_SECONDS + 60)
+        Video.objects.update(dispatched_at=long_ago, updated_at=long_ago)
+
+        scheduler.pump()
+
+        self.assertEqual(len(self.queue), 1)
+
+    def test_reclaimed_job_gets_a_new_cloud_task(self):
+        client = FakeCloudTasksClient()
+        set_task_queue(CloudTasksQueue(worker_url="http://worker", worker_secret="s", client=client))
+        scheduler.submit(self._videos(self.alice, 1))
+        long_ago = timezone.now() - datetime.timedelta(seconds=scheduler.DISPATCH_TIMEOUT_SECONDS + 60)
+        Video.objects.update(dispatched_at=long_ago, updated_at=long_ago)
+
+        scheduler.pump()
+
+        # The first task's name is still reserved; the re-dispatch must not reuse it
+        self.assertEqual(len(client.tasks), 2)
+        self.assertIsNotNone(Video.objects.get(user=self.alice).dispatched_at)
+
+
+class CloudTasksQueueTests(TestCase):
+
+    def setUp(self):
+        self.client = FakeCloudTasksClient()
+        self.queue = CloudTasksQueue(worker_url="http://worker", worker_secret="s", client=self.client)
+
+    def test_repeating_a_dispatch_is_harmless(self):
+        self.queue.enqueue("job-1", "wildlife_retreat", "1", dispatch="20260101000000000000")
+        self.queue.enqueue("job-1", "wildlife_retreat", "1", dispatch="20260101000000000000")
+
+        self.assertEqual(len(self.client.tasks), 1)
+
+    def test_a_new_dispatch_is_a_new_task(self):
+        self.queue.enqueue("job-1", "wildlife_retreat", "1", dispatch="20260101000000000000")
+        self.queue.enqueue("job-1", "wildlife_retreat", "1", dispatch="20260101000500000000")
+
+        self.assertEqual(len(self.client.tasks), 2)
+
+    def test_undispatched_duplicate_is_an_error(self):
+        from google.api_core.exceptions import AlreadyExists
+
+        self.queue.enqueue("job-1", "wildlife_retreat", "1")
+        self.assertEqual(self.queue.enqueue_many([("job-1", "wildlife_retreat", "1")])[0][0], "job-1")
+        with self.assertRaises(AlreadyExists):
+            self.queue.enqueue("job-1", "wildlife_retreat", "1")
+
+
+@unittest.skipUnless(shutil.which("ffmpeg"), "needs ffmpeg")
+class BenchmarkPipelineTests(TransactionTestCase):
+    """The command swaps process-wide fakes in; put the real ones back afterwards."""
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp(prefix="manifest_test_bench_")
+        self.addCleanup(shutil.rmtree, self.workdir, True)
+        for patch in (
+            mock.patch.object(engine, "client", engine.client),
+            mock.patch.object(engine.operation_tracker, "initial_delay", engine.operation_tracker.initial_delay),
+            mock.patch.object(engine.operation_tracker, "max_delay", engine.operation_tracker.max_delay),
+            mock.patch.dict(storage._backends),
+            mock.patch.object(events, "_broker", None),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(set_task_queue, None)
+
+    def test_small_run_reports_counts_crashes_and_cleans_up(self):
+        from .management.commands import benchmark_pipeline
+
+        real_worker = benchmark_pipeline.video_worker
+        calls = []
+
+        def flaky_worker(request):
+            calls.append(request)
+            if len(calls) == 1:
+                raise RuntimeError("database is locked")
+            return real_worker(request)
+
+        output = os.path.join(self.workdir, "report.json")
+        # One at a time: the test database is SQLite in memory, where writers lock whole tables
+        with mock.patch.object(benchmark_pipeline, "video_worker", side_effect=flaky_worker):
+            call_command("benchmark_pipeline", jobs=2, concurrency=1, veo_delay=0.05, poll_seconds=0.01,
+                         output=output)
+        with open(output) as f:
+            report = json.load(f)
+
+        # The crash is one failed job in the report, not a lost run
+        self.assertEqual((report["completed"], report["failed"]), (1, 1))
+        self.assertEqual(list(report["errors"].values()), ["RuntimeError: database is locked"])
+        self.assertEqual(report["latency_seconds"]["count"], 1)
+        self.assertFalse(Video.objects.exists())
+        self.assertFalse(User.objects.filter(username="pipeline-benchmark").exists())
+
+
+def jpeg_bytes(width=40, height=30, color="gray"):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), color).save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+class ProfileStatusTests(LocalBucketMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username="status@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_untracked_avatar_is_found_once_and_recorded(self):
+        self.bucket.upload_bytes(jpeg_bytes(), avatar_path(self.user.id), content_type="image/jpeg")
+
+        response = self.client.get("/api/profile/status/")
+
+        self.assertTrue(response.json()["has_image"])
+        self.assertTrue(response.json()["image_url"])
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual((profile.avatar_path, profile.avatar_width, profile.avatar_height),
+                         (avatar_path(self.user.id), 40, 30))
+        with mock.patch.object(self.bucket, "get_metadata") as get_metadata:
+            self.assertTrue(self.client.get("/api/profile/status/").json()["has_image"])
+        get_metadata.assert_not_called()
+
+    def test_missing_avatar_is_only_looked_up_once(self):
+        self.assertFalse(self.client.get("/api/profile/status/").json()["has_image"])
+
+        with mock.patch.object(self.bucket, "get_metadata") as get_metadata:
+            self.assertEqual(self.client.get("/api/profile/status/").json(), {"has_image": False, "image_url": None})
+        get_metadata.assert_not_called()
+
+    def test_cleared_avatar_stays_cleared(self):
+        self.bucket.upload_bytes(jpeg_bytes(), avatar_path(self.user.id), content_type="image/jpeg")
+        Profile.objects.create(user=self.user, avatar_updated_at=timezone.now())
+
+        self.assertFalse(self.client.get("/api/profile/status/").json()["has_image"])
+
+    def test_backfill_command_records_existing_avatars(self):
+        self.bucket.upload_bytes(jpeg_bytes(64, 48), avatar_path(self.user.id), content_type="image/jpeg")
+        User.objects.create(username="no-avatar@example.com")
+
+        out = io.StringIO()
+        call_command("backfill_avatar_metadata", stdout=out)
+
+        self.assertIn("Backfilled 1 avatar(s)", out.getvalue())
+        self.assertEqual(Profile.objects.get(user=self.user).avatar_width, 64)
+
+
+class VideoStatusTests(LocalBucketMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username="poller@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.video = Video.objects.create(user=self.user, prompt="p", status="PROCESSING", stage="SUBMITTED",
+                                          dispatched_at=timezone.now())
+        self.url = f"/api/videos/status/{self.video.id}/"
+        self.broker = events.LocalBroker()
+        for patch in (mock.patch.object(events, "_broker", self.broker),
+                      mock.patch.object(status_cache, "STATUS_WAIT_RECHECK_SECONDS", 60)):
+            patch.start()
+            self.addCleanup(patch.stop)
+        status_cache.invalidate_video_state(self.video.id)
+
+    def test_unchanged_status_is_a_304(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()["stage"], "SUBMITTED")
+
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_other_users_video_is_a_404(self):
+        stranger = APIClient()
+        stranger.force_authenticate(User.objects.create(username="stranger@example.com"))
+
+        self.assertEqual(stranger.get(self.url).status_code, 404)
+
+    def test_wait_wakes_on_an_event_from_another_process(self):
+        etag = self.client.get(self.url)["ETag"]
+        # A worker elsewhere moves the job on: its cache invalidation never reaches this
+        # process, only its event does
+        Video.objects.filter(id=self.video.id).update(stage="CLIP_RETRIEVED")
+        self.video.stage = "CLIP_RETRIEVED"
+        threading.Timer(0.2, events.publish_video_event, [self.video]).start()
+
+        started = time.monotonic()
+        response = self.client.get(self.url, {"wait": 10}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["stage"], "CLIP_RETRIEVED")
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_wait_times_out_with_a_304(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        response = self.client.get(self.url, {"wait": 0.2}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+
+    def test_wait_must_be_a_finite_number(self):
+        for wait in ("soon", "nan", "inf"):
+            self.assertEqual(self.client.get(self.url, {"wait": wait}).status_code, 400, wait)
+
+
+class MetricsTests(TestCase):
+
+    def test_renders_prometheus_text(self):
+        registry = metrics.MetricsRegistry()
+        jobs = registry.counter("jobs_total", "Jobs.", ["outcome"])
+        seconds = registry.histogram("stage_seconds", "Stage time.", ["stage"], buckets=(1, 5))
+        jobs.inc(outcome="completed")
+        jobs.inc(2, outcome="completed")
+        seconds.observe(0.5, stage="stitch")
+        seconds.observe(3, stage="stitch")
+        registry.register_collector(lambda: [("in_flight", "gauge", "In flight.", [({"queue": 'a"b'}, 4)])])
+
+        text = registry.render()
+
+        self.assertIn("# TYPE jobs_total counter", text)
+        self.assertIn('jobs_total{outcome="completed"} 3', text)
+        self.assertIn('stage_seconds_bucket{stage="stitch",le="1"} 1', text)
+        self.assertIn('stage_seconds_bucket{stage="stitch",le="5"} 2', text)
+        self.assertIn('stage_seconds_bucket{stage="stitch",le="+Inf"} 2', text)
+        self.assertIn('stage_seconds_sum{stage="stitch"} 3.5', text)
+        self.assertIn('in_flight{queue="a\\"b"} 4', text)
+
+    def test_labels_must_match(self):
+        counter = metrics.MetricsRegistry().counter("jobs_total", "Jobs.", ["outcome"])
+
+        with self.assertRaises(ValueError):
+            counter.inc(stage="x")
+
+    def test_a_broken_collector_does_not_break_the_scrape(self):
+        registry = metrics.MetricsRegistry()
+        registry.counter("jobs_total", "Jobs.").inc()
+        registry.register_collector(lambda: 1 / 0)
+
+        self.assertIn("jobs_total 1", registry.render())
+
+    def test_span_times_the_block(self):
+        with self.assertRaises(RuntimeError), metrics.span("test_stage"):
+            raise RuntimeError("boom")
+
+        self.assertIn('manifest_stage_seconds_count{stage="test_stage",outcome="error"} 1', metrics.registry.render())
+
+    def test_endpoint_needs_the_token(self):
+        with mock.patch.dict(os.environ, {"MANIFEST_METRICS_TOKEN": "scrape-me"}):
+            self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+            self.assertEqual(self.client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer nope").status_code, 403)
+            response = self.client.get("/api/metrics/", HTTP_AUTHORIZATION="Bearer scrape-me")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("manifest_jobs_total", response.content.decode())
+
+    def test_endpoint_is_closed_without_a_token(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop("MANIFEST_METRICS_TOKEN", None)
+            self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+
+
+class TemplateCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp(prefix="manifest_test_template_cache_")
+        self.addCleanup(shutil.rmtree, root, True)
+        self.cache_root = os.path.join(root, "cache")
+        self.bucket = LocalStorage("templates", root=os.path.join(root, "bucket"))
+        self.cache = TemplateCache(root=self.cache_root, max_bytes=250, revalidate_seconds=300)
+
+    def _upload(self, name, data, mtime=None):
+        info = self.bucket.upload_bytes(data, name)
+        if mtime is not None:
+            # A new mtime is a new generation for LocalStorage
+            os.utime(self.bucket._path(name), ns=(mtime, mtime))
+        return info
+
+    def _read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_fresh_entry_is_served_without_asking_storage(self):
+        self._upload("intro.mp4", b"a" * 100)
+        path = self.cache.get(self.bucket, "intro.mp4")
+
+        with mock.patch.object(self.bucket, "get_metadata") as get_metadata:
+            self.assertEqual(self.cache.get(self.bucket, "intro.mp4"), path)
+        get_metadata.assert_not_called()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_unchanged_generation_revalidates_without_downloading(self):
+        self._upload("intro.mp4", b"a" * 100)
+        self.cache.revalidate_seconds = 0
+        path = self.cache.get(self.bucket, "intro.mp4")
+
+        with mock.patch.object(self.bucket, "download") as download:
+            self.assertEqual(self.cache.get(self.bucket, "intro.mp4"), path)
+        download.assert_not_called()
+        self.assertEqual(self.cache.revalidations, 2)
+
+    def test_new_generation_replaces_the_cached_copy(self):
+        self._upload("intro.mp4", b"old", mtime=1_000_000_000)
+        self.cache.revalidate_seconds = 0
+        old_path = self.cache.get(self.bucket, "intro.mp4")
+
+        self._upload("intro.mp4", b"new", mtime=2_000_000_000)
+        new_path = self.cache.get(self.bucket, "intro.mp4")
+
+        self.assertNotEqual(new_path, old_path)
+        self.assertEqual(self._read(new_path), b"new")
+        self.assertFalse(os.path.exists(old_path))
+
+    def test_least_recently_used_entry_is_evicted(self):
+        for name in ("a.mp4", "b.mp4", "c.mp4"):
+            self._upload(name, b"x" * 100)
+        a = self.cache.get(self.bucket, "a.mp4")
+        b = self.cache.get(self.bucket, "b.mp4")
+        self.cache.get(self.bucket, "a.mp4")  # a is now more recent than b
+
+        self.cache.get(self.bucket, "c.mp4")
+
+        self.assertTrue(os.path.exists(a))
+        self.assertFalse(os.path.exists(b))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+        self.assertEqual(self.cache.stats()["bytes"], 200)
+
+    def test_derived_files_count_toward_the_budget(self):
+        self._upload("a.mp4", b"x" * 100)
+        self._upload("b.mp4", b"x" * 100)
+
+        def build(source, derived):
+            shutil.copyfile(source, derived)
+
+        a = self.cache.get_derived(self.bucket, "a.mp4", "mezz.mp4", build)
+        self.cache.get(self.bucket, "b.mp4")
+
+        self.assertFalse(os.path.exists(a))
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+    def test_missing_blob_is_none(self):
+        self.assertIsNone(self.cache.get(self.bucket, "nope.mp4"))
+        self.assertFalse(self.cache.fetch(self.bucket, "nope.mp4", os.path.join(self.cache_root, "out.mp4")))
+
+    def test_fetch_places_a_copy_at_the_destination(self):
+        self._upload("intro.mp4", b"clip")
+        destination = os.path.join(tempfile.mkdtemp(dir=os.path.dirname(self.cache_root)), "intro.mp4")
+
+        self.assertTrue(self.cache.fetch(self.bucket, "intro.mp4", destination))
+        self.assertEqual(self._read(destination), b"clip")
+
+    def test_a_new_process_picks_up_cached_files(self):
+        self._upload("intro.mp4", b"clip")
+        path = self.cache.get(self.bucket, "intro.mp4")
+
+        restarted = TemplateCache(root=self.cache_root, max_bytes=250)
+
+        self.assertEqual(restarted.stats()["entries"], 1)
+        with mock.patch.object(self.bucket, "download") as download:
+            self.assertEqual(restarted.get(self.bucket, "intro.mp4"), path)
+        download.assert_not_called()
+
+
+class SignedUrlCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.signer = mock.Mock()
+        # A distinct URL per signing, so a reused one is recognizable
+        self.signer.signed_url.side_effect = lambda name, **kwargs: f"https://signed/{name}?{uuid.uuid4()}"
+        patch = mock.patch.dict(storage._backends, {"bucket": self.signer})
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.cache = SignedUrlCache(max_entries=2)
+
+    def test_reuses_a_url_while_it_has_life_left(self):
+        first = self.cache.get("bucket", "a.mp4")
+
+        self.assertEqual(self.cache.get("bucket", "a.mp4"), first)
+        self.assertEqual(self.signer.signed_url.call_count, 1)
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1, "entries": 1})
+
+    def test_signs_again_near_expiry(self):
+        first = self.cache.get("bucket", "a.mp4", expiration=datetime.timedelta(seconds=100))
+        later = time.time() + 81  # past 80% of its lifetime
+
+        with mock.patch("api.signing.time.time", return_value=later):
+            self.assertNotEqual(self.cache.get("bucket", "a.mp4", expiration=datetime.timedelta(seconds=100)), first)
+
+    def test_expiration_and_method_are_part_of_the_key(self):
+        self.cache.get("bucket", "a.mp4")
+        self.cache.get("bucket", "a.mp4", expiration=datetime.timedelta(minutes=5))
+        self.cache.get("bucket", "a.mp4", method="PUT")
+
+        self.assertEqual(self.signer.signed_url.call_count, 3)
+
+    def test_invalidate_drops_every_url_for_the_blob(self):
+        first = self.cache.get("bucket", "a.mp4")
+        self.cache.get("bucket", "a.mp4", method="PUT")
+
+        self.cache.invalidate("bucket", "a.mp4")
+
+        self.assertEqual(self.cache.stats()["entries"], 0)
+        self.assertNotEqual(self.cache.get("bucket", "a.mp4"), first)
+
+    def test_least_recently_used_url_is_dropped(self):
+        self.cache.get("bucket", "a.mp4")
+        self.cache.get("bucket", "b.mp4")
+        self.cache.get("bucket", "a.mp4")
+        self.cache.get("bucket", "c.mp4")
+
+        self.cache.get("bucket", "a.mp4")
+        self.assertEqual(self.signer.signed_url.call_count, 3)
+        self.cache.get("bucket", "b.mp4")
+        self.assertEqual(self.signer.signed_url.call_count, 4)
+
+
+class LocalStorageTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="manifest_test_storage_")
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.bucket = LocalStorage("bucket", root=self.root)
+
+    def test_round_trip_with_metadata(self):
+        info = self.bucket.upload_bytes(b"hello world", "users/1/a.txt")
+        destination = os.path.join(self.root, "copy.txt")
+
+        self.assertTrue(self.bucket.download("users/1/a.txt", destination))
+        with open(destination, "rb") as f:
+            self.assertEqual(f.read(), b"hello world")
+        self.assertEqual(info.size, 11)
+        self.assertEqual(self.bucket.get_metadata("users/1/a.txt").md5_hash, info.md5_hash)
+        self.assertEqual(self.bucket.read_bytes("users/1/a.txt", 0, 4), b"hello")
+        self.assertEqual(self.bucket.read_bytes("users/1/a.txt", 6), b"world")
+
+    def test_missing_objects(self):
+        self.assertIsNone(self.bucket.get_metadata("nope"))
+        self.assertFalse(self.bucket.exists("nope"))
+        self.assertIsNone(self.bucket.read_bytes("nope"))
+        self.assertFalse(self.bucket.download("nope", os.path.join(self.root, "x")))
+
+    def test_list_by_prefix(self):
+        for name in ("generated/1/sample_0.mp4", "generated/2/sample_0.mp4", "users/1/avatar.jpg"):
+            self.bucket.upload_bytes(b"x", name)
+
+        self.assertEqual([info.name for info in self.bucket.list("generated/1/")], ["generated/1/sample_0.mp4"])
+        self.assertEqual(len(self.bucket.list("generated/")), 2)
+
+    def test_aborted_writer_leaves_nothing_behind(self):
+        with self.assertRaises(RuntimeError):
+            with self.bucket.open_writer("out.mp4") as f:
+                f.write(b"partial")
+                raise RuntimeError("ffmpeg died")
+
+        self.assertFalse(self.bucket.exists("out.mp4"))
+        self.assertEqual(self.bucket.list(""), [])
+
+    def test_writer_publishes_on_close(self):
+        with self.bucket.open_writer("out.mp4") as f:
+            f.write(b"whole")
+            self.assertFalse(self.bucket.exists("out.mp4"))
+
+        self.assertEqual(self.bucket.read_bytes("out.mp4"), b"whole")
+
+    def test_delete(self):
+        self.bucket.upload_bytes(b"x", "a.txt")
+        self.bucket.delete("a.txt")
+
+        self.assertFalse(self.bucket.exists("a.txt"))
+
+    def test_names_cannot_escape_the_bucket(self):
+        with self.assertRaises(ValueError):
+            self.bucket.upload_bytes(b"x", "../other-bucket/a.txt")
+
+    def test_factory_picks_the_configured_backend(self):
+        with mock.patch.dict(storage._backends, clear=True), mock.patch.object(storage, "STORAGE_BACKEND", "local"):
+            backend = get_storage("factory-bucket")
+            self.assertIsInstance(backend, LocalStorage)
+            self.assertIs(get_storage("factory-bucket"), backend)
+
+
+def image_bytes(width, height, format="PNG", orientation=None):
+    image = Image.new("RGB", (width, height), "white")
+    buffer = io.BytesIO()
+    if orientation:
+        exif = Image.Exif()
+        exif[0x0112] = orientation
+        image.save(buffer, format, exif=exif)
+    else:
+        image.save(buffer, format)
+    return buffer.getvalue()
+
+
+class AvatarUploadTests(LocalBucketMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username="avatar@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def _post(self, data, name="me.png", content_type="image/png"):
+        return self.client.post("/api/profile/upload/", {"file": SimpleUploadedFile(name, data, content_type)},
+                                format="multipart")
+
+    def test_stores_a_right_sized_jpeg_and_records_it(self):
+        response = self._post(image_bytes(3000, 1500))
+
+        self.assertEqual(response.status_code, 200, response.content)
+        stored = Image.open(io.BytesIO(self.bucket.read_bytes(avatar_path(self.user.id))))
+        self.assertEqual((stored.format, stored.size), ("JPEG", (1280, 640)))
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual((profile.avatar_width, profile.avatar_height), (1280, 640))
+        self.assertEqual(profile.avatar_path, avatar_path(self.user.id))
+
+    def test_rejects_a_file_that_is_not_an_image(self):
+        response = self._post(b"definitely not a png" * 100)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Could not read image", response.json()["error"])
+        self.assertFalse(self.bucket.exists(avatar_path(self.user.id)))
+
+    def test_missing_file_is_a_400(self):
+        self.assertEqual(self.client.post("/api/profile/upload/", {}, format="multipart").status_code, 400)
+
+    def test_handler_stops_reading_past_the_limit(self):
+        handler = AvatarUploadHandler(max_bytes=1000)
+        handler.new_file("file", "me.png", "image/png", None)
+        buffer = io.BytesIO()
+        # Noise doesn't compress, so the PNG is well over the limit
+        Image.frombytes("RGB", (100, 100), os.urandom(30000)).save(buffer, "PNG")
+        data = buffer.getvalue()
+
+        for start in range(0, len(data), 256):
+            self.assertIsNone(handler.receive_data_chunk(data[start:start + 256], start))
+
+        self.assertIn("larger than", handler.error)
+        self.assertIsNone(handler.file_complete(len(data)))
+
+
+class NormalizeImageTests(SimpleTestCase):
+
+    def test_applies_exif_orientation_and_strips_exif(self):
+        # Orientation 6: stored landscape, displayed rotated 90 degrees
+        image = Image.open(io.BytesIO(image_bytes(40, 20, "JPEG", orientation=6)))
+
+        jpeg, width, height = normalize_image(image)
+
+        self.assertEqual((width, height), (20, 40))
+        self.assertEqual(len(Image.open(io.BytesIO(jpeg)).getexif()), 0)
+
+    def test_small_images_are_not_enlarged(self):
+        image = Image.open(io.BytesIO(image_bytes(300, 200)))
+
+        self.assertEqual(normalize_image(image, max_edge=1280)[1:], (300, 200))
+
+
+class DirectAvatarUploadTests(LocalBucketMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username="direct@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.path = avatar_path(self.user.id)
+
+    def _complete(self):
+        return self.client.post("/api/profile/upload-complete/")
+
+    def test_upload_url_is_a_signed_put(self):
+        response = self.client.post("/api/profile/upload-url/", {"content_type": "image/png"})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((body["method"], body["headers"]), ("PUT", {"Content-Type": "image/png"}))
+        self.assertTrue(body["upload_url"])
+
+    def test_upload_url_refuses_other_content_types(self):
+        response = self.client.post("/api/profile/upload-url/", {"content_type": "image/gif"})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_complete_records_a_valid_upload(self):
+        self.bucket.upload_bytes(image_bytes(640, 480), self.path)
+
+        response = self._complete()
+
+        self.assertEqual(response.status_code, 200, response.content)
+        profile = Profile.objects.get(user=self.user)
+        self.assertEqual((profile.avatar_width, profile.avatar_height), (640, 480))
+        self.assertEqual(profile.avatar_content_hash, avatars.content_hash(self.bucket.get_metadata(self.path)))
+
+    def test_complete_without_an_upload(self):
+        response = self._complete()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("No uploaded image", response.json()["error"])
+
+    def test_non_image_is_deleted_and_the_old_avatar_forgotten(self):
+        self.bucket.upload_bytes(image_bytes(64, 64), self.path)
+        self._complete()
+        self.bucket.upload_bytes(b"<html>not an image</html>", self.path)
+
+        response = self._complete()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.bucket.exists(self.path))
+        self.assertIsNone(Profile.objects.get(user=self.user).avatar_path)
+
+    def test_oversized_upload_is_deleted(self):
+        self.bucket.upload_bytes(image_bytes(64, 64), self.path)
+
+        with mock.patch.object(avatars, "MAX_AVATAR_UPLOAD_BYTES", 10):
+            response = self._complete()
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.bucket.exists(self.path))
+
+
+class PreparedReferenceCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp(prefix="manifest_test_references_")
+        self.addCleanup(shutil.rmtree, root, True)
+        self.cache_root = os.path.join(root, "cache")
+        self.bucket = LocalStorage("bucket", root=os.path.join(root, "bucket"))
+        self.cache = PreparedReferenceCache(root=self.cache_root, memory_entries=1)
+
+    def test_prepares_once_per_photo(self):
+        self.bucket.upload_bytes(image_bytes(4000, 1000), "avatar.jpg")
+
+        first = self.cache.get(self.bucket, "avatar.jpg")
+        with mock.patch.object(self.bucket, "read_bytes") as read_bytes:
+            second = self.cache.get(self.bucket, "avatar.jpg")
+        read_bytes.assert_not_called()
+
+        self.assertEqual(second.image_bytes, first.image_bytes)
+        self.assertEqual(first.mime_type, "image/jpeg")
+        # Center-cropped to 2:1, then shrunk to the avatar edge
+        self.assertEqual(Image.open(io.BytesIO(first.image_bytes)).size, (1280, 640))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_a_new_photo_is_prepared_again(self):
+        self.bucket.upload_bytes(image_bytes(100, 100), "avatar.jpg")
+        first = self.cache.get(self.bucket, "avatar.jpg")
+
+        self.bucket.upload_bytes(image_bytes(200, 100), "avatar.jpg")
+        second = self.cache.get(self.bucket, "avatar.jpg")
+
+        self.assertNotEqual(second.content_hash, first.content_hash)
+        self.assertEqual(Image.open(io.BytesIO(second.image_bytes)).size, (200, 100))
+
+    def test_disk_copy_survives_a_restart(self):
+        self.bucket.upload_bytes(image_bytes(100, 100), "avatar.jpg")
+        first = self.cache.get(self.bucket, "avatar.jpg")
+
+        restarted = PreparedReferenceCache(root=self.cache_root)
+        with mock.patch.object(self.bucket, "read_bytes") as read_bytes:
+            self.assertEqual(restarted.get(self.bucket, "avatar.jpg").image_bytes, first.image_bytes)
+        read_bytes.assert_not_called()
+
+    def test_disk_is_pruned_to_budget(self):
+        self.cache.max_bytes = 1
+        for i in range(3):
+            self.bucket.upload_bytes(image_bytes(100 + i, 100), f"avatar{i}.jpg")
+            self.cache.get(self.bucket, f"avatar{i}.jpg")
+
+        self.assertLessEqual(len(os.listdir(self.cache_root)), 1)
+
+    def test_missing_photo_is_none(self):
+        self.assertIsNone(self.cache.get(self.bucket, "avatar.jpg"))
+
+
+class GenerationCacheTests(FakePipelineMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.veo = FakeGenaiClient(delay=0.01, on_complete=self._deliver)
+        self._start(self.veo)
+        reference = SimpleNamespace(image_bytes=b"jpeg", mime_type="image/jpeg", content_hash="photo-1")
+        patch = mock.patch.object(engine, "get_reference_image", return_value=reference)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def _video(self, prompt="Walking on the beach", **fields):
+        return Video.objects.create(user=self.user, prompt=prompt, template_name=self.template.name,
+                                    status="PENDING", dispatched_at=timezone.now(), **fields)
+
+    def test_fingerprint_ignores_case_and_spacing_only(self):
+        fingerprint = generation_cache.generation_fingerprint
+
+        self.assertEqual(fingerprint("a", "t", "Walking  on the\nbeach ", "m", {}),
+                         fingerprint("a", "t", "walking on the beach", "m", {}))
+        self.assertNotEqual(fingerprint("a", "t", "walking", "m", {}), fingerprint("b", "t", "walking", "m", {}))
+        self.assertNotEqual(fingerprint("a", "t", "walking", "m", {"aspect_ratio": "16:9"}),
+                            fingerprint("a", "t", "walking", "m", {"aspect_ratio": "9:16"}))
+
+    def test_identical_request_reuses_the_clip(self):
+        first = self._video()
+        self.assertEqual(self._run(first)[1], 200)
+
+        second = self._video(prompt="walking on the   BEACH")
+        self.assertEqual(self._run(second)[1], 200)
+
+        self.assertEqual(self.veo.submitted, 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(second.ai_clip_gcs_path, first.ai_clip_gcs_path)
+        self.assertTrue(first.ai_clip_gcs_path.startswith(generation_cache.CACHE_PREFIX + "/"))
+
+    def test_fresh_take_always_generates(self):
+        self._run(self._video())
+
+        fresh = self._video(fresh_take=True)
+        self.assertEqual(self._run(fresh)[1], 200)
+
+        self.assertEqual(self.veo.submitted, 2)
+        fresh.refresh_from_db()
+        self.assertFalse(fresh.ai_clip_gcs_path.startswith(generation_cache.CACHE_PREFIX + "/"))
+
+
+class ManifestBatchTests(LocalBucketMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username="campaign@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = "/api/manifest/batch/"
+
+    def test_creates_and_enqueues_one_video_per_prompt(self):
+        with mock.patch.object(scheduler, "MAX_IN_FLIGHT_PER_USER", 10):
+            response = self.client.post(self.url, {"prompts": ["Beach day", "A job abroad", "Hiking"]},
+                                        format="json")
+
+        self.assertEqual(response.status_code, 202)
+        body = response.json()
+        self.assertEqual((body["queued"], body["failed"]), (3, 0))
+        self.assertEqual([v["template_used"] for v in body["videos"]],
+                         ["beach_manifestation", "work_abroad_manifestation", "wildlife_retreat_manifestation"])
+        self.assertEqual(Video.objects.filter(user=self.user, lane="bulk").count(), 3)
+        self.assertEqual(sorted(task["job_id"] for task in self.queue.tasks),
+                         sorted(v["video_id"] for v in body["videos"]))
+
+    def test_rejects_bad_prompt_lists(self):
+        for prompts in (None, [], "beach", ["beach", ""], ["beach", 3]):
+            with self.subTest(prompts=prompts):
+                response = self.client.post(self.url, {"prompts": prompts}, format="json")
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Video.objects.exists())
+
+    def test_rejects_oversized_batches(self):
+        with mock.patch("api.views.MAX_BATCH_SIZE", 2):
+            response = self.client.post(self.url, {"prompts": ["a", "b", "c"]}, format="json")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Video.objects.exists())
+
+    def test_requires_authentication(self):
+        response = APIClient().post(self.url, {"prompts": ["beach"]}, format="json")
+
+        self.assertEqual(response.status_code, 401)
+
+
+class TaskQueueBackendTests(SimpleTestCase):
+
+    def setUp(self):
+        set_task_queue(None)
+        self.addCleanup(set_task_queue, None)
+
+    def test_backend_is_picked_by_setting(self):
+        for name, backend in tasks.QUEUE_BACKENDS.items():
+            if name == "cloudtasks":
+                continue
+            with self.subTest(backend=name), override_settings(JOB_QUEUE_BACKEND=name):
+                set_task_queue(None)
+                self.assertIsInstance(tasks.get_task_queue(), backend)
+                self.assertIs(tasks.get_task_queue(), tasks.get_task_queue())
+
+    def test_unknown_backend_is_an_error(self):
+        with override_settings(JOB_QUEUE_BACKEND="carrier-pigeon"):
+            with self.assertRaises(ValueError):
+                tasks.get_task_queue()
+
+    def test_in_memory_queue_drains_in_order(self):
+        queue = InMemoryTaskQueue()
+        queue.enqueue("job-1", "beach_manifestation", "7")
+        self.assertEqual(queue.enqueue_many([("job-2", "beach_manifestation", "7", "d1"),
+                                             ("job-3", "beach_manifestation", "8", "d1")]), [])
+        self.assertEqual(len(queue), 3)
+
+        ran = queue.drain(lambda task: (task["job_id"], task["user_id"]))
+
+        self.assertEqual(ran, [("job-1", "7"), ("job-2", "7"), ("job-3", "8")])
+        self.assertEqual(len(queue), 0)
+
+    def test_eager_queue_runs_jobs_in_process(self):
+        queue = EagerQueue(max_workers=2)
+        self.addCleanup(queue.pool.shutdown)
+        with mock.patch("api.jobs.run_video_job", return_value=({"status": "COMPLETED"}, 200)) as run:
+            future = queue.enqueue(uuid.UUID(int=1), "beach_manifestation", "7")
+            self.assertEqual(future.result(timeout=5), ({"status": "COMPLETED"}, 200))
+
+        run.assert_called_once_with(str(uuid.UUID(int=1)), "beach_manifestation", "7")
+
+    def test_celery_queue_names_each_dispatch(self):
+        with mock.patch.object(tasks.run_video_job_task, "apply_async") as apply_async:
+            CeleryQueue().enqueue("job-1", "beach_manifestation", "7", dispatch="d1")
+
+        apply_async.assert_called_once_with(
+            args=["job-1", "beach_manifestation", "7"], queue=tasks.VIDEO_QUEUE,
+            task_id="video-job-1-d1", producer=None,
+        )
+
+    def test_celery_queue_reports_failed_publishes(self):
+        producer = mock.MagicMock()
+        with mock.patch.object(tasks.run_video_job_task.app, "producer_or_acquire", return_value=producer), \
+                mock.patch.object(tasks.run_video_job_task, "apply_async",
+                                  side_effect=[None, ConnectionError("broker down")]):
+            failures = CeleryQueue().enqueue_many([("job-1", "t", "7"), ("job-2", "t", "7")])
+
+        self.assertEqual([job_id for job_id, _ in failures], ["job-2"])
+
+
+class VideoEventsTests(LocalBucketMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username="watcher@example.com")
+        self.auth = self._bearer(self.user)
+        self.video = Video.objects.create(user=self.user, prompt="p", status="PROCESSING", stage="SUBMITTED",
+                                          dispatched_at=timezone.now())
+        self.url = f"/api/videos/events/{self.video.id}/"
+        self.broker = events.LocalBroker()
+        patch = mock.patch.object(events, "_broker", self.broker)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    @staticmethod
+    def _bearer(user):
+        return {"Authorization": f"Bearer {RefreshToken.for_user(user).access_token}"}
+
+    @staticmethod
+    def _parse(chunk):
+        event, data = (chunk.decode() if isinstance(chunk, bytes) else chunk).strip().split("\n")
+        return event.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+    async def _publish(self, **fields):
+        await Video.objects.filter(id=self.video.id).aupdate(**fields)
+        video = await Video.objects.aget(id=self.video.id)
+        self.broker.publish(events.video_channel(video.id), events.video_event(video))
+
+    async def test_streams_each_transition_until_done(self):
+        response = await self.async_client.get(self.url, headers=self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = aiter(response.streaming_content)
+
+        self.assertEqual(self._parse(await anext(stream)), ("status", mock.ANY))
+        await self._publish(stage="CLIP_READY")
+        event, payload = self._parse(await anext(stream))
+        self.assertEqual((event, payload["status"], payload["stage"]), ("status", "PROCESSING", "CLIP_READY"))
+
+        await self._publish(status="COMPLETED", stage="DONE", final_video_gcs_path="final/video.mp4")
+        event, payload = self._parse(await anext(stream))
+        self.assertEqual((payload["status"], payload["stage"]), ("COMPLETED", "DONE"))
+        self.assertIsNotNone(payload["video_url"])
+        with self.assertRaises(StopAsyncIteration):
+            await anext(stream)
+
+    async def test_finished_video_sends_one_event(self):
+        await Video.objects.filter(id=self.video.id).aupdate(status="FAILED", stage="FAILED")
+
+        response = await self.async_client.get(self.url, headers=self.auth)
+        chunks = [chunk async for chunk in response.streaming_content]
+
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(self._parse(chunks[0])[1]["status"], "FAILED")
+
+    async def test_requires_a_valid_token(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+
+        response = await self.async_client.get(self.url, headers={"Authorization": "Bearer not-a-jwt"})
+        self.assertEqual(response.status_code, 401)
+
+    async def test_other_users_videos_are_not_found(self):
+        stranger = await User.objects.acreate(username="stranger@example.com")
+
+        response = await self.async_client.get(self.url, headers=self._bearer(stranger))
+
+        self.assertEqual(response.status_code, 404)
+
+
+class TemplateRegistryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.registry = TemplateRegistry([
+            Template("beach", "b", "beach/intro.mp4", "beach/outro.mp4", keywords=["beach", "sea"]),
+            Template("work", "w", "work/intro.mp4", "work/outro.mp4", keywords=["work", "seaside job"]),
+            Template("forest", "f", "forest/intro.mp4", "forest/outro.mp4", default=True),
+        ])
+
+    def test_first_template_with_a_keyword_wins(self):
+        route = self.registry.route
+
+        self.assertEqual(route("Work by the BEACH").name, "beach")
+        self.assertEqual(route("a remote work trip").name, "work")
+        # "seaside job" contains "sea": the earlier template still wins the overlap
+        self.assertEqual(route("my seaside job").name, "beach")
+        self.assertEqual(route("a quiet cabin").name, "forest")
+
+    def test_matches_the_old_keyword_chain(self):
+        def legacy(prompt):
+            prompt = prompt.lower()
+            if 'beach' in prompt or 'ocean' in prompt or 'sea' in prompt:
+                return "beach_manifestation"
+            elif 'work' in prompt or 'job' in prompt or 'abroad' in prompt:
+                return "work_abroad_manifestation"
+            return "wildlife_retreat_manifestation"
+
+        shipped = TemplateRegistry.from_file()
+        for prompt in ("Ocean view", "a job abroad", "researching jobs by the sea", "Safari", "", "homework"):
+            with self.subTest(prompt=prompt):
+                self.assertEqual(shipped.route(prompt).name, legacy(prompt))
+
+    def test_unknown_names_get_the_default(self):
+        self.assertEqual(self.registry.get("work").name, "work")
+        self.assertIs(self.registry.get("retired_template"), self.registry.default)
+
+    def test_without_a_flagged_default_the_last_template_is_used(self):
+        registry = TemplateRegistry([Template("a", "a", "a/i.mp4", "a/o.mp4", keywords=["x"]),
+                                     Template("b", "b", "b/i.mp4", "b/o.mp4")])
+
+        self.assertEqual(registry.route("nothing matches").name, "b")
+
+    def test_prewarm_reports_missing_clips_per_template(self):
+        root = tempfile.mkdtemp(prefix="manifest_test_prewarm_")
+        self.addCleanup(shutil.rmtree, root, True)
+        bucket = LocalStorage("templates", root=os.path.join(root, "bucket"))
+        for name in ("beach/intro.mp4", "beach/outro.mp4", "work/intro.mp4"):
+            bucket.upload_bytes(b"clip", name)
+        probe = {"duration": 4.0, "width": 720, "height": 1280}
+
+        cache = TemplateCache(root=os.path.join(root, "cache"))
+
+        with mock.patch.object(template_registry, "template_cache", cache), \
+                mock.patch.object(stitch, "probe_video", return_value=probe):
+            errors = template_registry.prewarm(bucket, list(self.registry)[:2], mezzanine=False)
+
+        self.assertIsNone(errors["beach"])
+        self.assertIsInstance(errors["work"], FileNotFoundError)
+        self.assertEqual(self.registry.get("beach").metadata, {"intro": probe, "outro": probe})
@@ -1,6 +1,6 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import manifest_video, check_profile_status, upload_profile_image, register_user, get_user_videos, get_video_status, video_worker
+from .views import manifest_video, manifest_batch, check_profile_status, upload_profile_image, register_user, get_user_videos, get_video_status, video_events, video_hls, video_worker, prometheus_metrics, create_avatar_upload, complete_avatar_upload
 
 print("🔥 DEBUG: URLs loading with Legacy Support...")
 
@@ -14,14 +14,25 @@ urlpatterns = [
     # --- FEATURES ---
     # User-Facing: Kicks off the process and returns a 202
     path('manifest/', manifest_video, name='manifest_video'),
+    # User-Facing: Many prompts at once (campaigns); one row insert and one enqueue call
+    path('manifest/batch/', manifest_batch, name='manifest_batch'),
     
     # User-Facing: The app pings this to see if the video is ready
     path('videos/status/<uuid:video_id>/', get_video_status, name='get_video_status'),
+    # User-Facing: Same status, pushed as Server-Sent Events until the video is done
+    path('videos/events/<uuid:video_id>/', video_events, name='video_events'),
+    # Player-Facing: HLS playlists (the status/listing responses carry the tokenized URL)
+    path('videos/<uuid:video_id>/hls/<path:name>', video_hls, name='video_hls'),
     
     # Internal: Google Cloud Tasks calls this to run the 5-minute engine
     path('worker/', video_worker, name='video_worker'),
+    # Internal: Prometheus scrapes per-stage timings, cache hits and fallbacks here
+    path('metrics/', prometheus_metrics, name='metrics'),
 
     path('profile/status/', check_profile_status, name='profile_status'),
     path('profile/upload/', upload_profile_image, name='profile_upload'),
+    # Direct-to-bucket upload: get a signed PUT URL, upload, then confirm
+    path('profile/upload-url/', create_avatar_upload, name='profile_upload_url'),
+    path('profile/upload-complete/', complete_avatar_upload, name='profile_upload_complete'),
     path('videos/', get_user_videos, name='get_videos'),
 ]
\ No newline at end of file
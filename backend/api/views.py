@@ -1,22 +1,48 @@
-from django.shortcuts import render
+import asyncio
+import hmac
+import json
+import math
+import os
 
-import datetime
-import uuid, os
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 
 from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
-from google.cloud import storage
-from .engine import generate_manifestation, upload_blob, BUCKET_NAME
-from .models import Video
-from .tasks import enqueue_video_task
+from .signing import get_signed_url
+from .storage import get_storage
+from .engine import BUCKET_NAME
+from .images import AvatarUploadHandler, InvalidImage
+from .avatars import avatar_path, backfill_avatar, create_upload_session, validate_uploaded_avatar, record_avatar, clear_avatar
+from .models import Video, Profile
+from .pagination import paginate_newest_first, InvalidCursor
+from . import scheduler
+from .template_registry import registry as template_registry
+from .encoding import PROFILES as ENCODING_PROFILES
+from .jobs import run_video_job
 
 from .models import BetaInvite
-from django.db import transaction
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
 from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from .events import get_broker, video_channel, TERMINAL_STATUSES
+from .status_cache import get_video_state, video_status_payload, wait_for_change
+from .hls import playlist_url, render_playlist, check_hls_token, PlaylistNotFound
+from . import metrics
+
+# Most prompts one batch request may submit
+MAX_BATCH_SIZE = int(os.environ.get("MANIFEST_MAX_BATCH_SIZE", "100"))
+
+# Status streams: a comment line keeps proxies from closing an idle stream, the row is
+# re-read now and then in case a pub/sub message was missed, and after the max the
+# client simply reconnects
+EVENT_KEEPALIVE_SECONDS = 15
+EVENT_RECHECK_SECONDS = 60
+EVENT_STREAM_MAX_SECONDS = 15 * 60
 
 # @api_view(['POST'])
 # @permission_classes([IsAuthenticated])
@@ -55,18 +81,17 @@ from rest_framework_simplejwt.tokens import RefreshToken
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def check_profile_status(request):
-    user_id = str(request.user.id)
-    storage_client = storage.Client()
-    bucket = storage_client.bucket(BUCKET_NAME)
-    blob = bucket.blob(f"users/{user_id}/profile/avatar.jpg")
-    
-    if blob.exists():
-        # Generate Signed URL (Valid for 1 hour)
-        signed_url = blob.generate_signed_url(
-            version="v4",
-            expiration=datetime.timedelta(hours=1),
-            method="GET"
-        )
+    # One indexed read; the upload flows keep this row in sync with the bucket
+    avatar, checked_at = Profile.objects.filter(user=request.user).values_list(
+        "avatar_path", "avatar_updated_at").first() or (None, None)
+    if not avatar and checked_at is None:
+        # Never tracked (uploaded before Profile held avatar metadata): look in the bucket once
+        profile = backfill_avatar(request.user)
+        avatar = profile.avatar_path if profile else None
+
+    if avatar:
+        # Signed URL (valid for 1 hour), reused from the cache while it's fresh
+        signed_url = get_signed_url(BUCKET_NAME, avatar)
         return Response({"has_image": True, "image_url": signed_url})
     
     return Response({"has_image": False, "image_url": None})
@@ -77,25 +102,59 @@ def check_profile_status(request):
 def upload_profile_image(request):
     """Uploads the user's face."""
     user_id = str(request.user.id)
+
+    # Decode the image as the chunks arrive (nothing is written to /tmp),
+    # keeping only a right-sized, EXIF-free JPEG.
+    handler = AvatarUploadHandler(request._request)
+    request._request.upload_handlers = [handler]
     file_obj = request.FILES.get('file')
     
+    if handler.error:
+        return Response({"error": handler.error}, status=400)
     if not file_obj:
         return Response({"error": "No file provided"}, status=400)
-    
-    # Save temporarily to upload
-    temp_path = f"/tmp/{user_id}_avatar.jpg"
-    with open(temp_path, 'wb+') as destination:
-        for chunk in file_obj.chunks():
-            destination.write(chunk)
             
     # Upload to Google Cloud
     # We use 'users/{id}/profile/avatar.jpg' as the standard path
-    target_path = f"users/{user_id}/profile/avatar.jpg"
-    public_url = upload_blob(BUCKET_NAME, temp_path, target_path)
+    target_path = avatar_path(user_id)
+    info = get_storage(BUCKET_NAME).upload_bytes(file_obj.read(), target_path, content_type="image/jpeg")
+    record_avatar(request.user, info, file_obj.width, file_obj.height)
+    print(f"🖼️ Avatar for user {user_id}: {file_obj.original_size} bytes in, "
+          f"{file_obj.size} bytes stored ({file_obj.width}x{file_obj.height})")
     
     return Response({
         "status": "success", 
-        "image_url": public_url
+        "image_url": get_signed_url(BUCKET_NAME, target_path)
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_avatar_upload(request):
+    """Step 1 of a direct upload: hands the app a signed PUT URL so the bytes skip the API."""
+    content_type = request.data.get('content_type', 'image/jpeg')
+    try:
+        session = create_upload_session(request.user.id, content_type)
+    except InvalidImage as e:
+        return Response({"error": str(e)}, status=400)
+    return Response(session)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def complete_avatar_upload(request):
+    """Step 2: the app says it's done; we check the object and record it."""
+    try:
+        info, width, height = validate_uploaded_avatar(request.user.id)
+    except InvalidImage as e:
+        # The bad upload already replaced the old avatar, so don't keep pointing at it
+        clear_avatar(request.user)
+        return Response({"error": str(e)}, status=400)
+
+    record_avatar(request.user, info, width, height)
+    print(f"🖼️ Direct avatar upload for user {request.user.id}: {info.size} bytes ({width}x{height})")
+
+    return Response({
+        "status": "success",
+        "image_url": get_signed_url(BUCKET_NAME, info.name)
     })
 
 @api_view(['POST'])
@@ -149,39 +208,71 @@ def register_user(request):
     })
 
 
+def _absolute_url(request, path):
+    return request.build_absolute_uri(path) if path else None
+
+
+def _with_absolute_playlist(request, payload):
+    if not payload.get("playlist_url"):
+        return payload
+    return dict(payload, playlist_url=_absolute_url(request, payload["playlist_url"]))
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_user_videos(request):
     """
-    Fetches the list of all manifestation videos for the logged-in user.
+    Fetches the logged-in user's manifestation videos, newest first.
+    Paginated with ?cursor=&limit=; the next cursor comes back in the
+    X-Next-Cursor header so the response body stays a plain list.
     """
-    user_id = str(request.user.id)
-    prefix = f"users/{user_id}/videos/"
-    
-    storage_client = storage.Client()
-    # Note: ensure BUCKET_NAME is imported from .engine or defined here
-    blobs = storage_client.list_blobs(BUCKET_NAME, prefix=prefix)
+    videos = Video.objects.filter(
+        user=request.user,
+        status="COMPLETED",
+        final_video_gcs_path__isnull=False,
+    ).only("id", "created_at", "final_video_gcs_path", "hls_playlist_gcs_path")
+
+    try:
+        page, next_cursor = paginate_newest_first(
+            videos,
+            cursor=request.query_params.get("cursor"),
+            limit=request.query_params.get("limit"),
+        )
+    except InvalidCursor as e:
+        return Response({"error": str(e)}, status=400)
     
     video_list = []
-    for blob in blobs:
-        # 2. GENERATE SIGNED URL (The Key Card) 🔑
-        # This link works for 1 hour, then expires.
-        signed_url = blob.generate_signed_url(
-            version="v4",
-            expiration=datetime.timedelta(hours=1), 
-            method="GET"
-        )
+    for video in page:
+        # GENERATE SIGNED URL (The Key Card) 🔑
+        # This link works for 1 hour, then expires. Cached, so polling doesn't re-sign.
+        signed_url = get_signed_url(BUCKET_NAME, video.final_video_gcs_path)
 
         video_list.append({
+            "id": str(video.id),
             "url": signed_url, # <--- Use the key card, not the public link
-            "created_at": blob.time_created,
-            "name": blob.name.split('/')[-1]
+            "created_at": video.created_at,
+            "name": video.final_video_gcs_path.split('/')[-1],
+            # Adaptive stream; players should prefer it over "url" when present
+            "playlist_url": _absolute_url(request, playlist_url(video)),
         })
     
-    # Sort descending (Newest on top)
-    video_list.sort(key=lambda x: x['created_at'], reverse=True)
-    
-    return Response(video_list)
+    response = Response(video_list)
+    if next_cursor:
+        response["X-Next-Cursor"] = next_cursor
+    return response
+
+
+def _wants_fresh_take(request):
+    # "fresh": true means the user explicitly wants a new take, not a cached clip
+    return str(request.data.get('fresh', '')).lower() in ('1', 'true', 'yes')
+
+
+def _requested_profile(request):
+    """Optional "encoding_profile" (see encoding.PROFILES). Raises ValueError for unknown names."""
+    name = request.data.get('encoding_profile') or None
+    if name is not None and name not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding_profile; choose from {', '.join(ENCODING_PROFILES)}")
+    return name
 
 
 @api_view(['POST'])
@@ -189,37 +280,90 @@ def get_user_videos(request):
 def manifest_video(request):
     """Waiter: Takes the order and puts it in the queue."""
     prompt = request.data.get('prompt', '').lower()
-    user_id = str(request.user.id)
+    fresh_take = _wants_fresh_take(request)
+    try:
+        encoding_profile = _requested_profile(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
     
-    # 1. TEMPLATE LOGIC (Stays here in the view)
-    if any(word in prompt for word in ['beach', 'ocean', 'sea']):
-        template = "beach_manifestation"
-    elif any(word in prompt for word in ['work', 'job', 'abroad']):
-        template = "work_abroad_manifestation"
-    else:
-        template = "wildlife_retreat_manifestation"
+    # 1. TEMPLATE LOGIC (one compiled match over templates.json keywords)
+    template = template_registry.route(prompt).name
 
-    # 2. CREATE RECORD (Frozen Model: no template_used field)
-    video_obj = Video.objects.create(
+    # 2. CREATE RECORD (the template is stored so a resumed job uses the same one)
+    video_obj = Video(
         user=request.user,
         prompt=prompt,
-        status="PENDING"
+        status="PENDING",
+        template_name=template,
+        fresh_take=fresh_take,
+        encoding_profile=encoding_profile,
     )
 
-    # 3. HANDOFF (We pass the template string directly to the task)
+    # 3. HANDOFF (the scheduler dispatches it now, or once this user's earlier jobs finish)
     try:
-        # We pass both the ID and the Template to the task
-        enqueue_video_task(video_obj.id, template, user_id)
-        
+        failed_ids = scheduler.submit([video_obj])
+        if video_obj.id in failed_ids:
+            return Response({"error": "Could not queue the video"}, status=500)
+
         return Response({
             "video_id": video_obj.id,
-            "status": "PENDING"
+            "status": "PENDING",
+            "queue_position": scheduler.queue_position(Video.objects.get(id=video_obj.id)),
         }, status=202)
     except Exception as e:
         print(f"❌ QUEUE ERROR: {e}")
         return Response({"error": str(e)}, status=500)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def manifest_batch(request):
+    """
+    Campaign-style generation: {"prompts": [...]} creates one Video per prompt
+    in a single insert and hands them all to the scheduler in one call.
+    """
+    prompts = request.data.get('prompts')
+    if not isinstance(prompts, list) or not prompts:
+        return Response({"error": "prompts must be a non-empty list"}, status=400)
+    if len(prompts) > MAX_BATCH_SIZE:
+        return Response({"error": f"At most {MAX_BATCH_SIZE} prompts per batch"}, status=400)
+    if not all(isinstance(p, str) and p.strip() for p in prompts):
+        return Response({"error": "Every prompt must be a non-empty string"}, status=400)
+
+    fresh_take = _wants_fresh_take(request)
+    try:
+        encoding_profile = _requested_profile(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=400)
+
+    videos = []
+    for prompt in prompts:
+        prompt = prompt.lower()
+        videos.append(Video(
+            user=request.user,
+            prompt=prompt,
+            status="PENDING",
+            template_name=template_registry.route(prompt).name,
+            fresh_take=fresh_take,
+            encoding_profile=encoding_profile,
+        ))
+    # Batches ride the bulk lane, so they fill spare capacity behind interactive requests
+    failed_ids = scheduler.submit(videos, lane="bulk")
+
+    return Response({
+        "videos": [
+            {
+                "video_id": v.id,
+                "status": "FAILED" if v.id in failed_ids else "PENDING",
+                "template_used": v.template_name,
+            }
+            for v in videos
+        ],
+        "queued": len(videos) - len(failed_ids),
+        "failed": len(failed_ids),
+    }, status=202)
+
+
 @api_view(['POST'])
 @permission_classes([])
 def video_worker(request):
@@ -232,76 +376,135 @@ def video_worker(request):
     template_name = request.data.get("template_name")
     user_id = request.data.get("user_id")
 
-    run_id = str(uuid.uuid4())[:8]
-    print(f"[worker {run_id}] START job_id={job_id}")
+    # Claims the job (or resumes it from its last checkpoint) and runs the engine
+    payload, status_code = run_video_job(job_id, template_name, user_id)
+    return Response(payload, status=status_code)
 
-    # ✅ atomic claim
-    with transaction.atomic():
-        video_obj = Video.objects.select_for_update().get(id=job_id)
-        print(f"[worker {run_id}] status_before={video_obj.status}")
-
-        if video_obj.status == "COMPLETED":
-            return Response({"status": "ok", "note": "already completed"}, status=200)
-
-        if video_obj.status == "PROCESSING":
-            # IMPORTANT: stop Cloud Tasks retries from re-running Vertex
-            return Response({"status": "ok", "note": "already processing"}, status=200)
-
-        # optionally: if FAILED, choose whether to retry or stop
-        # if video_obj.status == "FAILED":
-        #     return Response({"status": "ok", "note": "already failed"}, status=200)
-
-        video_obj.status = "PROCESSING"
-        video_obj.save()
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_video_status(request, video_id):
+    """
+    Answers from a short-lived cache the worker clears on every transition.
+    Send If-None-Match to get a 304 when nothing changed; add ?wait=<seconds>
+    to hold the request until it does (bounded long-poll).
+    """
+    known_etag = request.headers.get("If-None-Match")
     try:
-        print(f"[worker {run_id}] CALLING VERTEX")
-        final_url = generate_manifestation(
-            video_obj.prompt,
-            template_name=template_name,
-            user_id=user_id,
-        )
+        wait = float(request.query_params.get("wait", 0))
+    except ValueError:
+        wait = None
+    if wait is None or not math.isfinite(wait):
+        return Response({"error": "wait must be a number of seconds"}, status=400)
 
-        # ⚠️ this field must be TextField or store GCS path instead
-        video_obj.final_video_gcs_path = final_url
-        video_obj.status = "COMPLETED"
-        video_obj.save()
+    state = get_video_state(video_id)
+    if state is not None and wait > 0 and known_etag == state["etag"] and state["user_id"] == request.user.id:
+        state = wait_for_change(video_id, known_etag, wait)
 
-        print(f"[worker {run_id}] DONE")
-        return Response({"status": "success"}, status=200)
+    if state is None or state["user_id"] != request.user.id:
+        return Response({"error": "Video not found"}, status=404)
 
-    except Exception as e:
-        video_obj.status = "FAILED"
-        video_obj.save()
-        print(f"[worker {run_id}] ENGINE ERROR: {e}")
-        # If you want retries for transient errors, keep 500.
-        # If retries are costing you money, return 200 here and handle retries manually.
-        return Response({"error": str(e)}, status=500)
+    if known_etag == state["etag"]:
+        response = Response(status=304)
+    else:
+        response = Response(_with_absolute_playlist(request, state["payload"]))
+    response["ETag"] = state["etag"]
+    response["Cache-Control"] = "private, no-cache"
+    metrics.STATUS_REQUESTS.inc(code=response.status_code)
+    return response
 
 
-@api_view(['GET'])
-@permission_classes([IsAuthenticated])
-def get_video_status(request, video_id):
-    try:
-        video = Video.objects.get(id=video_id, user=request.user)
+# --- PUSHED STATUS (async; needs the ASGI app, see core/asgi.py) ---
 
-        signed_url = None
+def _authenticate_jwt(request):
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def _video_event_stream(request, video_id):
+    loop = asyncio.get_running_loop()
+    started = last_check = loop.time()
+
+    # Subscribe before reading the row, so a transition in between isn't lost
+    async with get_broker().subscribe(video_channel(video_id)) as queue:
+        video = await Video.objects.aget(id=video_id)
+        last = (video.status, video.stage)
+        yield _sse("status", _with_absolute_playlist(request, await sync_to_async(video_status_payload)(video)))
+
+        while video.status not in TERMINAL_STATUSES:
+            if loop.time() - started > EVENT_STREAM_MAX_SECONDS:
+                return
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=EVENT_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                if loop.time() - last_check < EVENT_RECHECK_SECONDS:
+                    yield ": keepalive\n\n"
+                    continue
+                message = None
+
+            if message is not None and message["status"] not in TERMINAL_STATUSES:
+                video.status, video.stage = message["status"], message["stage"]
+            else:
+                # Finished (the payload needs the signed URL) or time to double-check
+                video = await Video.objects.aget(id=video_id)
+                last_check = loop.time()
+
+            if (video.status, video.stage) != last:
+                last = (video.status, video.stage)
+                yield _sse("status", _with_absolute_playlist(request, await sync_to_async(video_status_payload)(video)))
+
+
+async def video_events(request, video_id):
+    """
+    Server-Sent Events for one video: the current status right away, then
+    every stage transition the worker publishes, ending at COMPLETED/FAILED.
+    Replaces polling get_video_status.
+    """
+    user = await sync_to_async(_authenticate_jwt)(request)
+    if user is None:
+        return JsonResponse({"error": "Authentication required"}, status=401)
+    if not await Video.objects.filter(id=video_id, user=user).aexists():
+        return JsonResponse({"error": "Video not found"}, status=404)
+
+    return StreamingHttpResponse(
+        _video_event_stream(request, video_id),
+        content_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-        if video.status == "COMPLETED" and video.final_video_gcs_path:
-            storage_client = storage.Client()
-            bucket = storage_client.bucket(BUCKET_NAME)
-            blob = bucket.blob(video.final_video_gcs_path)
 
-            signed_url = blob.generate_signed_url(
-                version="v4",
-                expiration=datetime.timedelta(hours=1),
-                method="GET"
-            )
+def video_hls(request, video_id, name):
+    """
+    Serves a video's HLS playlists with segment links rewritten to signed
+    bucket URLs. Authorized by the token in playlist_url, since players
+    fetch these without the app's auth header.
+    """
+    if not check_hls_token(request.GET.get("token", ""), video_id):
+        return JsonResponse({"error": "Invalid or expired playlist token"}, status=403)
+    master = Video.objects.filter(id=video_id).values_list("hls_playlist_gcs_path", flat=True).first()
+    if not master:
+        return JsonResponse({"error": "Playlist not found"}, status=404)
+    try:
+        text = render_playlist(video_id, master, name)
+    except PlaylistNotFound:
+        return JsonResponse({"error": "Playlist not found"}, status=404)
+    return HttpResponse(text, content_type="application/vnd.apple.mpegurl")
 
-        return Response({
-            "status": video.status,
-            "video_url": signed_url
-        })
 
-    except Video.DoesNotExist:
-        return Response({"error": "Video not found"}, status=404)
\ No newline at end of file
+def prometheus_metrics(request):
+    """
+    This process's metrics in the Prometheus text format. Scrapers send
+    MANIFEST_METRICS_TOKEN as a bearer token; with no token configured the
+    endpoint is closed, since it shows queue depth and job counts.
+    """
+    token = os.environ.get("MANIFEST_METRICS_TOKEN")
+    if not token or not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=403)
+    return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,131 @@
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import wait
+from contextlib import contextmanager
+
+# --- CONFIGURATION ---
+# Every job gets its own scratch folder under this root, so two jobs on the
+# same container can never overwrite each other's intro/avatar/final files.
+WORKSPACE_ROOT = os.environ.get("MANIFEST_WORKSPACE_ROOT", tempfile.gettempdir())
+
+# Disk budget per job (intro + outro + AI clip + final render fit well under this)
+WORKSPACE_BUDGET_BYTES = int(os.environ.get("MANIFEST_WORKSPACE_BUDGET_MB", "512")) * 1024 * 1024
+
+# How many manifestations one process may have in flight at the same time.
+# Most of a job is waiting on Vertex, so this can be much higher than the CPU count.
+MAX_CONCURRENT_JOBS = int(os.environ.get("MANIFEST_MAX_CONCURRENT_JOBS", "24"))
+
+# How many of those may be doing CPU-heavy work (stitching/encoding) at once
+MAX_CPU_JOBS = int(os.environ.get("MANIFEST_MAX_CPU_JOBS", str(os.cpu_count() or 2)))
+
+# Cores this worker may use for encoding (a container may see more than it's allotted)
+_AVAILABLE_CPUS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 2)
+CPU_BUDGET = int(os.environ.get("MANIFEST_CPU_BUDGET", str(_AVAILABLE_CPUS)))
+
+_job_slots = threading.BoundedSemaphore(MAX_CONCURRENT_JOBS)
+_cpu_slots = threading.BoundedSemaphore(MAX_CPU_JOBS)
+_cpu_active = 0
+_cpu_active_lock = threading.Lock()
+
+
+class WorkspaceFullError(Exception):
+    """Raised when a job would go over its disk budget."""
+
+
+class JobWorkspace:
+    """A private scratch directory for one job, deleted when the job ends."""
+
+    def __init__(self, job_id, root=WORKSPACE_ROOT, budget_bytes=WORKSPACE_BUDGET_BYTES):
+        self.job_id = str(job_id)
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.dir = None
+        self._background = []
+
+    def __enter__(self):
+        os.makedirs(self.root, exist_ok=True)
+
+        # Refuse to start if the disk can't hold a full job
+        free_bytes = shutil.disk_usage(self.root).free
+        if free_bytes < self.budget_bytes:
+            raise WorkspaceFullError(
+                f"Only {free_bytes // (1024 * 1024)}MB free in {self.root}, "
+                f"job needs {self.budget_bytes // (1024 * 1024)}MB"
+            )
+
+        self.dir = tempfile.mkdtemp(prefix=f"job_{self.job_id}_", dir=self.root)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Let background writers finish before their files are deleted
+        wait(self._background)
+        self.cleanup()
+        return False
+
+    def run_in_background(self, executor, fn, *args):
+        """Submits fn(*args) to executor. The workspace isn't deleted until it has finished."""
+        future = executor.submit(fn, *args)
+        self._background.append(future)
+        return future
+
+    def path(self, name):
+        """Returns the absolute path of a file inside this workspace."""
+        return os.path.join(self.dir, name)
+
+    def used_bytes(self):
+        total = 0
+        for folder, _, files in os.walk(self.dir):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(folder, name))
+                except OSError:
+                    pass
+        return total
+
+    def check_budget(self):
+        """Raises WorkspaceFullError if the job has written more than its budget."""
+        used = self.used_bytes()
+        if used > self.budget_bytes:
+            raise WorkspaceFullError(
+                f"Job {self.job_id} used {used // (1024 * 1024)}MB, "
+                f"budget is {self.budget_bytes // (1024 * 1024)}MB"
+            )
+        return used
+
+    def cleanup(self):
+        if self.dir and os.path.isdir(self.dir):
+            shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir = None
+
+
+@contextmanager
+def job_slot():
+    """Blocks until this process has room for one more manifestation."""
+    _job_slots.acquire()
+    try:
+        yield
+    finally:
+        _job_slots.release()
+
+
+@contextmanager
+def cpu_slot():
+    """Held only around CPU-heavy stages, so jobs waiting on Vertex don't block stitching."""
+    global _cpu_active
+    _cpu_slots.acquire()
+    with _cpu_active_lock:
+        _cpu_active += 1
+    try:
+        yield
+    finally:
+        with _cpu_active_lock:
+            _cpu_active -= 1
+        _cpu_slots.release()
+
+
+def active_cpu_jobs():
+    """How many jobs are inside cpu_slot() right now."""
+    with _cpu_active_lock:
+        return _cpu_active
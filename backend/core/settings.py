@@ -99,6 +99,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'core.wsgi.application'
+# Served with uvicorn workers so the status event streams don't each hold a thread
+ASGI_APPLICATION = 'core.asgi.application'
 
 
 # Database
@@ -109,15 +111,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Local runs have concurrent writers too (EagerQueue threads, benchmark_pipeline):
+        # take the write lock up front and wait for it instead of failing "database is locked"
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Persistent connections suit the WSGI/Celery workers, whose threads are long-lived.
+# Under ASGI every sync view runs on a sync_to_async pool thread, and each of those
+# threads would keep its own connection open (request_finished doesn't reliably close
+# them), leaking database connections; Dockerfile.api sets this to 0 for that reason.
+DB_CONN_MAX_AGE = int(os.environ.get('MANIFEST_DB_CONN_MAX_AGE', '600'))
+
 # Use Neon Postgres only if a valid URL is provided
 env_db_url = os.environ.get('DATABASE_URL')
 if env_db_url and env_db_url.strip():
     DATABASES['default'] = dj_database_url.parse(
         env_db_url, 
-        conn_max_age=600, 
+        conn_max_age=DB_CONN_MAX_AGE, 
         ssl_require=True
     )
 
@@ -171,6 +185,41 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# --- JOB DISPATCH ---
+# cloudtasks: HTTP tasks to /api/worker/ (Cloud Run)
+# celery:     Redis broker + `celery -A core worker -Q video` (docker-compose / self-hosted)
+# eager:      a thread pool inside the API process
+# memory:     a local queue that something drains by hand (load tests)
+JOB_QUEUE_BACKEND = os.environ.get('MANIFEST_TASK_QUEUE', 'cloudtasks')
+
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_TASK_IGNORE_RESULT = True
+# A job is acknowledged only once it finishes, so a killed worker's job is redelivered
+# (and resumes from its checkpoint) instead of being lost
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+# Jobs are long; never let one worker reserve jobs another idle worker could start
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_TASK_ROUTES = {'api.run_video_job': {'queue': 'video'}}
+# Redis redelivers unacknowledged jobs after this; it must outlast the longest job
+CELERY_BROKER_TRANSPORT_OPTIONS = {'visibility_timeout': 2 * 60 * 60}
+
+# Pub/sub for pushed video status; unset = in-process (only reaches same-process workers)
+EVENTS_REDIS_URL = os.environ.get('MANIFEST_EVENTS_REDIS_URL')
+
+# Status poll cache. Per-process memory by default; point it at Redis so the
+# worker's invalidations reach every API instance
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.environ.get('MANIFEST_CACHE_REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['MANIFEST_CACHE_REDIS_URL'],
+    }
+
 DEFAULT_FILE_STORAGE = 'storages.backends.gcs.GoogleCloudStorage'
 GS_BUCKET_NAME = 'manifest-me-videos-nick'
 GS_QUERYSTRING_AUTH = True
\ No newline at end of file
@@ -1,2 +1,12 @@
 #!/bin/sh
-celery -A core worker --loglevel=info
\ No newline at end of file
+# Templates are downloaded, probed and normalized before the first job arrives
+python manage.py prewarm_templates
+
+# Threads, not processes: most of a job is waiting on Vertex, and the job/CPU
+# slots and the operation tracker are shared per process.
+celery -A core worker --loglevel=info \
+    -Q video \
+    --pool threads \
+    --concurrency "${MANIFEST_MAX_CONCURRENT_JOBS:-24}" \
+    --prefetch-multiplier 1 \
+    -O fair